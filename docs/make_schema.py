@@ -5,14 +5,17 @@ import sadisplay
 
 from gdm_bg_readings_api.models import (
     amber_alert,
+    counts_alert_run,
     dose,
     hba1c_reading,
     hba1c_target,
+    outbox_message,
     patient,
     patient_alert,
     prandial_tag,
     reading,
     reading_banding,
+    reading_daily_rollup,
     reading_metadata,
     red_alert,
 )
@@ -20,14 +23,17 @@ from gdm_bg_readings_api.models import (
 desc = sadisplay.describe(
     [
         amber_alert.AmberAlert,
+        counts_alert_run.CountsAlertRun,
         dose.Dose,
         hba1c_reading.Hba1cReading,
         hba1c_target.Hba1cTarget,
+        outbox_message.OutboxMessage,
         patient.Patient,
         patient_alert.PatientAlert,
         prandial_tag.PrandialTag,
         reading.Reading,
         reading_banding.ReadingBanding,
+        reading_daily_rollup.ReadingDailyRollup,
         reading_metadata.ReadingMetadata,
         red_alert.RedAlert,
     ]
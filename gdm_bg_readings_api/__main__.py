@@ -3,6 +3,7 @@ import os
 
 from waitress import serve
 
+from . import outbox
 from .app import create_app
 
 logger = logging.getLogger(__name__)
@@ -12,4 +13,6 @@ SERVER_PORT = os.getenv("SERVER_PORT", 5000)
 
 if __name__ == "__main__":
     app = create_app()
+    if app.config["OUTBOX_RELAY_IN_PROCESS"]:
+        outbox.start_relay_thread(app)
     serve(app, host="0.0.0.0", port=SERVER_PORT)  # NOSONAR
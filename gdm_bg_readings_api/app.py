@@ -15,6 +15,7 @@ from gdm_bg_readings_api.blueprint_api.exceptions import (
 from gdm_bg_readings_api.blueprint_development import gdm_development
 from gdm_bg_readings_api.config import init_config
 from gdm_bg_readings_api.helpers.cli import add_cli_command
+from gdm_bg_readings_api.helpers.json_provider import init_json_provider
 from gdm_bg_readings_api.utils.unittest_mode import populate_unittest_data
 
 
@@ -38,6 +39,8 @@ def create_app(
 
     init_duplicate_reading_exception_handler(app)
 
+    init_json_provider(app)
+
     init_config(app)
 
     # Configure the SQL database
@@ -1,7 +1,7 @@
-from typing import Any, Dict, List
+from typing import Any, Callable, Dict, List, Optional
 
 import flask
-from flask import Blueprint, Response, jsonify, make_response
+from flask import Blueprint, Response, jsonify, make_response, stream_with_context
 from flask_batteries_included.helpers import schema
 from flask_batteries_included.helpers.routes import deprecated_route
 from flask_batteries_included.helpers.security import protected_route
@@ -15,6 +15,7 @@ from flask_batteries_included.helpers.security.endpoint_security import (
 from she_logging import logger
 
 from gdm_bg_readings_api.blueprint_api import controller
+from gdm_bg_readings_api.helpers.streaming import stream_json_object_of_lists
 from gdm_bg_readings_api.models.dose import Dose
 from gdm_bg_readings_api.models.reading import Reading
 
@@ -96,6 +97,63 @@ def post_reading(
     )
 
 
+@api_blueprint.route("/patient/<patient_id>/readings", methods=["POST"])
+@protected_route(
+    and_(
+        scopes_present(required_scopes="write:gdm_bg_reading"),
+        or_(match_keys(patient_id="patient_id"), key_present("system_id")),
+    )
+)
+def post_readings(patient_id: str, readings_data: List[Dict]) -> Response:
+    """
+    ---
+    post:
+      summary: Create new readings
+      description: >-
+        Create a batch of new readings for a given patient using the details provided in
+        the request body. The readings are stored in a single transaction. The response
+        contains a result for each reading in the request, in the same order, showing
+        whether the reading was created, was a duplicate of an existing reading or was
+        invalid.
+      tags: [reading]
+      parameters:
+        - name: patient_id
+          in: path
+          description: Patient UUID
+          required: true
+          schema:
+            type: string
+            example: cdda06c0-ccc4-4da0-b0b7-a8f1b20ede10
+      requestBody:
+        description: List of reading details
+        required: true
+        content:
+          application/json:
+            schema:
+              type: array
+              x-body-name: readings_data
+              items:
+                $ref: '#/components/schemas/ReadingRequest'
+      responses:
+        '200':
+          description: Result for each reading in the request
+          content:
+            application/json:
+              schema:
+                type: array
+                items: ReadingBulkResult
+        default:
+          description: >-
+              Error, e.g. 400 Bad Request, 503 Service Unavailable
+          content:
+            application/json:
+              schema: Error
+    """
+    return jsonify(
+        controller.create_readings(patient_id=patient_id, readings_data=readings_data)
+    )
+
+
 @deprecated_route(superseded_by="POST /gdm/v2/patient/<patient_id>/reading")
 @api_blueprint_v1.route("/patient/<patient_id>/reading", methods=["POST"])
 @protected_route(
@@ -185,12 +243,27 @@ def get_patient_by_uuid(patient_id: str) -> Response:
           schema:
             type: string
             example: 9eac08b3-e1ad-4f81-929d-ec1590c51181
+        - name: If-None-Match
+          in: header
+          required: false
+          description: >-
+              ETag of a previous response. If it is still current, 304 Not Modified is
+              returned without a body.
+          schema:
+            type: string
       responses:
         '200':
           description: Patient details
+          headers:
+            ETag:
+              description: Strong ETag of the response, to pass as `If-None-Match`
+              schema:
+                type: string
           content:
             application/json:
               schema: PatientResponse
+        '304':
+          description: Not modified since the response with the ETag in `If-None-Match`
         default:
           description: >-
               Error, e.g. 400 Bad Request, 503 Service Unavailable
@@ -198,7 +271,10 @@ def get_patient_by_uuid(patient_id: str) -> Response:
             application/json:
               schema: Error
     """
-    return jsonify(controller.get_patient(patient_id))
+    return _conditional_response(
+        etag=controller.get_patient_etag(patient_id),
+        render=lambda: controller.get_patient(patient_id),
+    )
 
 
 @api_blueprint_v1.route("/patient/<patient_id>/reading/<reading_id>", methods=["GET"])
@@ -233,12 +309,27 @@ def get_reading_by_uuid(patient_id: str, reading_id: str) -> Response:
           schema:
             type: string
             example: 5d8250bb-1d1d-4aa5-86ed-38a5af1015a4
+        - name: If-None-Match
+          in: header
+          required: false
+          description: >-
+              ETag of a previous response. If it is still current, 304 Not Modified is
+              returned without a body.
+          schema:
+            type: string
       responses:
         '200':
           description: Requested reading
+          headers:
+            ETag:
+              description: Strong ETag of the response, to pass as `If-None-Match`
+              schema:
+                type: string
           content:
             application/json:
               schema: ReadingResponse
+        '304':
+          description: Not modified since the response with the ETag in `If-None-Match`
         default:
           description: >-
               Error, e.g. 400 Bad Request, 503 Service Unavailable
@@ -246,8 +337,13 @@ def get_reading_by_uuid(patient_id: str, reading_id: str) -> Response:
             application/json:
               schema: Error
     """
-    return jsonify(
-        controller.get_reading_by_uuid(patient_uuid=patient_id, reading_uuid=reading_id)
+    return _conditional_response(
+        etag=controller.get_reading_etag(
+            patient_uuid=patient_id, reading_uuid=reading_id
+        ),
+        render=lambda: controller.get_reading_by_uuid(
+            patient_uuid=patient_id, reading_uuid=reading_id
+        ),
     )
 
 
@@ -261,7 +357,12 @@ def get_reading_by_uuid(patient_id: str, reading_id: str) -> Response:
         ),
     )
 )
-def get_readings(patient_id: str) -> Response:
+def get_readings(
+    patient_id: str,
+    limit: Optional[int] = None,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+) -> Response:
     """
     ---
     get:
@@ -276,14 +377,66 @@ def get_readings(patient_id: str) -> Response:
           schema:
             type: string
             example: 3c0cb994-f5f6-4910-b654-0d23f4b5e6c8
+        - name: limit
+          in: query
+          required: false
+          description: >-
+              Maximum number of readings to return. If this, `before` or `after` is
+              supplied, readings are returned a page at a time, most recent first.
+          schema:
+            type: integer
+            minimum: 1
+            maximum: 1000
+            example: 100
+        - name: before
+          in: query
+          required: false
+          description: Return the page of readings before this cursor (see X-Next-Cursor)
+          schema:
+            type: string
+        - name: after
+          in: query
+          required: false
+          description: Return the page of readings after this cursor (see X-Previous-Cursor)
+          schema:
+            type: string
+        - name: If-None-Match
+          in: header
+          required: false
+          description: >-
+              ETag of a previous response. If it is still current, 304 Not Modified is
+              returned without a body. Only used when not paginating.
+          schema:
+            type: string
       responses:
         '200':
           description: List of readings
+          headers:
+            X-Next-Cursor:
+              description: >-
+                  When paginating, the cursor for the next (older) page, if any. Pass it
+                  as `before`.
+              schema:
+                type: string
+            X-Previous-Cursor:
+              description: >-
+                  When paginating, the cursor for the previous (newer) page, if any. Pass
+                  it as `after`.
+              schema:
+                type: string
+            ETag:
+              description: >-
+                  When not paginating, strong ETag of the response, to pass as
+                  `If-None-Match`
+              schema:
+                type: string
           content:
             application/json:
               schema:
                 type: array
                 items: ReadingResponse
+        '304':
+          description: Not modified since the response with the ETag in `If-None-Match`
         default:
           description: >-
               Error, e.g. 400 Bad Request, 503 Service Unavailable
@@ -291,10 +444,12 @@ def get_readings(patient_id: str) -> Response:
             application/json:
               schema: Error
     """
-    return jsonify(
-        controller.retrieve_readings_for_patient_with_tag(
-            patient_id=patient_id, prandial_tag_value=None
-        )
+    return _get_readings_response(
+        patient_id=patient_id,
+        prandial_tag_value=None,
+        limit=limit,
+        before=before,
+        after=after,
     )
 
 
@@ -310,7 +465,13 @@ def get_readings(patient_id: str) -> Response:
         ),
     )
 )
-def get_readings_with_filter(patient_id: str, prandial_tag: str = None) -> Response:
+def get_readings_with_filter(
+    patient_id: str,
+    prandial_tag: str = None,
+    limit: Optional[int] = None,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+) -> Response:
     """
     ---
     get:
@@ -333,14 +494,66 @@ def get_readings_with_filter(patient_id: str, prandial_tag: str = None) -> Respo
             type: integer
             enum: [0, 1, 2, 3, 4, 5, 6, 7]
             example: 2
+        - name: limit
+          in: query
+          required: false
+          description: >-
+              Maximum number of readings to return. If this, `before` or `after` is
+              supplied, readings are returned a page at a time, most recent first.
+          schema:
+            type: integer
+            minimum: 1
+            maximum: 1000
+            example: 100
+        - name: before
+          in: query
+          required: false
+          description: Return the page of readings before this cursor (see X-Next-Cursor)
+          schema:
+            type: string
+        - name: after
+          in: query
+          required: false
+          description: Return the page of readings after this cursor (see X-Previous-Cursor)
+          schema:
+            type: string
+        - name: If-None-Match
+          in: header
+          required: false
+          description: >-
+              ETag of a previous response. If it is still current, 304 Not Modified is
+              returned without a body. Only used when not paginating.
+          schema:
+            type: string
       responses:
         '200':
           description: List of readings
+          headers:
+            X-Next-Cursor:
+              description: >-
+                  When paginating, the cursor for the next (older) page, if any. Pass it
+                  as `before`.
+              schema:
+                type: string
+            X-Previous-Cursor:
+              description: >-
+                  When paginating, the cursor for the previous (newer) page, if any. Pass
+                  it as `after`.
+              schema:
+                type: string
+            ETag:
+              description: >-
+                  When not paginating, strong ETag of the response, to pass as
+                  `If-None-Match`
+              schema:
+                type: string
           content:
             application/json:
               schema:
                 type: array
                 items: ReadingResponse
+        '304':
+          description: Not modified since the response with the ETag in `If-None-Match`
         default:
           description: >-
               Error, e.g. 400 Bad Request, 503 Service Unavailable
@@ -348,16 +561,66 @@ def get_readings_with_filter(patient_id: str, prandial_tag: str = None) -> Respo
             application/json:
               schema: Error
     """
-    return jsonify(
-        controller.retrieve_readings_for_patient_with_tag(
-            patient_id=patient_id, prandial_tag_value=prandial_tag
+    return _get_readings_response(
+        patient_id=patient_id,
+        prandial_tag_value=prandial_tag,
+        limit=limit,
+        before=before,
+        after=after,
+    )
+
+
+def _get_readings_response(
+    patient_id: str,
+    prandial_tag_value: Optional[str],
+    limit: Optional[int],
+    before: Optional[str],
+    after: Optional[str],
+) -> Response:
+    # Without any pagination parameters, return every reading as before.
+    if limit is None and before is None and after is None:
+        return _conditional_response(
+            etag=controller.get_readings_etag(
+                patient_id=patient_id, prandial_tag_value=prandial_tag_value
+            ),
+            render=lambda: controller.retrieve_readings_for_patient_with_tag(
+                patient_id=patient_id, prandial_tag_value=prandial_tag_value
+            ),
         )
+
+    page: controller.ReadingPage = controller.retrieve_reading_page_for_patient(
+        patient_id=patient_id,
+        prandial_tag_value=prandial_tag_value,
+        limit=limit or controller.DEFAULT_READING_PAGE_SIZE,
+        before=before,
+        after=after,
     )
+    response: Response = jsonify(page.readings)
+    if page.next_cursor is not None:
+        response.headers["X-Next-Cursor"] = page.next_cursor
+    if page.previous_cursor is not None:
+        response.headers["X-Previous-Cursor"] = page.previous_cursor
+    return response
+
+
+def _conditional_response(etag: Optional[str], render: Callable[[], Any]) -> Response:
+    # If the client already has the current version of the response, as identified by
+    # its ETag, says so without rendering it. The ETag is worked out first, so a change
+    # made while rendering gives a newer response under an older ETag, not vice versa.
+    if etag is not None and flask.request.if_none_match.contains_weak(etag):
+        response: Response = flask.Response(status=304)
+    else:
+        response = jsonify(render())
+    if etag is not None:
+        response.set_etag(etag)
+    return response
 
 
 @api_blueprint_v1.route("/reading/recent", methods=["GET"])
 @protected_route(scopes_present("read:gdm_bg_reading_all"))
-def retrieve_readings_for_period(days: int = 7, compact: bool = True) -> Response:
+def retrieve_readings_for_period(
+    days: int = 7, compact: bool = True, stream: bool = False
+) -> Response:
     """
     ---
     get:
@@ -379,6 +642,15 @@ def retrieve_readings_for_period(days: int = 7, compact: bool = True) -> Respons
           schema:
             type: boolean
             default: true
+        - name: stream
+          in: query
+          required: false
+          description: >-
+              Whether to stream the response. Readings are then read from the database
+              and sent in batches rather than all at once, and are grouped by patient.
+          schema:
+            type: boolean
+            default: false
       responses:
         '200':
           description: Map of patient UUID to recent readings
@@ -395,12 +667,23 @@ def retrieve_readings_for_period(days: int = 7, compact: bool = True) -> Respons
             application/json:
               schema: Error
     """
+    if stream:
+        return Response(
+            stream_with_context(
+                stream_json_object_of_lists(
+                    controller.iter_readings_for_period(days=days, compact=compact)
+                )
+            ),
+            mimetype="application/json",
+        )
     return jsonify(controller.retrieve_readings_for_period(days=days, compact=compact))
 
 
 @api_blueprint_v1.route("/reading/statistics", methods=["GET"])
 @protected_route(scopes_present("read:gdm_bg_reading_all"))
-def retrieve_statistics_for_period(days: int = 7, compact: bool = True) -> Response:
+def retrieve_statistics_for_period(
+    days: int = 7, compact: bool = True, by_prandial_tag: bool = False
+) -> Response:
     """
     ---
     get:
@@ -408,7 +691,7 @@ def retrieve_statistics_for_period(days: int = 7, compact: bool = True) -> Respo
       description: >-
         Get per-patient reading statistics for the specified number of days. This includes minimum
         and maximum reading values, the total number of readings, and the number of readings banded
-        as normal.
+        as normal. Optionally, the same statistics are also broken down by prandial tag.
       tags: [reading]
       parameters:
         - name: days
@@ -425,6 +708,13 @@ def retrieve_statistics_for_period(days: int = 7, compact: bool = True) -> Respo
           schema:
             type: boolean
             default: true
+        - name: by_prandial_tag
+          in: query
+          required: false
+          description: Whether to include statistics per prandial tag
+          schema:
+            type: boolean
+            default: false
       responses:
         '200':
           description: Map of patient UUID to reading statistics
@@ -442,7 +732,9 @@ def retrieve_statistics_for_period(days: int = 7, compact: bool = True) -> Respo
               schema: Error
     """
     return jsonify(
-        controller.retrieve_statistics_for_period(days=days, compact=compact)
+        controller.retrieve_statistics_for_period(
+            days=days, compact=compact, by_prandial_tag=by_prandial_tag
+        )
     )
 
 
@@ -489,6 +781,65 @@ def get_latest_reading(patient_id: str) -> Response:
     )
 
 
+@api_blueprint_v1.route("/patient/<patient_id>/reading/daily", methods=["GET"])
+@protected_route(
+    or_(
+        scopes_present(required_scopes="read:gdm_bg_reading_all"),
+        and_(
+            scopes_present(required_scopes="read:gdm_bg_reading"),
+            or_(match_keys(patient_id="patient_id"), key_present("system_id")),
+        ),
+    )
+)
+def get_daily_reading_summaries(patient_id: str, days: int = 7) -> Response:
+    """
+    ---
+    get:
+      summary: Get daily reading statistics for patient
+      description: >-
+        Get reading statistics for each day on which the patient with the provided UUID took
+        readings, over the specified number of days up to and including today. Days are local to
+        where the readings were taken. Statistics are given for the whole day and per prandial tag.
+      tags: [reading]
+      parameters:
+        - name: patient_id
+          in: path
+          required: true
+          description: Patient UUID
+          schema:
+            type: string
+            example: 3c0cb994-f5f6-4910-b654-0d23f4b5e6c8
+        - name: days
+          in: query
+          required: false
+          description: Number of days for which to retrieve statistics
+          schema:
+            type: integer
+            default: 7
+            minimum: 1
+            maximum: 366
+      responses:
+        '200':
+          description: Reading statistics per day, in date order
+          content:
+            application/json:
+              schema:
+                type: array
+                items: DailyReadingSummary
+        default:
+          description: >-
+              Error, e.g. 400 Bad Request, 503 Service Unavailable
+          content:
+            application/json:
+              schema: Error
+    """
+    return jsonify(
+        controller.retrieve_daily_summaries_for_patient(
+            patient_id=patient_id, days=days
+        )
+    )
+
+
 @api_blueprint_v1.route("/patient/<patient_id>/reading/earliest", methods=["GET"])
 @protected_route(
     or_(
@@ -806,6 +1157,63 @@ def clear_alerts_for_patient(patient_id: str) -> Response:
     return jsonify(controller.clear_alerts_for_patient(patient_id=patient_id))
 
 
+@api_blueprint_v1.route("/clear_alerts/patients", methods=["POST"])
+@protected_route(scopes_present(required_scopes="write:gdm_alert"))
+def clear_alerts_for_patients(patient_ids: List[str]) -> Response:
+    """
+    ---
+    post:
+      summary: Clear alerts for multiple patients
+      description: >-
+        Clear alerts (both "counts" and "percentages" alerts) for each of the patients with
+        the UUIDs provided in the request body, as per the single patient endpoint. The
+        response contains the result for each patient, keyed by patient UUID.
+      tags: [alert]
+      requestBody:
+        description: List of patient UUIDs
+        required: true
+        content:
+          application/json:
+            schema:
+              type: array
+              x-body-name: patient_ids
+              minItems: 1
+              items:
+                type: string
+                example: 3c0cb994-f5f6-4910-b654-0d23f4b5e6c8
+      responses:
+        '200':
+          description: Alerts cleared
+          content:
+            application/json:
+              schema:
+                type: object
+                additionalProperties:
+                  type: object
+                  properties:
+                    completed:
+                      type: boolean
+                      description: Whether the alerts were cleared successfully
+                      example: true
+                    suppress_reading_alerts_from:
+                      type: string
+                      description: ISO8601 timestamp from when alerts were suppressed
+                      example: 2020-01-01T00:00:00.000Z
+                    suppress_reading_alerts_until:
+                      type: string
+                      description: ISO8601 timestamp until when alerts were suppressed
+                      example: 2020-01-08T00:00:00.000Z
+        default:
+          description: >-
+              Error, e.g. 400 Bad Request, 503 Service Unavailable
+          content:
+            application/json:
+              schema: Error
+    """
+    logger.debug("Clearing alerts for %d patients", len(patient_ids))
+    return jsonify(controller.clear_alerts_for_patients(patient_ids=patient_ids))
+
+
 @api_blueprint_v1.route("/process_alerts/reading/<reading_id>", methods=["POST"])
 @protected_route(scopes_present(required_scopes="write:gdm_alert"))
 def add_counts_alerts_to_reading(reading_id: str) -> Response:
@@ -840,6 +1248,52 @@ def add_counts_alerts_to_reading(reading_id: str) -> Response:
     return jsonify(controller.process_counts_alerts_for_reading(reading_id=reading_id))
 
 
+@api_blueprint_v1.route("/process_alerts/readings", methods=["POST"])
+@protected_route(scopes_present(required_scopes="write:gdm_alert"))
+def add_counts_alerts_to_readings(reading_ids: List[str]) -> Response:
+    """
+    ---
+    post:
+      summary: Process counts alerts for multiple readings
+      description: >-
+        Process the "counts" alerts for each of the readings with the UUIDs provided in
+        the request body, as per the single reading endpoint. The readings may belong to
+        different patients; each patient is sent at most one alert message of each type.
+        The response contains each reading in the request, in the same order.
+      tags: [alert]
+      requestBody:
+        description: List of reading UUIDs
+        required: true
+        content:
+          application/json:
+            schema:
+              type: array
+              x-body-name: reading_ids
+              minItems: 1
+              items:
+                type: string
+                example: 5d8250bb-1d1d-4aa5-86ed-38a5af1015a4
+      responses:
+        '200':
+          description: Alerts processed
+          content:
+            application/json:
+              schema:
+                type: array
+                items: ReadingResponse
+        default:
+          description: >-
+              Error, e.g. 400 Bad Request, 503 Service Unavailable
+          content:
+            application/json:
+              schema: Error
+    """
+    logger.debug("Checking 'counts' alerts for %d readings", len(reading_ids))
+    return jsonify(
+        controller.process_counts_alerts_for_readings(reading_ids=reading_ids)
+    )
+
+
 @api_blueprint_v1.route(
     "/process_activity_alerts/patient/<patient_id>", methods=["POST"]
 )
@@ -903,6 +1357,61 @@ def process_activity_alert_for_patient(
     )
 
 
+@api_blueprint_v1.route("/process_activity_alerts", methods=["POST"])
+@protected_route(scopes_present(required_scopes="write:gdm_alert"))
+def process_activity_alerts_for_patients(
+    readings_plans_by_patient: Dict[str, List]
+) -> Response:
+    """
+    ---
+    post:
+      summary: Process activity alerts for multiple patients
+      description: >-
+        Process the "activity" alerts for each of the patients in the request body, as per
+        the single patient endpoint, using each patient's readings plans to determine
+        their expected number of readings. The response contains the result for each
+        patient, keyed by patient UUID.
+      tags: [alert]
+      requestBody:
+        description: Map of patient UUID to list of readings plans
+        required: true
+        content:
+          application/json:
+            schema:
+              type: object
+              x-body-name: readings_plans_by_patient
+              minProperties: 1
+              additionalProperties:
+                type: array
+                minItems: 1
+                items:
+                  $ref: '#/components/schemas/ReadingsPlan'
+      responses:
+        '200':
+          description: Alerts processed
+          content:
+            application/json:
+              schema:
+                type: object
+                additionalProperties:
+                  $ref: '#/components/schemas/PatientResponse'
+        default:
+          description: >-
+              Error, e.g. 400 Bad Request, 503 Service Unavailable
+          content:
+            application/json:
+              schema: Error
+    """
+    logger.debug(
+        "Processing activity alerts for %d patients", len(readings_plans_by_patient)
+    )
+    return jsonify(
+        controller.process_activity_alerts_for_patients(
+            readings_plans_by_patient=readings_plans_by_patient
+        )
+    )
+
+
 @api_blueprint_v1.route("/process_alerts", methods=["POST"])
 @protected_route(scopes_present(required_scopes="write:gdm_alert"))
 def process_percentages_alerts(alerts_map: Dict) -> Response:
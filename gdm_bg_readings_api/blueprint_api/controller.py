@@ -1,12 +1,27 @@
+import base64
+import binascii
 from collections import defaultdict
-from datetime import datetime, timedelta, timezone
-from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from datetime import date, datetime, timedelta, timezone
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+)
 
+from flask import current_app
 from flask_batteries_included.config import is_production_environment
 from flask_batteries_included.helpers import schema
 from flask_batteries_included.helpers.error_handler import EntityNotFoundException
 from flask_batteries_included.helpers.timestamp import (
     parse_datetime_to_iso8601,
+    parse_datetime_to_iso8601_typesafe,
     parse_iso8601_to_datetime,
     parse_iso8601_to_datetime_typesafe,
     split_timestamp,
@@ -18,28 +33,37 @@ from flask_batteries_included.sqldb import (
     validate_models,
 )
 from she_logging import logger
-from sqlalchemy.engine import Result, Row
-from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import joinedload
-from sqlalchemy.sql import text
+from sqlalchemy import func, tuple_
+from sqlalchemy.orm import Query, joinedload, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
 
-from gdm_bg_readings_api import trustomer
+from gdm_bg_readings_api import cache, dimensions, trustomer
 from gdm_bg_readings_api.blueprint_api import counts_alerting, percentages_alerting
 from gdm_bg_readings_api.blueprint_api.exceptions import DuplicateReadingException
 from gdm_bg_readings_api.blueprint_api.publish import (
     publish_abnormal_reading,
+    publish_abnormal_readings,
     publish_audit_message,
     publish_patient_alert,
 )
+from gdm_bg_readings_api.models.amber_alert import AmberAlert
 from gdm_bg_readings_api.models.dose import Dose
 from gdm_bg_readings_api.models.hba1c_reading import Hba1cReading
 from gdm_bg_readings_api.models.hba1c_target import Hba1cTarget
 from gdm_bg_readings_api.models.patient import Patient
 from gdm_bg_readings_api.models.patient_alert import PatientAlert
-from gdm_bg_readings_api.models.prandial_tag import PrandialTag
 from gdm_bg_readings_api.models.reading import Reading
 from gdm_bg_readings_api.models.reading_banding import ReadingBanding  # noqa
 from gdm_bg_readings_api.models.reading_metadata import ReadingMetadata
+from gdm_bg_readings_api.models.red_alert import RedAlert
+from gdm_bg_readings_api.query import (
+    counts_alert_run,
+    daily_rollup,
+    etag,
+    percentages,
+    statistics,
+    upsert,
+)
 from gdm_bg_readings_api.trustomer import AlertsSystem
 from gdm_bg_readings_api.utils.datetime_utils import (
     calculate_last_midnight,
@@ -47,6 +71,28 @@ from gdm_bg_readings_api.utils.datetime_utils import (
 )
 
 UPDATING_READING_WITH_UUID_MESSAGE = "Updating reading with UUID %s"
+DEFAULT_READING_PAGE_SIZE = 100
+STREAM_READINGS_BATCH_SIZE = 500
+
+# Responses for a patient are cached in the patient's own scope, which each write path
+# that touches the patient invalidates, as per _invalidate_patient_cache.
+PATIENT_CACHE_NAMESPACE = "patient"
+PATIENT_SUMMARY_CACHE_NAMESPACE = "patient_summary"
+STATISTICS_CACHE_NAMESPACE = "statistics"
+cache.invalidate_on_write(
+    PATIENT_SUMMARY_CACHE_NAMESPACE,
+    [Patient.__table__.name, Reading.__table__.name, ReadingMetadata.__table__.name],
+)
+cache.invalidate_on_write(
+    STATISTICS_CACHE_NAMESPACE,
+    [
+        Reading.__table__.name,
+        ReadingMetadata.__table__.name,
+        Dose.__table__.name,
+        RedAlert.__table__.name,
+        AmberAlert.__table__.name,
+    ],
+)
 
 
 def create_reading(
@@ -58,70 +104,41 @@ def create_reading(
         reading_data=reading_data
     )
 
-    prandial_tag = _prandial_tag_or_default(reading_data.pop("prandial_tag"))
-    measured_timestamp, measured_timezone = split_timestamp(
-        reading_data.pop("measured_timestamp")
-    )
-    blood_glucose_value = reading_data.pop("blood_glucose_value")
-    units = reading_data.pop("units")
-
-    patient = Patient.query.get(patient_id)
-    if not patient:
-        logger.debug("Creating a new patient with UUID %s", patient_id)
-        patient = Patient(uuid=patient_id)
-        db.session.add(patient)
-        db.session.flush()
-
-    reading = Reading(
-        uuid=generate_uuid(),
+    reading_uuid, created = _insert_reading(
         patient_id=patient_id,
         doses=doses,
         comment=comment,
-        prandial_tag=prandial_tag,
         reading_metadata=reading_metadata,
-        measured_timestamp=measured_timestamp,
-        measured_timezone=measured_timezone,
-        blood_glucose_value=blood_glucose_value,
-        units=units,
-        reading_banding_id=banding_id,
+        reading_data=reading,
+        banding_id=banding_id,
     )
-    db.session.add(reading)
-
-    if counts_alerting.is_reading_in_snooze_period(reading, patient):
-        reading.snoozed = True
-
-    try:
-        db.session.commit()
-    except IntegrityError:
-        db.session.rollback()
-        reading = Reading.query.filter_by(
-            blood_glucose_value=blood_glucose_value,
-            units=units,
-            measured_timestamp=measured_timestamp,
-            measured_timezone=measured_timezone,
-            patient_id=patient_id,
-        ).first()
-
+    if not created:
         publish_audit_message(
             event_type="duplicate_reading",
             event_data={
                 "patient_id": patient_id,
-                "duplicate_reading_id": reading.uuid,
+                "duplicate_reading_id": reading_uuid,
             },
         )
+        db.session.commit()
 
-        headers = {"Location": f"/gdm/v1/patient/{patient_id}/reading/{reading.uuid}"}
+        headers = {"Location": f"/gdm/v1/patient/{patient_id}/reading/{reading_uuid}"}
         raise DuplicateReadingException(
             message="Duplicate reading found",
-            extra={"reading_id": reading.uuid},
+            extra={"reading_id": reading_uuid},
             headers=headers,
         )
 
-    if counts_alerting.reading_could_trigger_alert(reading):
-        publish_abnormal_reading(reading=reading)
+    new_reading: Reading = _reading_query().filter_by(uuid=reading_uuid).one()
+    if counts_alerting.reading_could_trigger_alert(new_reading):
+        publish_abnormal_reading(reading=new_reading)
+
+    # Render the reading before committing, as the commit expires every object.
+    new_reading_data: Dict = new_reading.to_dict(compact=compact)
+    db.session.commit()
 
-    logger.debug("Reading created with UUID %s", reading.uuid)
-    return reading.to_dict(compact=compact)
+    logger.debug("Reading created with UUID %s", reading_uuid)
+    return new_reading_data
 
 
 def create_reading_v1(
@@ -145,17 +162,187 @@ def create_reading_v1(
     )
 
 
+class _BatchReading(NamedTuple):
+    # A valid reading from a batch, as per _validate_reading.
+    unique_key: Tuple
+    doses: List[Dose]
+    comment: Optional[str]
+    reading_metadata: Optional[ReadingMetadata]
+    prandial_tag_id: str
+    banding_id: str
+
+
+def create_readings(patient_id: str, readings_data: List[Dict]) -> List[Dict]:
+    """
+    Creates a batch of readings for a patient in a single transaction. Returns one result
+    per supplied reading, in the same order, with a status of "created", "duplicate" (with
+    the UUID of the existing reading) or "invalid" (with the reason).
+    """
+    logger.debug(
+        "Creating %d readings for patient with UUID %s",
+        len(readings_data),
+        patient_id,
+    )
+    if not readings_data:
+        return []
+
+    results: List[Dict] = []
+    valid_readings: Dict[int, _BatchReading] = {}
+    for index, reading_data in enumerate(readings_data):
+        try:
+            doses, comment, reading_metadata, reading, banding_id = _validate_reading(
+                reading_data=reading_data
+            )
+            prandial_tag_id = _prandial_tag_id_or_default(reading.pop("prandial_tag"))
+            measured_timestamp, measured_timezone = split_timestamp(
+                reading.pop("measured_timestamp")
+            )
+        except (KeyError, TypeError, ValueError) as e:
+            logger.debug("Reading %d in batch is invalid: %s", index, e)
+            results.append({"status": "invalid", "message": str(e)})
+            continue
+        unique_key: Tuple = (
+            reading.pop("blood_glucose_value"),
+            reading.pop("units"),
+            measured_timestamp,
+            measured_timezone,
+        )
+        valid_readings[index] = _BatchReading(
+            unique_key=unique_key,
+            doses=doses,
+            comment=comment,
+            reading_metadata=reading_metadata,
+            prandial_tag_id=prandial_tag_id,
+            banding_id=banding_id,
+        )
+        results.append({"status": "created"})
+
+    snooze_period = upsert.ensure_patient(patient_id)
+
+    # Readings that repeat an earlier one in the batch are left to that one.
+    batch_reading_ids: Dict[Tuple, str] = {}
+    batch_duplicates: Dict[int, Tuple] = {}
+    new_readings: Dict[int, Reading] = {}
+    for index, parts in valid_readings.items():
+        if parts.unique_key in batch_reading_ids:
+            batch_duplicates[index] = parts.unique_key
+            continue
+
+        # Generate primary keys up front so that the inserts can be batched.
+        for dose in parts.doses:
+            dose.uuid = generate_uuid()
+        if parts.reading_metadata is not None:
+            parts.reading_metadata.uuid = generate_uuid()
+
+        # The reading rows are inserted by upsert.insert_readings rather than the ORM,
+        # so relationships are set by ID and the readings are never added to the session.
+        (
+            blood_glucose_value,
+            units,
+            measured_timestamp,
+            measured_timezone,
+        ) = parts.unique_key
+        new_reading = Reading(
+            uuid=generate_uuid(),
+            patient_id=patient_id,
+            comment=parts.comment,
+            prandial_tag_id=parts.prandial_tag_id,
+            reading_metadata_id=(
+                parts.reading_metadata.uuid if parts.reading_metadata else None
+            ),
+            measured_timestamp=measured_timestamp,
+            measured_timezone=measured_timezone,
+            blood_glucose_value=blood_glucose_value,
+            units=units,
+            reading_banding_id=parts.banding_id,
+        )
+        new_reading.snoozed = counts_alerting.is_reading_in_snooze_period(
+            new_reading, snooze_period
+        )
+        new_readings[index] = new_reading
+        batch_reading_ids[parts.unique_key] = new_reading.uuid
+
+    # With primary keys set, each table's rows are inserted with one statement. The
+    # metadata must be stored before the readings, so any stored for duplicates of
+    # already stored readings is deleted again afterwards.
+    db.session.add_all(
+        valid_readings[index].reading_metadata
+        for index in new_readings
+        if valid_readings[index].reading_metadata is not None
+    )
+    db.session.flush()
+    stored_reading_ids: Dict[str, str] = upsert.insert_readings(
+        list(new_readings.values())
+    )
+
+    created_readings: List[Reading] = []
+    duplicate_reading_ids: List[str] = []
+    for index, new_reading in new_readings.items():
+        parts = valid_readings[index]
+        reading_id: str = stored_reading_ids[new_reading.uuid]
+        batch_reading_ids[parts.unique_key] = reading_id
+        if reading_id != new_reading.uuid:
+            results[index] = {"status": "duplicate", "reading_id": reading_id}
+            duplicate_reading_ids.append(reading_id)
+            if parts.reading_metadata is not None:
+                db.session.delete(parts.reading_metadata)
+            continue
+        results[index]["reading_id"] = reading_id
+        created_readings.append(new_reading)
+        for dose in parts.doses:
+            dose.reading_id = reading_id
+        db.session.add_all(parts.doses)
+        # Set without cascading, so that the reading is rendered with its doses and
+        # metadata but isn't added to the session along with them.
+        set_committed_value(new_reading, "doses", parts.doses)
+        set_committed_value(new_reading, "reading_metadata", parts.reading_metadata)
+    for index, unique_key in batch_duplicates.items():
+        results[index] = {
+            "status": "duplicate",
+            "reading_id": batch_reading_ids[unique_key],
+        }
+        duplicate_reading_ids.append(batch_reading_ids[unique_key])
+    db.session.flush()
+
+    for reading_id in duplicate_reading_ids:
+        publish_audit_message(
+            event_type="duplicate_reading",
+            event_data={"patient_id": patient_id, "duplicate_reading_id": reading_id},
+        )
+    if created_readings:
+        latest_reading: Reading = max(
+            created_readings, key=lambda r: (r.measured_timestamp, r.uuid)
+        )
+        upsert.advance_latest_reading(
+            patient_id=patient_id,
+            reading_uuid=latest_reading.uuid,
+            measured_timestamp=latest_reading.measured_timestamp,
+        )
+        _invalidate_patient_cache([patient_id])
+    daily_rollup.add_readings(created_readings)
+    counts_alert_run.add_readings(created_readings)
+
+    # Render abnormal readings before committing, as the commit expires every object.
+    abnormal_readings_data: List[Dict] = [
+        r.to_dict()
+        for r in created_readings
+        if counts_alerting.reading_could_trigger_alert(r)
+    ]
+    publish_abnormal_readings(readings_data=abnormal_readings_data)
+    db.session.commit()
+
+    logger.debug(
+        "Created %d readings for patient with UUID %s",
+        len(created_readings),
+        patient_id,
+    )
+    return results
+
+
 def get_reading_by_uuid(patient_uuid: str, reading_uuid: str) -> Dict:
     logger.debug("Getting reading by UUID %s", reading_uuid)
     reading: Reading = (
-        Reading.query.options(
-            joinedload(Reading.prandial_tag),
-            joinedload(Reading.doses),
-            joinedload(Reading.reading_metadata),
-            joinedload(Reading.reading_banding),
-            joinedload(Reading.amber_alert),
-            joinedload(Reading.red_alert),
-        )
+        _reading_query()
         .filter_by(patient_id=patient_uuid, uuid=reading_uuid)
         .first_or_404()
     )
@@ -169,43 +356,158 @@ def retrieve_readings_for_patient_with_tag(
 ) -> Iterable[Dict]:
     logger.debug("Retrieving readings for patient with UUID %s", patient_id)
 
-    q = Reading.query.options(
-        joinedload(Reading.prandial_tag),
-        joinedload(Reading.doses),
-        joinedload(Reading.reading_metadata),
-        joinedload(Reading.reading_banding),
-        joinedload(Reading.amber_alert),
-        joinedload(Reading.red_alert),
+    if lazy:
+        return (
+            reading.to_dict()
+            for reading in _retrieve_readings_for_patient_with_tag(
+                patient_id, prandial_tag_value
+            )
+        )
+    return _get_or_compute_for_patient(
+        patient_id=patient_id,
+        key=f"readings:{prandial_tag_value}",
+        compute=lambda: [
+            reading.to_dict()
+            for reading in _retrieve_readings_for_patient_with_tag(
+                patient_id, prandial_tag_value
+            )
+        ],
     )
 
-    if prandial_tag_value is None:
-        readings = (
-            q.filter_by(patient_id=patient_id)
-            .order_by(Reading.measured_timestamp.desc())
-            .all()
-        )
-    else:
-        # int() will throw a ValueError (HTTP 400) if the prandial tag isn't an int.
-        prandial_tag_int: int = int(prandial_tag_value)
-        prandial_tag = PrandialTag.query.filter_by(value=prandial_tag_int).first()
 
-        if prandial_tag is None:
-            raise EntityNotFoundException("Invalid prandial tag value supplied")
-        else:
-            readings = (
-                q.filter_by(patient_id=patient_id, prandial_tag_id=prandial_tag.uuid)
-                .order_by(Reading.measured_timestamp.desc())
-                .all()
-            )
+def _retrieve_readings_for_patient_with_tag(
+    patient_id: str, prandial_tag_value: Optional[str]
+) -> List[Reading]:
+    readings: List[Reading] = (
+        _patient_readings_query(patient_id, prandial_tag_value)
+        .order_by(Reading.measured_timestamp.desc())
+        .all()
+    )
 
     logger.debug(
         "Found %d readings for patient with UUID %s", len(readings), patient_id
     )
+    return readings
 
-    if lazy:
-        return (reading.to_dict() for reading in readings)
+
+class ReadingPage(NamedTuple):
+    readings: List[Dict]
+    # Pass as `before` to get the next (older) page, or `after` to get the previous
+    # (newer) page. None if there is no such page.
+    next_cursor: Optional[str]
+    previous_cursor: Optional[str]
+
+
+def retrieve_reading_page_for_patient(
+    patient_id: str,
+    prandial_tag_value: Optional[str] = None,
+    limit: int = DEFAULT_READING_PAGE_SIZE,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+) -> ReadingPage:
+    """
+    Retrieves a page of a patient's readings, most recent first. Pages are found by
+    keyset on (measured_timestamp, uuid), so the cost of a page depends on its size
+    rather than on how many readings the patient has.
+    """
+    logger.debug("Retrieving page of readings for patient with UUID %s", patient_id)
+    if before is not None and after is not None:
+        raise ValueError("Only one of 'before' and 'after' may be supplied")
+    if limit < 1:
+        raise ValueError("Limit must be a positive integer")
+
+    keyset = tuple_(Reading.measured_timestamp, Reading.uuid)
+    q = _patient_readings_query(patient_id, prandial_tag_value)
+    if after is None:
+        if before is not None:
+            q = q.filter(keyset < _decode_reading_cursor(before))
+        q = q.order_by(Reading.measured_timestamp.desc(), Reading.uuid.desc())
     else:
-        return [reading.to_dict() for reading in readings]
+        # Walk forwards from the cursor, then put the page back in descending order.
+        q = q.filter(keyset > _decode_reading_cursor(after)).order_by(
+            Reading.measured_timestamp.asc(), Reading.uuid.asc()
+        )
+
+    # Fetch one extra reading to find out whether there is another page.
+    readings: List[Reading] = q.limit(limit + 1).all()
+    has_more = len(readings) > limit
+    readings = readings[:limit]
+    if after is None:
+        has_older, has_newer = has_more, before is not None
+    else:
+        readings.reverse()
+        has_older, has_newer = True, has_more
+
+    return ReadingPage(
+        readings=[reading.to_dict() for reading in readings],
+        next_cursor=(
+            _encode_reading_cursor(readings[-1]) if readings and has_older else None
+        ),
+        previous_cursor=(
+            _encode_reading_cursor(readings[0]) if readings and has_newer else None
+        ),
+    )
+
+
+def _patient_readings_query(
+    patient_id: str, prandial_tag_value: Optional[str] = None
+) -> Query:
+    return _reading_query().filter(
+        *_patient_readings_criteria(patient_id, prandial_tag_value)
+    )
+
+
+def _patient_readings_criteria(
+    patient_id: str, prandial_tag_value: Optional[str] = None
+) -> List[Any]:
+    criteria: List[Any] = [Reading.patient_id == patient_id]
+    if prandial_tag_value is None:
+        return criteria
+
+    # int() will throw a ValueError (HTTP 400) if the prandial tag isn't an int.
+    prandial_tag_int: int = int(prandial_tag_value)
+    prandial_tag_id = dimensions.find_prandial_tag_uuid(prandial_tag_int)
+
+    if prandial_tag_id is None:
+        raise EntityNotFoundException("Invalid prandial tag value supplied")
+    return [*criteria, Reading.prandial_tag_id == prandial_tag_id]
+
+
+def get_readings_etag(
+    patient_id: str, prandial_tag_value: Optional[str] = None
+) -> Optional[str]:
+    """
+    Returns the ETag of the patient's readings (with the given prandial tag, if any), or
+    None if there are none. See etag.readings_etag.
+    """
+    return etag.readings_etag(
+        *_patient_readings_criteria(patient_id, prandial_tag_value)
+    )
+
+
+def get_reading_etag(patient_uuid: str, reading_uuid: str) -> Optional[str]:
+    """Returns the ETag of the patient's reading, or None if there is none."""
+    return etag.readings_etag(
+        Reading.patient_id == patient_uuid, Reading.uuid == reading_uuid
+    )
+
+
+def get_patient_etag(patient_id: str) -> Optional[str]:
+    """Returns the ETag of the patient, or None if there is no such patient."""
+    return etag.patient_etag(patient_id)
+
+
+def _encode_reading_cursor(reading: Reading) -> str:
+    key = f"{reading.measured_timestamp.isoformat()}|{reading.uuid}"
+    return base64.urlsafe_b64encode(key.encode()).decode()
+
+
+def _decode_reading_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        timestamp, uuid = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(timestamp), uuid
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError("Invalid reading cursor")
 
 
 def retrieve_readings_for_period(
@@ -224,19 +526,40 @@ def retrieve_readings_for_period(
     return dict(patient_readings_map)
 
 
+def iter_readings_for_period(
+    days: int, compact: bool = True
+) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    As retrieve_readings_for_period, but yields (patient UUID, reading) pairs, grouped by
+    patient. Readings are read through a server-side cursor in batches of
+    STREAM_READINGS_BATCH_SIZE, so memory use does not grow with the number of readings.
+    """
+    readings_query: Query = (
+        _recent_readings_query(days=days, compact=compact, stream=True)
+        .order_by(Reading.patient_id, Reading.measured_timestamp.desc())
+        .yield_per(STREAM_READINGS_BATCH_SIZE)
+    )
+    for reading in readings_query:
+        yield reading.patient_id, reading.to_dict(compact=compact)
+
+
 def _get_recent_readings(days: int, compact: bool = True) -> List[Reading]:
+    return (
+        _recent_readings_query(days=days, compact=compact)
+        .order_by(Reading.measured_timestamp.desc())
+        .all()
+    )
+
+
+def _recent_readings_query(
+    days: int, compact: bool = True, stream: bool = False
+) -> Query:
     """
-    Ideally we would just query the readings table, filtering using the earliest allowed
-    measured timestamp. However, the database splits the timestamp into raw and timezone
-    offset, so we must instead:
-      - Get all readings filtered by earliest allowed measured timestamp, including a buffer
-        of one day to allow for timezone offset
-      - Order readings by measured timestamp
-      - Remove all readings whose timezone-aware timestamp is earlier than the original
-        earliest allowed timestamp
+    Query for all readings measured in the last given number of days.
+    Reading.measured_timestamp holds the instant in UTC (the offset is kept separately in
+    measured_timezone), so the window is filtered exactly, and using the index, in SQL.
     """
-    earliest_allowed: datetime = datetime.now(tz=timezone.utc) - timedelta(days=days)
-    earliest_selected: datetime = earliest_allowed - timedelta(days=1)
+    earliest_allowed: datetime = datetime.utcnow() - timedelta(days=days)
 
     if compact:
         readings_query = Reading.query.options(
@@ -245,51 +568,121 @@ def _get_recent_readings(days: int, compact: bool = True) -> List[Reading]:
     else:
         readings_query = Reading.query.options(
             joinedload(Reading.reading_metadata),
-            joinedload(Reading.doses),
-            joinedload(Reading.reading_banding),
-            joinedload(Reading.prandial_tag),
+            # Collections can't be joined eagerly when streaming results.
+            selectinload(Reading.doses) if stream else joinedload(Reading.doses),
             joinedload(Reading.amber_alert),
             joinedload(Reading.red_alert),
         )
 
-    readings: List[Reading] = (
-        readings_query.filter(Reading.measured_timestamp > earliest_selected)
-        .order_by(Reading.measured_timestamp.desc())
-        .all()
-    )
-    return [r for r in readings if r.get_measured_timestamp() > earliest_allowed]
+    return readings_query.filter(Reading.measured_timestamp > earliest_allowed)
 
 
 def retrieve_statistics_for_period(
-    days: int, compact: bool = True
-) -> Dict[str, Dict[str, Dict]]:
+    days: int, compact: bool = True, by_prandial_tag: bool = False
+) -> Dict[str, Dict[str, Any]]:
     """
     Retrieves the minimum and maximum readings recorded by each patient for a
-    given period of days.
+    given period of days. The statistics are aggregated in the database, so only the
+    extreme readings are loaded. They are cached for STATISTICS_CACHE_TTL_SEC, or until
+    the readings change.
     """
-    readings: List[Reading] = _get_recent_readings(days=days)
-    patient_readings_map: Dict[str, List[Reading]] = defaultdict(list)
-    for reading in readings:
-        patient_readings_map[reading.patient_id].append(reading)
-    stats_map: Dict[str, Dict] = {}
-    for patient_uuid, readings in patient_readings_map.items():
-        readings.sort(key=lambda r: r.blood_glucose_value)
-        stats_map[patient_uuid] = {
-            "min_reading": readings[0].to_dict(compact=compact),
-            "max_reading": readings[-1].to_dict(compact=compact),
-            "readings_count": len(readings),
-            "readings_count_banding_normal": sum(
-                1
-                for r in readings
-                if r.reading_banding_id == "BG-READING-BANDING-NORMAL"
-            ),
+    return cache.get_or_compute(
+        namespace=STATISTICS_CACHE_NAMESPACE,
+        key=f"{days}:{compact}:{by_prandial_tag}",
+        compute=lambda: _retrieve_statistics_for_period(
+            days=days, compact=compact, by_prandial_tag=by_prandial_tag
+        ),
+        ttl=current_app.config["STATISTICS_CACHE_TTL_SEC"],
+    )
+
+
+def _retrieve_statistics_for_period(
+    days: int, compact: bool, by_prandial_tag: bool
+) -> Dict[str, Dict[str, Any]]:
+    earliest_allowed: datetime = datetime.utcnow() - timedelta(days=days)
+    patient_statistics: Dict[
+        str, statistics.PatientReadingStatistics
+    ] = statistics.reading_statistics(
+        earliest_allowed=earliest_allowed, by_prandial_tag=by_prandial_tag
+    )
+
+    reading_ids: Set[str] = set()
+    for patient_stats in patient_statistics.values():
+        for stats in [patient_stats.overall, *patient_stats.by_prandial_tag.values()]:
+            reading_ids.update((stats.min_reading_id, stats.max_reading_id))
+    readings_query: Query = (
+        Reading.query.options(joinedload(Reading.reading_metadata))
+        if compact
+        else _reading_query()
+    )
+    readings: Dict[str, Dict] = {
+        r.uuid: r.to_dict(compact=compact)
+        for r in readings_query.filter(Reading.uuid.in_(reading_ids))
+    }
+
+    def _to_dict(stats: statistics.ReadingStatisticsRow) -> Dict[str, Any]:
+        return {
+            "min_reading": readings[stats.min_reading_id],
+            "max_reading": readings[stats.max_reading_id],
+            "readings_count": stats.readings_count,
+            "readings_count_banding_normal": stats.readings_count_banding_normal,
         }
+
+    stats_map: Dict[str, Dict[str, Any]] = {}
+    for patient_uuid, patient_stats in patient_statistics.items():
+        stats_map[patient_uuid] = _to_dict(patient_stats.overall)
+        if by_prandial_tag:
+            stats_map[patient_uuid]["prandial_tags"] = {
+                prandial_tag_id: _to_dict(stats)
+                for prandial_tag_id, stats in patient_stats.by_prandial_tag.items()
+            }
     return stats_map
 
 
+def retrieve_daily_summaries_for_patient(patient_id: str, days: int) -> List[Dict]:
+    """
+    Retrieves per-day reading statistics for a patient, overall and per prandial tag, for
+    the given number of calendar days up to and including today. Days are local to where
+    the readings were taken, and days without readings are left out.
+    """
+    end_day: date = datetime.utcnow().date()
+    start_day: date = end_day - timedelta(days=days - 1)
+    summaries: Dict[date, Dict[str, Any]] = {}
+    for rollup in daily_rollup.get_daily_rollups(
+        patient_id=patient_id, start_day=start_day, end_day=end_day
+    ):
+        summary: Optional[Dict[str, Any]] = summaries.get(rollup.day)
+        if summary is None:
+            summary = summaries[rollup.day] = {
+                "date": rollup.day,
+                **rollup.to_dict(),
+                "prandial_tags": {},
+            }
+        else:
+            summary["readings_count"] += rollup.readings_count
+            summary[
+                "readings_count_banding_normal"
+            ] += rollup.readings_count_banding_normal
+            summary["min_blood_glucose_value"] = min(
+                summary["min_blood_glucose_value"], rollup.min_blood_glucose_value
+            )
+            summary["max_blood_glucose_value"] = max(
+                summary["max_blood_glucose_value"], rollup.max_blood_glucose_value
+            )
+        summary["prandial_tags"][rollup.prandial_tag_id] = rollup.to_dict()
+    return list(summaries.values())
+
+
 def retrieve_latest_reading_for_patient(patient_id: str) -> Optional[Dict]:
     logger.debug("Retrieving latest reading for patient with UUID %s", patient_id)
+    return _get_or_compute_for_patient(
+        patient_id=patient_id,
+        key="latest_reading",
+        compute=lambda: _retrieve_latest_reading_for_patient(patient_id),
+    )
+
 
+def _retrieve_latest_reading_for_patient(patient_id: str) -> Optional[Dict]:
     reading: Reading = (
         Reading.query.filter_by(patient_id=patient_id)
         .order_by(Reading.measured_timestamp.desc())
@@ -312,13 +705,25 @@ def retrieve_first_reading_for_patient(patient_id: str) -> Optional[Dict]:
 
 
 def retrieve_patient_summaries(patient_ids: List[str]) -> Dict[str, Dict]:
-    """Returns some per-patient summary information"""
+    """
+    Returns some per-patient summary information. Summaries are cached for
+    PATIENT_SUMMARY_CACHE_TTL_SEC, or until the patients or readings change.
+    """
     logger.debug("Retrieving patient summaries")
 
     if len(patient_ids) == 0:
         logger.debug("Client asked for 0 summaries - bailing out")
         return {}
 
+    return cache.get_or_compute(
+        namespace=PATIENT_SUMMARY_CACHE_NAMESPACE,
+        key=cache.hash_key(patient_ids),
+        compute=lambda: _retrieve_patient_summaries(patient_ids),
+        ttl=current_app.config["PATIENT_SUMMARY_CACHE_TTL_SEC"],
+    )
+
+
+def _retrieve_patient_summaries(patient_ids: List[str]) -> Dict[str, Dict]:
     logger.debug("Getting %d patient summaries", len(patient_ids))
 
     resp = _query_patient_summaries_from_db(patient_ids)
@@ -338,6 +743,9 @@ def update_reading(patient_id: str, reading_id: str, reading_data: Dict) -> Dict
         patient_id=patient_id, uuid=reading_id
     ).first_or_404()
 
+    original_rollup_key: daily_rollup.RollupKey = daily_rollup.rollup_key(reading)
+    original_run_key: counts_alert_run.RunKey = counts_alert_run.run_key(reading)
+
     # Update comment
     comment = reading_data.get("comment", None)
     if comment is not None:
@@ -353,13 +761,11 @@ def update_reading(patient_id: str, reading_id: str, reading_data: Dict) -> Dict
         elif not isinstance(prandial_tag_value, int):
             raise TypeError("Prandial tag must contain a 'value' field of type integer")
 
-        selected_prandial_tag = (
-            PrandialTag.query.filter_by(value=prandial_tag_value).first() or None
-        )
-        if selected_prandial_tag is None:
+        selected_prandial_tag_id = dimensions.find_prandial_tag_uuid(prandial_tag_value)
+        if selected_prandial_tag_id is None:
             raise ValueError("Prandial tag supplied with invalid value")
 
-        reading.prandial_tag = selected_prandial_tag
+        reading.prandial_tag_id = selected_prandial_tag_id
 
     # Update banding
     updated_banding_id: Optional[str] = reading_data.get("banding_id", None)
@@ -414,18 +820,31 @@ def update_reading(patient_id: str, reading_id: str, reading_data: Dict) -> Dict
 
             # Add it to the session to be deleted from the database
             db.session.delete(dose_to_delete)
-    db.session.commit()
+    db.session.flush()
+    # New doses were added by reading ID, so the loaded doses collection is stale.
+    db.session.expire(reading)
 
     updated_reading: Reading = Reading.query.filter_by(
         patient_id=patient_id, uuid=reading_id
     ).first()
 
+    if prandial_tag is not None or updated_banding_id is not None:
+        daily_rollup.refresh(
+            {original_rollup_key, daily_rollup.rollup_key(updated_reading)}
+        )
+        counts_alert_run.refresh(
+            {original_run_key, counts_alert_run.run_key(updated_reading)}
+        )
+
     if counts_alerting.reading_could_trigger_alert(reading) and (
         prandial_tag is not None or updated_banding_id is not None
     ):
         publish_abnormal_reading(reading=updated_reading)
 
-    return updated_reading.to_dict()
+    updated_reading_data: Dict = updated_reading.to_dict()
+    _invalidate_patient_cache([patient_id])
+    db.session.commit()
+    return updated_reading_data
 
 
 def add_dose_to_reading(patient_id: str, reading_id: str, dose_data: Dict) -> Dict:
@@ -445,6 +864,7 @@ def add_dose_to_reading(patient_id: str, reading_id: str, dose_data: Dict) -> Di
     )
 
     db.session.add(dose)
+    _invalidate_patient_cache([patient_id])
     db.session.commit()
 
     return dose.to_dict()
@@ -456,6 +876,7 @@ def update_dose_on_reading(
 ) -> Dict:
 
     Dose.query.filter_by(uuid=dose_id, reading_id=reading_id).update(dose_data)
+    _invalidate_patient_cache([patient_id])
 
     db.session.commit()
 
@@ -486,9 +907,9 @@ def _validate_reading(reading_data: Optional[Dict] = None) -> Tuple:
 
 def _create_reading_from_parts(
     patient_id: str,
-    doses: Optional[List[Dict]],
+    doses: Optional[List[Dose]],
     comment: Optional[str],
-    reading_metadata: Optional[Dict],
+    reading_metadata: Optional[ReadingMetadata],
     reading_data: Dict,
     banding_id: str,
     publish: bool = True,
@@ -499,50 +920,16 @@ def _create_reading_from_parts(
         "Creating reading from parts",
         extra={"patient_id": patient_id},
     )
-    prandial_tag = _prandial_tag_or_default(reading_data.pop("prandial_tag"))
-    measured_timestamp, measured_timezone = split_timestamp(
-        reading_data.pop("measured_timestamp")
-    )
-
-    blood_glucose_value = reading_data.pop("blood_glucose_value")
-    units = reading_data.pop("units")
-
-    # Create associated Patient, if not there
-    patient = Patient.query.get(patient_id)
-    if not patient:
-        patient = Patient(uuid=patient_id)
-        db.session.add(patient)
-        db.session.flush()
-    logger.debug("Preparing to create a new reading record")
-
-    reading = Reading(
-        uuid=generate_uuid(),
+    reading_uuid, created = _insert_reading(
         patient_id=patient_id,
         doses=doses,
         comment=comment,
-        prandial_tag=prandial_tag,
         reading_metadata=reading_metadata,
-        measured_timestamp=measured_timestamp,
-        measured_timezone=measured_timezone,
-        blood_glucose_value=blood_glucose_value,
-        units=units,
-        reading_banding_id=banding_id,
+        reading_data=reading_data,
+        banding_id=banding_id,
     )
-    db.session.add(reading)
-
-    if counts_alerting.is_reading_in_snooze_period(reading, patient):
-        reading.snoozed = True
-    try:
-        db.session.commit()
-    except IntegrityError:
-        db.session.rollback()
-        reading = Reading.query.filter_by(
-            blood_glucose_value=blood_glucose_value,
-            units=units,
-            measured_timestamp=measured_timestamp,
-            measured_timezone=measured_timezone,
-            patient_id=patient_id,
-        ).first()
+    reading: Reading = _reading_query().filter_by(uuid=reading_uuid).one()
+    if not created:
         publish_audit_message(
             event_type="duplicate_reading",
             event_data={
@@ -558,85 +945,157 @@ def _create_reading_from_parts(
 
         logger.debug("Finished creating reading")
 
-    return reading.to_dict(compact=compact)
+    reading_data = reading.to_dict(compact=compact)
+    db.session.commit()
+    return reading_data
 
 
-def _create_summary_orm_from_row(row: Row) -> Tuple[Reading, Patient]:
-    """Takes a SQLAlchemy Result containing reading+patient rows and returns ORM objects of same."""
-    reading = Reading()
-    patient = Patient()
+def _insert_reading(
+    patient_id: str,
+    doses: Optional[List[Dose]],
+    comment: Optional[str],
+    reading_metadata: Optional[ReadingMetadata],
+    reading_data: Dict,
+    banding_id: str,
+) -> Tuple[str, bool]:
+    """
+    Stores a reading along with its doses and metadata, unless it duplicates a reading
+    that is already stored. Returns the UUID of the stored reading and whether it was
+    newly created. The caller must commit, so that any messages it publishes about the
+    reading are stored in the same transaction.
+    """
+    prandial_tag_id = _prandial_tag_id_or_default(reading_data.pop("prandial_tag"))
+    measured_timestamp, measured_timezone = split_timestamp(
+        reading_data.pop("measured_timestamp")
+    )
 
-    for k in row.keys():
-        if hasattr(reading, k):
-            setattr(reading, k, getattr(row, k))
-        elif hasattr(patient, k):
-            setattr(patient, k, getattr(row, k))
+    # Create associated Patient, if not there
+    snooze_period = upsert.ensure_patient(patient_id)
+
+    # The metadata is stored in a savepoint along with the reading, so that if the
+    # reading turns out to be a duplicate only the savepoint is rolled back, leaving the
+    # rest of the caller's transaction as it is.
+    savepoint = db.session.begin_nested()
+    if reading_metadata is not None:
+        db.session.add(reading_metadata)
+        db.session.flush()
 
-    return reading, patient
+    # The reading row itself is inserted by upsert.insert_reading rather than the ORM,
+    # so relationships are set by ID and the reading is never added to the session.
+    reading = Reading(
+        uuid=generate_uuid(),
+        patient_id=patient_id,
+        comment=comment,
+        prandial_tag_id=prandial_tag_id,
+        reading_metadata_id=reading_metadata.uuid if reading_metadata else None,
+        measured_timestamp=measured_timestamp,
+        measured_timezone=measured_timezone,
+        blood_glucose_value=reading_data.pop("blood_glucose_value"),
+        units=reading_data.pop("units"),
+        reading_banding_id=banding_id,
+    )
+    reading.snoozed = counts_alerting.is_reading_in_snooze_period(
+        reading, snooze_period
+    )
 
+    reading_uuid, created = upsert.insert_reading(reading)
+    if not created:
+        # Discard the metadata stored for the duplicate.
+        savepoint.rollback()
+        logger.debug("Reading duplicates existing reading with UUID %s", reading_uuid)
+        return reading_uuid, False
+    savepoint.commit()
 
-def _query_patient_summaries_from_db(patient_ids: List[str]) -> Dict[str, Dict]:
-    s = db.session
-
-    # Due to the performance concerns,
-    # this uses a hand-crafted a SQL query rather than the ORM
-    # The DISTINCT works because we need only the top result
-    # from the readings table per-patient
-    sql_query = text(
-        """
-        SELECT patient.*, reading.*
-        FROM patient
-        INNER JOIN (
-        SELECT DISTINCT ON (patient_id) *
-        FROM reading
-        WHERE reading.patient_id IN :patient_ids
-        ORDER BY reading.patient_id, reading.measured_timestamp DESC
-        ) AS reading ON patient.uuid = reading.patient_id
-        WHERE patient.uuid IN :patient_ids
-        """
-    )
-
-    # Run the SQL query
-    result: Result = s.execute(sql_query, {"patient_ids": tuple(patient_ids)})
+    upsert.advance_latest_reading(
+        patient_id=patient_id,
+        reading_uuid=reading_uuid,
+        measured_timestamp=measured_timestamp,
+    )
+    _invalidate_patient_cache([patient_id])
+    daily_rollup.add_readings([reading])
+    counts_alert_run.add_readings([reading])
+    for dose in doses or []:
+        dose.reading_id = reading_uuid
+        db.session.add(dose)
+    db.session.flush()
+    return reading_uuid, True
+
+
+def _reading_query() -> Query:
+    # Loads readings along with everything needed to render them in expanded form,
+    # except for prandial tags and bandings, which come from the dimensions cache.
+    return Reading.query.options(
+        joinedload(Reading.doses),
+        joinedload(Reading.reading_metadata),
+        joinedload(Reading.amber_alert),
+        joinedload(Reading.red_alert),
+    )
 
-    resp = {}
 
-    # Unpack the results into dictionaries via standard to_dict() methods
-    for row in result:
-        reading, patient = _create_summary_orm_from_row(row)
+def _get_or_compute_for_patient(
+    patient_id: str, key: str, compute: Callable[[], Any]
+) -> Any:
+    # Returns the cached response for the patient, or computes and caches it. Without
+    # Redis, invalidating the patient's scope only reaches this worker's cache, so the
+    # others would serve stale responses until they expire. Responses are not cached then.
+    ttl: int = (
+        current_app.config["PATIENT_CACHE_TTL_SEC"]
+        if current_app.config["REDIS_INSTALLED"]
+        else 0
+    )
+    return cache.get_or_compute(
+        namespace=PATIENT_CACHE_NAMESPACE,
+        key=key,
+        compute=compute,
+        ttl=ttl,
+        scope=patient_id,
+    )
 
-        reading_dict = reading.to_dict(compact=True)
-        patient_dict = patient.to_dict()
-        patient_dict["latest_reading"] = reading_dict
 
-        resp[reading_dict["patient_id"]] = patient_dict
+def _invalidate_patient_cache(patient_ids: Iterable[str]) -> None:
+    # Discards the cached responses for the patients once the transaction commits.
+    for patient_id in patient_ids:
+        cache.invalidate_on_commit(PATIENT_CACHE_NAMESPACE, scope=patient_id)
 
-    return resp
 
+def _query_patient_summaries_from_db(patient_ids: List[str]) -> Dict[str, Dict]:
+    # Each patient points at their latest reading, so this is a join on primary keys
+    # rather than a search through every reading of every patient.
+    rows: List[Tuple[Patient, Reading]] = (
+        db.session.query(Patient, Reading)
+        .join(Reading, Reading.uuid == Patient.latest_reading_id)
+        .options(joinedload(Reading.reading_metadata))
+        .filter(Patient.uuid.in_(patient_ids))
+        .all()
+    )
 
-def _prandial_tag_or_default(prandial_tag_data: Optional[Dict]) -> PrandialTag:
-    # Retrieve prandial tag given UUID or value.
-    if prandial_tag_data is not None and prandial_tag_data != {}:
-        return _get_prandial_tag(prandial_tag_data)
+    resp = {}
+    for patient, reading in rows:
+        patient_dict = patient.to_dict()
+        patient_dict["latest_reading"] = reading.to_dict(compact=True)
+        resp[patient.uuid] = patient_dict
 
-    # Fall back to default.
-    prandial_tag = PrandialTag.query.filter_by(value=0).first()
-    if prandial_tag is None:
-        raise RuntimeError("Prandial tag table is not populated")
-    return prandial_tag
+    return resp
 
 
-def _get_prandial_tag(prandial_tag_data: Dict) -> PrandialTag:
-    # Retrieves a prandial tag given a UUID or a value.
+def _prandial_tag_id_or_default(prandial_tag_data: Optional[Dict]) -> str:
+    # Resolves a prandial tag given its UUID or value, from the dimensions cache.
+    if prandial_tag_data is None or prandial_tag_data == {}:
+        # Fall back to default.
+        prandial_tag_id = dimensions.find_prandial_tag_uuid(0)
+        if prandial_tag_id is None:
+            raise RuntimeError("Prandial tag table is not populated")
+        return prandial_tag_id
     if "uuid" in prandial_tag_data and isinstance(prandial_tag_data["uuid"], str):
-        return PrandialTag.query.filter_by(
-            uuid=prandial_tag_data["uuid"]
-        ).first_or_404()
-    if "value" in prandial_tag_data and isinstance(prandial_tag_data["value"], int):
-        return PrandialTag.query.filter_by(
-            value=prandial_tag_data["value"]
-        ).first_or_404()
-    raise KeyError("Prandial tag must contain a valid 'value' or 'uuid' field")
+        if dimensions.has_prandial_tag(prandial_tag_data["uuid"]):
+            return prandial_tag_data["uuid"]
+    elif "value" in prandial_tag_data and isinstance(prandial_tag_data["value"], int):
+        prandial_tag_id = dimensions.find_prandial_tag_uuid(prandial_tag_data["value"])
+        if prandial_tag_id is not None:
+            return prandial_tag_id
+    else:
+        raise KeyError("Prandial tag must contain a valid 'value' or 'uuid' field")
+    raise ValueError("Prandial tag supplied with invalid value")
 
 
 def process_counts_alerts_for_reading(reading_id: str) -> Dict:
@@ -656,15 +1115,33 @@ def process_counts_alerts_for_reading(reading_id: str) -> Dict:
     if reading.snoozed:
         return reading.to_dict()
     logger.debug("Reading not in snooze period")
+    _invalidate_patient_cache([reading.patient_id])
 
     # amber alerts are only generated if the reading is in the most recent 2
     # days of readings, it is abnormal and there are 1 or more other abnormal
-    # readings
-    reading = counts_alerting.process_amber_alertable_readings(reading)
+    # readings; red alerts are only generated on readings that are three in a row
+    decision: counts_alerting.CountsAlertDecision = (
+        counts_alerting.evaluate_counts_alerts(reading)
+    )
+    alerting_reading_ids: Set[str] = {
+        *decision.amber_reading_ids,
+        *decision.red_reading_ids,
+    }
+    readings_to_alert: Dict[str, Reading] = (
+        {
+            r.uuid: r
+            for r in Reading.query.filter(Reading.uuid.in_(alerting_reading_ids))
+        }
+        if alerting_reading_ids
+        else {}
+    )
+
+    if decision.amber_reading_ids:
+        counts_alerting.add_amber_alerts(
+            reading, [readings_to_alert[u] for u in decision.amber_reading_ids]
+        )
 
-    # red alerts are only generated on readings that are three in a row
-    red_alertable_readings = counts_alerting.get_alertable_readings(reading)
-    if not red_alertable_readings:
+    if not decision.red_reading_ids:
         logger.debug("No red alertable readings found")
         # Commit to database and early return
         db.session.commit()
@@ -672,10 +1149,10 @@ def process_counts_alerts_for_reading(reading_id: str) -> Dict:
 
     # alerts needed!
     logger.debug("Red alertable readings found")
-    for alertable_reading in red_alertable_readings:
+    for alertable_reading_id in decision.red_reading_ids:
         logger.debug("Creating red alert for reading")
         counts_alerting.add_red_alert_to_reading(
-            red_alertable_readings[alertable_reading]
+            readings_to_alert[alertable_reading_id]
         )
 
     logger.debug("Setting red alert for patient %s", reading.patient.uuid)
@@ -691,46 +1168,155 @@ def process_counts_alerts_for_reading(reading_id: str) -> Dict:
     return reading.to_dict()
 
 
+def process_counts_alerts_for_readings(reading_ids: List[str]) -> List[Dict]:
+    """
+    Processes the "counts" alerts for a batch of readings, as per
+    process_counts_alerts_for_reading for each of them. Readings are grouped by patient,
+    so that each patient's readings are evaluated together, and each patient gets at
+    most one alert message of each type.
+    """
+    readings: Dict[str, Reading] = {
+        r.uuid: r
+        for r in _reading_query()
+        .options(joinedload(Reading.patient))
+        .filter(Reading.uuid.in_(reading_ids))
+    }
+    missing_reading_ids: List[str] = [u for u in reading_ids if u not in readings]
+    if missing_reading_ids:
+        raise EntityNotFoundException(
+            "No readings found with UUIDs " + ", ".join(missing_reading_ids)
+        )
+
+    # Abort if the alerts system is "percentages".
+    alerts_system: AlertsSystem = trustomer.get_alerts_system()
+    if alerts_system == AlertsSystem.PERCENTAGES:
+        logger.info(
+            "Process alerts for readings ignored: alerts system is '%s'",
+            alerts_system.value,
+        )
+        return [readings[u].to_dict() for u in reading_ids]
+
+    # alerts cannot be triggered during a "snooze" period
+    readings_by_patient: Dict[str, Set[str]] = defaultdict(set)
+    for reading in readings.values():
+        if not reading.snoozed:
+            readings_by_patient[reading.patient_id].add(reading.uuid)
+
+    decisions: Dict[str, counts_alerting.CountsAlertDecision] = {
+        patient_id: counts_alerting.evaluate_counts_alerts_for_readings(
+            patient_id=patient_id, reading_ids=patient_reading_ids
+        )
+        for patient_id, patient_reading_ids in readings_by_patient.items()
+    }
+    alerting_reading_ids: Set[str] = {
+        reading_id
+        for decision in decisions.values()
+        for reading_id in (*decision.amber_reading_ids, *decision.red_reading_ids)
+    }
+    readings_to_alert: Dict[str, Reading] = (
+        {
+            r.uuid: r
+            for r in Reading.query.filter(Reading.uuid.in_(alerting_reading_ids))
+        }
+        if alerting_reading_ids
+        else {}
+    )
+
+    for patient_id, decision in decisions.items():
+        reading = readings[next(iter(readings_by_patient[patient_id]))]
+        if decision.amber_reading_ids:
+            counts_alerting.add_amber_alerts(
+                reading, [readings_to_alert[u] for u in decision.amber_reading_ids]
+            )
+
+        if not decision.red_reading_ids:
+            logger.debug("No red alertable readings found for patient %s", patient_id)
+            continue
+
+        logger.debug("Red alertable readings found for patient %s", patient_id)
+        for alertable_reading_id in decision.red_reading_ids:
+            counts_alerting.add_red_alert_to_reading(
+                readings_to_alert[alertable_reading_id]
+            )
+        reading.patient.current_red_alert = True
+        publish_patient_alert(
+            patient_uuid=patient_id, alert_type=PatientAlert.AlertType.COUNTS_RED
+        )
+
+    _invalidate_patient_cache(decisions)
+    db.session.flush()
+    response: List[Dict] = [readings[u].to_dict() for u in reading_ids]
+    db.session.commit()
+    return response
+
+
 def clear_alerts_for_patient(patient_id: str) -> Dict:
-    patient = Patient.query.filter(Patient.uuid == patient_id).first()
-    if not patient:
-        raise EntityNotFoundException("No patient found with UUID " + patient_id)
+    return clear_alerts_for_patients(patient_ids=[patient_id])[patient_id]
+
 
-    # Clear alert flags on patient.
-    logger.info("Clearing alerts for patient with UUID %s", patient_id)
-    patient.current_red_alert = False
-    patient.current_amber_alert = False
+def clear_alerts_for_patients(patient_ids: List[str]) -> Dict[str, Dict]:
+    """
+    Clears the alerts for each of the given patients, and snoozes their alerts for the
+    number of days configured by the trustomer. Their active counts and percentages
+    alerts are dismissed in bulk, as per counts_alerting and percentages_alerting
+    dismiss_active_alerts_for_patients. Returns the result for each patient, keyed by
+    UUID.
+    """
+    patients: List[Patient] = Patient.query.filter(Patient.uuid.in_(patient_ids)).all()
+    missing_uuids: Set[str] = set(patient_ids) - {p.uuid for p in patients}
+    if missing_uuids:
+        raise EntityNotFoundException(
+            "No patient found with UUID " + ", ".join(sorted(missing_uuids))
+        )
 
-    # Activate alerts snooze on patient.
-    logger.debug("Activating snooze for patient with UUID %s", patient_id)
+    # Activate alerts snooze on patients.
     time_now: datetime = datetime.utcnow().replace(tzinfo=timezone.utc)
     snooze_duration_interval_days: int = trustomer.get_alerts_snooze_duration_days()
-    snooze_start_iso8601: Optional[str] = parse_datetime_to_iso8601(time_now)
-    snooze_end_iso8601: Optional[str] = parse_datetime_to_iso8601(
+    snooze_start_iso8601: str = parse_datetime_to_iso8601_typesafe(time_now)
+    snooze_end_iso8601: str = parse_datetime_to_iso8601_typesafe(
         calculate_midnight_plus_days(
             base=time_now, offset=snooze_duration_interval_days
         )
     )
-    patient.set_suppress_reading_alerts_from(snooze_start_iso8601)
-    patient.set_suppress_reading_alerts_until(snooze_end_iso8601)
-    logger.debug("Snoozed from %s until %s", snooze_start_iso8601, snooze_end_iso8601)
+    logger.debug("Snoozing from %s until %s", snooze_start_iso8601, snooze_end_iso8601)
+
+    for patient in patients:
+        # Clear alert flags on patient.
+        logger.info("Clearing alerts for patient with UUID %s", patient.uuid)
+        patient.current_red_alert = False
+        patient.current_amber_alert = False
+        patient.set_suppress_reading_alerts_from(snooze_start_iso8601)
+        patient.set_suppress_reading_alerts_until(snooze_end_iso8601)
 
     # Mark active percentages alerts as dismissed.
-    percentages_alerting.dismiss_active_alerts_for_patient(patient_id=patient.uuid)
+    percentages_alerting.dismiss_active_alerts_for_patients(patient_ids=patient_ids)
 
     # Mark active counts alerts as dismissed.
-    counts_alerting.dismiss_active_alerts_for_patient(patient_id=patient.uuid)
-
-    db.session.commit()
-
-    return {
-        "completed": True,
-        "suppress_reading_alerts_from": patient.suppress_reading_alerts_from,
-        "suppress_reading_alerts_until": patient.suppress_reading_alerts_until,
+    counts_alerting.dismiss_active_alerts_for_patients(patient_ids=patient_ids)
+    _invalidate_patient_cache(patient_ids)
+
+    # Render the results before committing, as the commit expires every object.
+    results: Dict[str, Dict] = {
+        patient.uuid: {
+            "completed": True,
+            "suppress_reading_alerts_from": patient.suppress_reading_alerts_from,
+            "suppress_reading_alerts_until": patient.suppress_reading_alerts_until,
+        }
+        for patient in patients
     }
+    db.session.commit()
+    return results
 
 
 def get_patient(patient_id: str) -> Dict:
+    return _get_or_compute_for_patient(
+        patient_id=patient_id,
+        key="patient",
+        compute=lambda: _get_patient(patient_id),
+    )
+
+
+def _get_patient(patient_id: str) -> Dict:
     p: Patient = Patient.query.filter_by(uuid=patient_id).first_or_404()
     return p.to_dict()
 
@@ -764,16 +1350,10 @@ def process_activity_alerts_for_patient(patient_id: str, readings_plans: List) -
         )
     )
 
-    # Alert if number of taken readings is less than 2/3s of expected
-    alert_now: bool = recent_readings_count < (2 / 3 * total_expected_readings)
-    logger.debug(
-        "Patient %s activity alert processing result: %s",
-        patient.uuid,
-        alert_now,
-        extra={
-            "actual_readings": recent_readings_count,
-            "expected_readings": total_expected_readings,
-        },
+    alert_now: bool = _is_activity_alert_now(
+        patient_id=patient.uuid,
+        recent_readings_count=recent_readings_count,
+        total_expected_readings=total_expected_readings,
     )
     patient.current_activity_alert = alert_now
     percentages_alerting.update_alerts_for_patient(
@@ -781,11 +1361,99 @@ def process_activity_alerts_for_patient(patient_id: str, readings_plans: List) -
         alert_type=PatientAlert.AlertType.ACTIVITY_GREY,
         alert_now=alert_now,
     )
+    _invalidate_patient_cache([patient.uuid])
 
     db.session.commit()
     return {"alert_now": alert_now, **patient.to_dict()}
 
 
+def process_activity_alerts_for_patients(
+    readings_plans_by_patient: Dict[str, List]
+) -> Dict[str, Dict]:
+    """
+    Processes the "activity" alerts for many patients at once, as per
+    process_activity_alerts_for_patient for each of them, given their readings plans
+    keyed by patient UUID. The patients' readings during the past 7 calendar days are
+    counted in a single query, and their activity alert records are updated in bulk.
+    Returns the result for each patient, keyed by patient UUID.
+    """
+    logger.info(
+        "Processing activity alerts for %d patients", len(readings_plans_by_patient)
+    )
+    patients: Dict[str, Patient] = {
+        p.uuid: p
+        for p in Patient.query.filter(Patient.uuid.in_(list(readings_plans_by_patient)))
+    }
+    missing_uuids: Set[str] = set(readings_plans_by_patient) - set(patients)
+    if missing_uuids:
+        raise EntityNotFoundException(
+            "No patients found with UUIDs " + ", ".join(sorted(missing_uuids))
+        )
+
+    # Count readings from previous 7 days
+    to_datetime: datetime = calculate_last_midnight()
+    from_datetime: datetime = to_datetime - timedelta(days=7)
+    recent_readings_counts: Dict[str, int] = dict(
+        db.session.query(Reading.patient_id, func.count())
+        .filter(
+            Reading.patient_id.in_(list(readings_plans_by_patient)),
+            Reading.measured_timestamp >= from_datetime,
+        )
+        .group_by(Reading.patient_id)
+        .all()
+    )
+
+    # Calculate expected readings
+    expected_readings_counts: Dict[
+        str, float
+    ] = percentages_alerting.calculate_expected_reading_counts(
+        plans_by_patient=readings_plans_by_patient,
+        start_date=from_datetime,
+        end_date=to_datetime,
+    )
+
+    alerts_now: Dict[percentages_alerting.AlertKey, bool] = {}
+    for patient_id in readings_plans_by_patient:
+        alert_now: bool = _is_activity_alert_now(
+            patient_id=patient_id,
+            recent_readings_count=recent_readings_counts.get(patient_id, 0),
+            total_expected_readings=expected_readings_counts[patient_id],
+        )
+        patients[patient_id].current_activity_alert = alert_now
+        alerts_now[(patient_id, PatientAlert.AlertType.ACTIVITY_GREY)] = alert_now
+    percentages_alerting.reconcile_alerts(alerts_now=alerts_now)
+    _invalidate_patient_cache(patients)
+
+    # Render the patients before committing, as the commit expires every object.
+    db.session.flush()
+    results: Dict[str, Dict] = {
+        patient_id: {
+            "alert_now": alerts_now[(patient_id, PatientAlert.AlertType.ACTIVITY_GREY)],
+            **patients[patient_id].to_dict(),
+        }
+        for patient_id in readings_plans_by_patient
+    }
+    db.session.commit()
+    return results
+
+
+def _is_activity_alert_now(
+    patient_id: str, recent_readings_count: int, total_expected_readings: float
+) -> bool:
+    # Alert if number of taken readings is less than 2/3s of expected
+    alert_now: bool = recent_readings_count < (2 / 3 * total_expected_readings)
+    logger.debug(
+        "Patient %s activity alert processing result: %s",
+        patient_id,
+        alert_now,
+        extra={
+            "actual_readings": recent_readings_count,
+            "expected_readings": total_expected_readings,
+        },
+    )
+    return alert_now
+
+
 def process_percentages_alerts(alerts_data: Dict) -> None:
     """
     Given a map of alerts (where keys are patient UUIDs, and values are alert statuses):
@@ -804,15 +1472,17 @@ def process_percentages_alerts(alerts_data: Dict) -> None:
     if len(retrieved_uuids) < len(requested_uuids):
         missing_uuids: Set[str] = requested_uuids - retrieved_uuids
         raise EntityNotFoundException(
-            "Patient not found with UUID(s): %s", missing_uuids
+            "No patients found with UUIDs " + ", ".join(sorted(missing_uuids))
         )
 
     # At this point, we know that every patient UUID in alerts_data is unique, and
     # has a corresponding entry in the database.
 
+    patients_by_uuid: Dict[str, Patient] = {p.uuid: p for p in patients}
+    alerts_now: Dict[percentages_alerting.AlertKey, bool] = {}
     for patient_uuid, alerts_status in alerts_data.items():
         logger.info("Processing percentages alerts for patient %s", patient_uuid)
-        patient = next(p for p in patients if p.uuid == patient_uuid)
+        patient = patients_by_uuid[patient_uuid]
         current_red_alert: bool = alerts_status["red_alert"]
         current_amber_alert: bool = alerts_status["amber_alert"]
         if percentages_alerting.is_patient_in_snooze_period(patient):
@@ -827,33 +1497,91 @@ def process_percentages_alerts(alerts_data: Dict) -> None:
             patient.current_amber_alert = current_amber_alert
 
         # Update alert records for this patient (regardless of snooze status).
-        percentages_alerting.update_alerts_for_patient(
-            patient=patient,
-            alert_type=PatientAlert.AlertType.PERCENTAGES_RED,
-            alert_now=current_red_alert,
-        )
-        percentages_alerting.update_alerts_for_patient(
-            patient=patient,
-            alert_type=PatientAlert.AlertType.PERCENTAGES_AMBER,
-            alert_now=current_amber_alert,
-        )
-
+        alerts_now[
+            (patient_uuid, PatientAlert.AlertType.PERCENTAGES_RED)
+        ] = current_red_alert
+        alerts_now[
+            (patient_uuid, PatientAlert.AlertType.PERCENTAGES_AMBER)
+        ] = current_amber_alert
+
+    percentages_alerting.reconcile_alerts(alerts_now=alerts_now)
+    _invalidate_patient_cache(patients_by_uuid)
     db.session.commit()
     logger.debug(
         "Finished processing percentages alerts for %d patients", len(alerts_data)
     )
 
 
+def calculate_percentages_alerts(window_days: Optional[int] = None) -> Dict[str, Dict]:
+    """
+    Works out the "percentages" alerts for every patient with readings in the last
+    window_days days (by default, as per trustomer), from the percentage of their readings
+    that are out of threshold, then processes them as per process_percentages_alerts.
+    Patients with active percentages alerts and no readings in that time have them ended.
+    Returns the alert statuses processed, keyed by patient UUID. Nothing is processed if
+    trustomer is missing thresholds for any prandial tag.
+    """
+    # Abort if the alerts system is "counts".
+    alerts_system: AlertsSystem = trustomer.get_alerts_system()
+    if alerts_system == AlertsSystem.COUNTS:
+        logger.info(
+            "Calculate percentages alerts ignored: alerts system is '%s'",
+            alerts_system.value,
+        )
+        return {}
+
+    config: trustomer.PercentagesAlertsConfig = (
+        trustomer.get_percentages_alerts_config()
+    )
+    if window_days is None:
+        window_days = config["window_days"]
+
+    # Without thresholds, readings would count as in range, and so every active
+    # percentages alert would be ended.
+    thresholds: Dict[
+        str, trustomer.TrustomerThreshold
+    ] = trustomer.get_blood_glucose_thresholds()
+    missing_thresholds: List[str] = percentages.get_prandial_tags_without_thresholds(
+        thresholds, dimensions.get_prandial_tag_uuids()
+    )
+    if missing_thresholds:
+        logger.error(
+            "Calculate percentages alerts aborted: no blood glucose thresholds for %s",
+            ", ".join(missing_thresholds),
+        )
+        return {}
+
+    logger.info("Calculating percentages alerts over %d days", window_days)
+    counts: Dict[
+        str, percentages.OutOfThresholdCounts
+    ] = percentages.get_out_of_threshold_counts(
+        since=datetime.utcnow() - timedelta(days=window_days),
+        thresholds=thresholds,
+    )
+
+    alerts_data: Dict[str, Dict] = {
+        patient_id: {"red_alert": False, "amber_alert": False}
+        for patient_id in percentages_alerting.get_patients_with_active_alerts()
+    }
+    for patient_id, patient_counts in counts.items():
+        red_alert: bool = patient_counts.percentage >= config["red_percentage"]
+        alerts_data[patient_id] = {
+            "red_alert": red_alert,
+            "amber_alert": not red_alert
+            and patient_counts.percentage >= config["amber_percentage"],
+        }
+
+    if alerts_data:
+        process_percentages_alerts(alerts_data=alerts_data)
+    return alerts_data
+
+
 def create_hba1c_reading(patient_uuid: str, reading_data: Dict) -> Dict:
     logger.debug("Creating a Hba1c reading for patient with UUID %s", patient_uuid)
     hba1c_reading: Dict = schema.post(json_in=reading_data, **Hba1cReading.schema())
 
     # Create associated Patient, if not there
-    patient = Patient.query.get(patient_uuid)
-    if not patient:
-        patient = Patient(uuid=patient_uuid)
-        db.session.add(patient)
-        db.session.flush()
+    upsert.ensure_patient(patient_uuid)
     logger.debug("Preparing to create a new Hba1c reading record")
 
     measured_timestamp = parse_iso8601_to_datetime(reading_data["measured_timestamp"])
@@ -931,11 +1659,7 @@ def delete_hba1c_reading(patient_uuid: str, hba1c_reading_uuid: str) -> Dict:
 def create_hba1c_target(patient_uuid: str, target_data: Dict) -> Dict:
     logger.debug("Creating a Hba1c target for patient with UUID %s", patient_uuid)
     # Create associated Patient, if not there
-    patient = Patient.query.get(patient_uuid)
-    if not patient:
-        patient = Patient(uuid=patient_uuid)
-        db.session.add(patient)
-        db.session.flush()
+    upsert.ensure_patient(patient_uuid)
     target_timestamp: datetime = parse_iso8601_to_datetime_typesafe(
         target_data["target_timestamp"]
     )
@@ -1,16 +1,34 @@
+import heapq
 from datetime import datetime
-from typing import Dict, List, Optional, Tuple
+from typing import (
+    Any,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+    Type,
+    Union,
+)
 
-from flask_batteries_included.sqldb import generate_uuid
+from flask_batteries_included.helpers.timestamp import join_timestamp
+from flask_batteries_included.sqldb import db, generate_uuid
 from she_logging import logger
+from sqlalchemy import Column, and_, case, or_, select, tuple_
 from sqlalchemy.sql.expression import false
+from sqlalchemy.sql.selectable import Select
 
 from gdm_bg_readings_api.blueprint_api.publish import publish_patient_alert
 from gdm_bg_readings_api.models.amber_alert import AmberAlert
+from gdm_bg_readings_api.models.counts_alert_run import CountsAlertRun
 from gdm_bg_readings_api.models.patient import Patient
 from gdm_bg_readings_api.models.patient_alert import PatientAlert
 from gdm_bg_readings_api.models.reading import Reading
 from gdm_bg_readings_api.models.red_alert import RedAlert
+from gdm_bg_readings_api.query import counts_alert_run
+from gdm_bg_readings_api.query.upsert import PatientSnoozePeriod, identifier_values
 from gdm_bg_readings_api.utils.datetime_utils import (
     calculate_last_midnight,
     calculate_midnight_plus_days,
@@ -18,9 +36,18 @@ from gdm_bg_readings_api.utils.datetime_utils import (
 
 MIN_ABNORMAL_READINGS_FOR_COUNTS_ALERT: int = 3
 OFFSET: int = MIN_ABNORMAL_READINGS_FOR_COUNTS_ALERT - 1
+NORMAL_BANDING_ID = "BG-READING-BANDING-NORMAL"
+
+
+class CountsAlertDecision(NamedTuple):
+    # UUIDs of the readings that should be given amber and red alerts respectively.
+    amber_reading_ids: List[str]
+    red_reading_ids: List[str]
 
 
-def is_reading_in_snooze_period(reading: Reading, patient: Patient) -> bool:
+def is_reading_in_snooze_period(
+    reading: Reading, patient: Union[Patient, PatientSnoozePeriod]
+) -> bool:
     logger.debug("Checking if reading is in snooze period")
 
     if not patient.suppress_reading_alerts_from:
@@ -58,12 +85,32 @@ def reading_could_trigger_alert(reading: Reading) -> bool:
 
 def get_alertable_readings(reading: Reading) -> Dict:
     logger.debug("Getting alertable readings")
+    run: Optional[CountsAlertRun] = counts_alert_run.get_run(
+        patient_id=reading.patient_id, prandial_tag_id=reading.prandial_tag_id
+    )
+    if run is not None and run.last_reading_id == reading.uuid:
+        # The reading is the latest with its prandial tag, so it is checked along with
+        # the readings before it, which the run already covers.
+        return _get_run_abnormal_readings(run)
+    logger.debug("Reading is not the latest for its prandial tag")
     past_readings, future_readings = _get_surrounding_readings(reading)
     readings_to_check = past_readings + [reading] + future_readings
     return _get_sequential_abnormal_readings(readings_to_check)
 
 
 def process_amber_alertable_readings(reading: Reading) -> Reading:
+    triggering_readings: List[Reading] = get_amber_alertable_readings(reading)
+    if triggering_readings:
+        add_amber_alerts(reading, triggering_readings)
+    return reading
+
+
+def get_amber_alertable_readings(reading: Reading) -> List[Reading]:
+    """
+    Returns the readings that should be given amber alerts as a result of the given
+    reading, querying for each step. evaluate_counts_alerts makes the same decision from
+    a single pass over the patient's readings.
+    """
     # get readings for last 2 calendar days with readings
     start_date, end_date = _get_last_two_reading_calendar_days(reading)
     logger.debug(
@@ -75,7 +122,7 @@ def process_amber_alertable_readings(reading: Reading) -> Reading:
     current_time: datetime = reading.get_measured_timestamp()
     if start_date > current_time or end_date < current_time:
         logger.debug("Current reading is not in last two days")
-        return reading
+        return []
 
     # check for 2 or more readings
     readings: List[Reading] = (
@@ -89,23 +136,26 @@ def process_amber_alertable_readings(reading: Reading) -> Reading:
     )
     triggering_readings = [r for r in readings if reading_could_trigger_alert(r)]
 
-    # if two or more readings have abnormal values mark all abnormal readings
-    # as amber alerts
+    # if two or more readings have abnormal values, all abnormal readings get alerts
     if len(triggering_readings) > 1:
-        for tr in triggering_readings:
-            logger.debug("Adding amber alert to reading %s", tr.uuid)
-            add_amber_alert_to_reading(tr)
+        return triggering_readings
+    return []
 
-        logger.debug("Setting amber alert for patient %s", reading.patient.uuid)
-        reading.patient.current_amber_alert = True
 
-        logger.debug("Publishing amber alert message for reading %s", reading.uuid)
-        publish_patient_alert(
-            patient_uuid=reading.patient_id,
-            alert_type=PatientAlert.AlertType.COUNTS_AMBER,
-        )
+def add_amber_alerts(reading: Reading, triggering_readings: List[Reading]) -> None:
+    """Marks the triggering readings, and the reading's patient, with amber alerts."""
+    for tr in triggering_readings:
+        logger.debug("Adding amber alert to reading %s", tr.uuid)
+        add_amber_alert_to_reading(tr)
 
-    return reading
+    logger.debug("Setting amber alert for patient %s", reading.patient.uuid)
+    reading.patient.current_amber_alert = True
+
+    logger.debug("Publishing amber alert message for reading %s", reading.uuid)
+    publish_patient_alert(
+        patient_uuid=reading.patient_id,
+        alert_type=PatientAlert.AlertType.COUNTS_AMBER,
+    )
 
 
 def _get_last_two_reading_calendar_days(reading: Reading) -> Tuple[datetime, datetime]:
@@ -143,16 +193,44 @@ def _get_sequential_abnormal_readings(readings_to_check: List[Reading]) -> Dict:
     alertable: List[bool] = [
         reading_could_trigger_red_alert(r) for r in readings_to_check
     ]
-    to_alert = {}
-    num_readings_to_check = len(readings_to_check)
+    return {i: readings_to_check[i] for i in _sequential_alert_indices(alertable)}
+
+
+def _get_run_abnormal_readings(run: CountsAlertRun) -> Dict:
+    """
+    Returns the readings in the run which trigger an alert, as per
+    _get_sequential_abnormal_readings for the run's latest reading. The readings are
+    only loaded if there are enough of them in a row to trigger an alert.
+    """
+    run_reading_ids: List[str] = _run_alert_reading_ids(
+        run.run_length, run.run_reading_ids
+    )
+    if not run_reading_ids:
+        return {}
+    readings: Dict[str, Reading] = {
+        r.uuid: r for r in Reading.query.filter(Reading.uuid.in_(run_reading_ids))
+    }
+    return {i: readings[uuid] for i, uuid in enumerate(run_reading_ids)}
+
+
+def _run_alert_reading_ids(run_length: int, run_reading_ids: List[str]) -> List[str]:
+    # The latest reading has no readings after it, so it is only alerted along with the
+    # two before it, which is when the run is long enough.
+    if run_length < MIN_ABNORMAL_READINGS_FOR_COUNTS_ALERT:
+        return []
+    return run_reading_ids[:MIN_ABNORMAL_READINGS_FOR_COUNTS_ALERT]
+
+
+def _sequential_alert_indices(alertable: List[bool]) -> List[int]:
+    to_alert: Set[int] = set()
+    num_readings_to_check = len(alertable)
     if num_readings_to_check >= MIN_ABNORMAL_READINGS_FOR_COUNTS_ALERT:
-        adj_num_readings_to_check = len(readings_to_check) - OFFSET
+        adj_num_readings_to_check = num_readings_to_check - OFFSET
         for i in range(0, adj_num_readings_to_check):
             if not _is_sequential_block_true(i, num_readings_to_check, alertable):
                 break
-            for j in range(i, num_readings_to_check):
-                to_alert[j] = readings_to_check[j]
-    return to_alert
+            to_alert.update(range(i, num_readings_to_check))
+    return sorted(to_alert)
 
 
 def _is_sequential_block_true(
@@ -191,6 +269,221 @@ def _get_surrounding_readings(reading: Reading) -> Tuple[List[Reading], List[Rea
     return future_readings, past_readings
 
 
+def evaluate_counts_alerts(reading: Reading) -> CountsAlertDecision:
+    """
+    Decides which readings should be given amber and red alerts as a result of the given
+    reading, making the same decisions as get_amber_alertable_readings and
+    get_alertable_readings. If the reading is the latest with its prandial tag, the red
+    alert decision comes from its counts alert run, which is loaded along with the
+    reading; otherwise its neighbours under the same prandial tag are looked up. The
+    patient's other readings are then read latest first, only as many as are needed to
+    cover the last two calendar days with readings.
+    """
+    return evaluate_counts_alerts_for_readings(
+        patient_id=reading.patient_id, reading_ids={reading.uuid}
+    )
+
+
+def evaluate_counts_alerts_for_readings(
+    patient_id: str, reading_ids: Set[str]
+) -> CountsAlertDecision:
+    """
+    As evaluate_counts_alerts, for several of a patient's readings at once. The decision
+    covers every reading that evaluating each of them in turn would give alerts to.
+    """
+    targets: List[Any] = db.session.execute(
+        _target_readings_query(patient_id, reading_ids)
+    ).all()
+    if not targets:
+        return CountsAlertDecision(amber_reading_ids=[], red_reading_ids=[])
+
+    red_reading_ids: Dict[str, None] = {}
+    for target in targets:
+        red_reading_ids.update(
+            dict.fromkeys(_red_alert_reading_ids(patient_id, target))
+        )
+
+    result = db.session.execute(
+        _other_readings_query(patient_id, reading_ids).execution_options(
+            stream_results=True
+        )
+    )
+    try:
+        amber_reading_ids: List[str] = _amber_alert_reading_ids(targets, iter(result))
+    finally:
+        result.close()
+    return CountsAlertDecision(
+        amber_reading_ids=amber_reading_ids, red_reading_ids=list(red_reading_ids)
+    )
+
+
+# As per reading_could_trigger_alert and reading_could_trigger_red_alert.
+_could_trigger_alert = and_(
+    Reading.snoozed == false(),
+    or_(
+        Reading.reading_banding_id.is_(None),
+        Reading.reading_banding_id != NORMAL_BANDING_ID,
+    ),
+)
+_could_trigger_red_alert = case(
+    (
+        and_(
+            _could_trigger_alert,
+            or_(RedAlert.dismissed.is_(None), RedAlert.dismissed == false()),
+        ),
+        True,
+    ),
+    else_=False,
+)
+
+
+def _target_readings_query(patient_id: str, reading_ids: Set[str]) -> Select:
+    # The readings being evaluated, latest first, each with the run for its prandial tag.
+    return (
+        select(
+            Reading.uuid,
+            Reading.measured_timestamp,
+            Reading.measured_timezone,
+            Reading.prandial_tag_id,
+            case((_could_trigger_alert, True), else_=False).label(
+                "could_trigger_alert"
+            ),
+            _could_trigger_red_alert.label("could_trigger_red_alert"),
+            CountsAlertRun.last_reading_id.label("run_last_reading_id"),
+            CountsAlertRun.run_length,
+            CountsAlertRun.run_reading_ids,
+        )
+        .outerjoin(RedAlert, RedAlert.uuid == Reading.red_alert_id)
+        .outerjoin(
+            CountsAlertRun,
+            and_(
+                CountsAlertRun.patient_id == Reading.patient_id,
+                CountsAlertRun.prandial_tag_id == Reading.prandial_tag_id,
+            ),
+        )
+        .where(Reading.patient_id == patient_id, Reading.uuid.in_(reading_ids))
+        .order_by(Reading.measured_timestamp.desc(), Reading.uuid.desc())
+    )
+
+
+def _neighbours_query(patient_id: str, target: Any, following: bool) -> Select:
+    # Up to OFFSET readings either side of the target with the same prandial tag, nearest
+    # first, in the (measured_timestamp, uuid) order that the runs are kept in.
+    keyset = tuple_(Reading.measured_timestamp, Reading.uuid)
+    target_keyset = tuple_(target.measured_timestamp, target.uuid)
+    if following:
+        after_target = keyset > target_keyset
+        order_by = (Reading.measured_timestamp.asc(), Reading.uuid.asc())
+    else:
+        after_target = keyset < target_keyset
+        order_by = (Reading.measured_timestamp.desc(), Reading.uuid.desc())
+    return (
+        select(Reading.uuid, _could_trigger_red_alert.label("could_trigger_red_alert"))
+        .outerjoin(RedAlert, RedAlert.uuid == Reading.red_alert_id)
+        .where(
+            Reading.patient_id == patient_id,
+            Reading.prandial_tag_id == target.prandial_tag_id,
+            after_target,
+        )
+        .order_by(*order_by)
+        .limit(OFFSET)
+    )
+
+
+def _other_readings_query(patient_id: str, reading_ids: Set[str]) -> Select:
+    # The patient's readings other than those being evaluated, latest first.
+    return (
+        select(
+            Reading.uuid,
+            Reading.measured_timestamp,
+            Reading.measured_timezone,
+            case((_could_trigger_alert, True), else_=False).label(
+                "could_trigger_alert"
+            ),
+        )
+        .where(Reading.patient_id == patient_id, Reading.uuid.notin_(reading_ids))
+        .order_by(Reading.measured_timestamp.desc(), Reading.uuid.desc())
+    )
+
+
+def _red_alert_reading_ids(patient_id: str, target: Any) -> List[str]:
+    if target.run_last_reading_id == target.uuid:
+        # The reading is the latest with its prandial tag, so its run covers the
+        # readings it is checked along with.
+        return _run_alert_reading_ids(target.run_length, target.run_reading_ids)
+
+    # In the same order as get_alertable_readings checks them: the following readings
+    # (earliest first), the reading itself, then the preceding readings (latest first).
+    readings_to_check: List[Tuple[str, bool]] = [
+        *(
+            (row.uuid, bool(row.could_trigger_red_alert))
+            for row in db.session.execute(
+                _neighbours_query(patient_id, target, following=True)
+            )
+        ),
+        (target.uuid, bool(target.could_trigger_red_alert)),
+        *(
+            (row.uuid, bool(row.could_trigger_red_alert))
+            for row in db.session.execute(
+                _neighbours_query(patient_id, target, following=False)
+            )
+        ),
+    ]
+    return [
+        readings_to_check[i][0]
+        for i in _sequential_alert_indices([c for _, c in readings_to_check])
+    ]
+
+
+def _measured_at(row: Any) -> datetime:
+    return join_timestamp(row.measured_timestamp, row.measured_timezone)
+
+
+def _measured_order_key(row: Any) -> Tuple[datetime, str]:
+    return row.measured_timestamp, row.uuid
+
+
+def _amber_alert_reading_ids(targets: List[Any], others: Iterator[Any]) -> List[str]:
+    # As per get_amber_alertable_readings: the window runs from the start of the
+    # (server's) calendar day before the latest reading's day on which there were
+    # readings, to the end of the latest reading's day. The targets and the other
+    # readings both come latest first, so they are merged into a single sequence.
+    readings: Iterator[Any] = iter(
+        heapq.merge(targets, others, key=_measured_order_key, reverse=True)
+    )
+    latest: Any = next(readings)
+    midnight: datetime = calculate_last_midnight(base=_measured_at(latest))
+    end_date: datetime = calculate_midnight_plus_days(
+        base=_measured_at(latest), offset=1
+    )
+    start_date: datetime = midnight
+
+    in_window: List[Any] = [latest]
+    found_previous_day: bool = False
+    for row in readings:
+        measured_at: datetime = _measured_at(row)
+        if not found_previous_day and measured_at < midnight:
+            # The latest reading before the latest reading's day sets the window start.
+            start_date = calculate_last_midnight(base=measured_at)
+            found_previous_day = True
+        if found_previous_day and measured_at <= start_date:
+            break
+        in_window.append(row)
+
+    if not any(start_date <= _measured_at(t) <= end_date for t in targets):
+        logger.debug("Current reading is not in last two days")
+        return []
+
+    triggering_reading_ids: List[str] = [
+        row.uuid
+        for row in in_window
+        if row.could_trigger_alert and start_date < _measured_at(row) < end_date
+    ]
+    if len(triggering_reading_ids) > 1:
+        return triggering_reading_ids
+    return []
+
+
 def add_red_alert_to_reading(reading: Reading) -> Reading:
     reading.red_alert = RedAlert(uuid=generate_uuid(), dismissed=False)
     return reading
@@ -202,21 +495,42 @@ def add_amber_alert_to_reading(reading: Reading) -> Reading:
 
 
 def dismiss_active_alerts_for_patient(patient_id: str) -> None:
-    readings_with_alerts: List[Reading] = Reading.query.filter(
-        (
-            (Reading.red_alert_id.isnot(None))
-            & (Reading.red_alert.has(dismissed=false()))
-            & (Reading.patient_id == patient_id)
-        )
-        | (
-            (Reading.amber_alert_id.isnot(None))
-            & (Reading.amber_alert.has(dismissed=false()))
-            & (Reading.patient_id == patient_id)
+    dismiss_active_alerts_for_patients(patient_ids=[patient_id])
+
+
+def dismiss_active_alerts_for_patients(patient_ids: List[str]) -> None:
+    """
+    Dismisses the undismissed red and amber alerts on the given patients' readings, with
+    one UPDATE for each alert table. The session is kept in step using RETURNING where
+    the database supports it. If any red alerts were dismissed, the patients' counts
+    alert runs are worked out again, as those readings can no longer trigger one.
+    """
+    audit_values: Dict[str, Any] = identifier_values()
+    dismissed_counts: Dict[str, int] = {}
+    alert_models: List[Tuple[Type[Union[RedAlert, AmberAlert]], Column]] = [
+        (RedAlert, Reading.red_alert_id),
+        (AmberAlert, Reading.amber_alert_id),
+    ]
+    for alert_model, alert_id_column in alert_models:
+        dismissed_counts[alert_model.__tablename__] = alert_model.query.filter(
+            alert_model.dismissed == false(),
+            alert_model.uuid.in_(
+                select(alert_id_column).where(Reading.patient_id.in_(patient_ids))
+            ),
+        ).update(
+            {
+                "dismissed": True,
+                "modified": audit_values["modified"],
+                "modified_by_": audit_values["modified_by_"],
+            },
+            synchronize_session="fetch",
         )
-    ).all()
-    for reading in readings_with_alerts:
-        logger.debug("Clearing counts alerts for reading with UUID %s", reading.uuid)
-        if reading.red_alert_id:
-            reading.red_alert.dismissed = True
-        if reading.amber_alert_id:
-            reading.amber_alert.dismissed = True
+    logger.debug(
+        "Dismissed counts alerts for %d patients",
+        len(patient_ids),
+        extra=dismissed_counts,
+    )
+
+    # Readings with dismissed red alerts can't trigger another, which ends their runs.
+    if dismissed_counts[RedAlert.__tablename__]:
+        counts_alert_run.refresh_patients(patient_ids)
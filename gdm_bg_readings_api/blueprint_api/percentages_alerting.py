@@ -1,13 +1,27 @@
+from collections import defaultdict
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, NamedTuple, Optional, Set, Tuple
 
 from flask_batteries_included.helpers.timestamp import parse_iso8601_to_datetime
 from flask_batteries_included.sqldb import db, generate_uuid
 from she_logging import logger
+from sqlalchemy import insert, update
 
-from gdm_bg_readings_api.blueprint_api.publish import publish_patient_alert
+from gdm_bg_readings_api.blueprint_api.publish import (
+    publish_patient_alert,
+    publish_patient_alerts,
+)
 from gdm_bg_readings_api.models.patient import Patient
 from gdm_bg_readings_api.models.patient_alert import PatientAlert
+from gdm_bg_readings_api.query.upsert import identifier_values
+
+# (patient UUID, alert type)
+AlertKey = Tuple[str, PatientAlert.AlertType]
+
+
+class _ParsedPlan(NamedTuple):
+    created: Optional[datetime]
+    readings_per_week: int
 
 
 def is_patient_in_snooze_period(patient: Patient) -> bool:
@@ -69,20 +83,129 @@ def update_alerts_for_patient(
             existing_alert.ended_at = time_now
 
 
+def reconcile_alerts(alerts_now: Dict[AlertKey, bool]) -> None:
+    """
+    Updates the alert records for many patients and alert types at once, as per
+    update_alerts_for_patient for each of them. The active alerts for all of them are
+    loaded in one query, then new alerts are started with one INSERT, active alerts that
+    have stopped are ended with one UPDATE, and the new alerts are published together.
+    :param alerts_now: Whether each alert is active as of now, by patient and alert type
+    """
+    if not alerts_now:
+        return
+    logger.debug("Reconciling %d patient alert statuses", len(alerts_now))
+    time_now: datetime = datetime.now()
+    patient_ids: Set[str] = {patient_id for patient_id, _ in alerts_now}
+    alert_types: Set[PatientAlert.AlertType] = {
+        alert_type for _, alert_type in alerts_now
+    }
+
+    existing_alert_ids: Dict[AlertKey, List[str]] = defaultdict(list)
+    for alert_id, patient_id, alert_type in db.session.query(
+        PatientAlert.uuid, PatientAlert.patient_id, PatientAlert.alert_type
+    ).filter(
+        PatientAlert.patient_id.in_(patient_ids),
+        PatientAlert.alert_type.in_(alert_types),
+        PatientAlert.ended_at.is_(None),
+    ):
+        existing_alert_ids[(patient_id, alert_type)].append(alert_id)
+
+    alerts_to_start: List[AlertKey] = []
+    alert_ids_to_end: List[str] = []
+    for key, alert_now in alerts_now.items():
+        if alert_now:
+            # Create alert if there isn't already one.
+            if not existing_alert_ids.get(key):
+                alerts_to_start.append(key)
+        else:
+            # Clear any existing alerts.
+            alert_ids_to_end.extend(existing_alert_ids.get(key, []))
+    logger.debug(
+        "Starting %d and ending %d patient alerts",
+        len(alerts_to_start),
+        len(alert_ids_to_end),
+    )
+
+    audit_values: Dict[str, Any] = identifier_values()
+    if alerts_to_start:
+        db.session.execute(
+            insert(PatientAlert.__table__).values(
+                [
+                    {
+                        "uuid": generate_uuid(),
+                        **audit_values,
+                        "started_at": time_now,
+                        "alert_type": alert_type,
+                        "patient_id": patient_id,
+                    }
+                    for patient_id, alert_type in alerts_to_start
+                ]
+            )
+        )
+        publish_patient_alerts(alerts=alerts_to_start)
+    if alert_ids_to_end:
+        db.session.execute(
+            update(PatientAlert.__table__)
+            .where(PatientAlert.uuid.in_(alert_ids_to_end))
+            .values(
+                ended_at=time_now,
+                modified=audit_values["modified"],
+                modified_by_=audit_values["modified_by_"],
+            )
+        )
+
+
+def get_patients_with_active_alerts() -> Set[str]:
+    """Returns the UUIDs of the patients with active red or amber percentages alerts."""
+    return {
+        patient_id
+        for (patient_id,) in db.session.query(PatientAlert.patient_id)
+        .filter(
+            PatientAlert.alert_type.in_(
+                [
+                    PatientAlert.AlertType.PERCENTAGES_RED,
+                    PatientAlert.AlertType.PERCENTAGES_AMBER,
+                ]
+            ),
+            PatientAlert.ended_at.is_(None),
+        )
+        .distinct()
+    }
+
+
 def dismiss_active_alerts_for_patient(patient_id: str) -> None:
+    dismiss_active_alerts_for_patients(patient_ids=[patient_id])
+
+
+def dismiss_active_alerts_for_patients(patient_ids: List[str]) -> None:
+    """
+    Dismisses the given patients' active red and amber percentages alerts with a single
+    UPDATE. The session is kept in step using RETURNING where the database supports it.
+    """
     # We only dismiss red/amber percentages alerts, not activity alerts.
-    logger.debug("Dismissing active percentages alerts for patient %s", patient_id)
-    time_now: datetime = datetime.now()
-    existing_active_alerts: List[PatientAlert] = PatientAlert.query.filter_by(
-        patient_id=patient_id, ended_at=None
-    ).all()
-    for a in existing_active_alerts:
-        if (
-            a.alert_type == PatientAlert.AlertType.PERCENTAGES_RED
-            or a.alert_type == PatientAlert.AlertType.PERCENTAGES_AMBER
-        ):
-            logger.debug("Marking alert %s as dismissed", a.uuid)
-            a.dismissed_at = time_now
+    audit_values: Dict[str, Any] = identifier_values()
+    dismissed_count: int = PatientAlert.query.filter(
+        PatientAlert.patient_id.in_(patient_ids),
+        PatientAlert.ended_at.is_(None),
+        PatientAlert.alert_type.in_(
+            [
+                PatientAlert.AlertType.PERCENTAGES_RED,
+                PatientAlert.AlertType.PERCENTAGES_AMBER,
+            ]
+        ),
+    ).update(
+        {
+            "dismissed_at": datetime.now(),
+            "modified": audit_values["modified"],
+            "modified_by_": audit_values["modified_by_"],
+        },
+        synchronize_session="fetch",
+    )
+    logger.debug(
+        "Dismissed %d active percentages alerts for %d patients",
+        dismissed_count,
+        len(patient_ids),
+    )
 
 
 def calculate_expected_reading_count(
@@ -202,3 +325,71 @@ def _filter_unnecessary_plans(plans: List[Dict], start_date: datetime) -> List[D
             filtered_plans.append(this_plan)
 
     return filtered_plans
+
+
+def calculate_expected_reading_counts(
+    plans_by_patient: Dict[str, List[Dict]], start_date: datetime, end_date: datetime
+) -> Dict[str, float]:
+    """
+    Calculates the expected reading count for many patients at once, as per
+    calculate_expected_reading_count for each of them, given their readings plans keyed
+    by patient UUID. Each plan's created date is parsed only once, and nothing is logged
+    per plan. Returns the expected reading count for each patient, keyed by patient UUID.
+    """
+    expected_counts: Dict[str, float] = {
+        patient_id: _calculate_expected_reading_count_parsed(
+            _parse_plans(plans), start_date, end_date
+        )
+        for patient_id, plans in plans_by_patient.items()
+    }
+    logger.info("Expected readings calculated for %d patients", len(expected_counts))
+    return expected_counts
+
+
+def _parse_plans(plans: List[Dict]) -> List[_ParsedPlan]:
+    # Sorted by created date, as per calculate_expected_reading_count.
+    return [
+        _ParsedPlan(
+            created=parse_iso8601_to_datetime(plan["created"]),
+            readings_per_week=plan["days_per_week_to_take_readings"]
+            * plan["readings_per_day"],
+        )
+        for plan in sorted(plans, key=lambda x: x["created"])
+    ]
+
+
+def _calculate_expected_reading_count_parsed(
+    plans: List[_ParsedPlan], start_date: datetime, end_date: datetime
+) -> float:
+    if len(plans) == 0:
+        return 0
+
+    created_dates: List[datetime] = [
+        plan.created for plan in plans if plan.created is not None
+    ]
+    if len(plans) > 1 and len(created_dates) < len(plans):
+        logger.error("Plan has no created date")
+        raise ValueError
+
+    # Only the plans that affect this period, as per _filter_unnecessary_plans.
+    plans_in_force: List[_ParsedPlan] = [
+        plan
+        for plan, created, next_created in zip(plans, created_dates, created_dates[1:])
+        if created >= start_date or next_created >= start_date
+    ] + [plans[-1]]
+
+    # Each plan is in force from its created date (or the start date, for the first) up
+    # to the next plan's created date (or the end date, for the last).
+    boundaries: List[datetime] = [
+        start_date,
+        *(plan.created or start_date for plan in plans_in_force[1:]),
+        end_date,
+    ]
+
+    total_value: float = 0
+    total_weight: int = 0
+    for plan, plan_start, plan_end in zip(plans_in_force, boundaries, boundaries[1:]):
+        plan_duration: float = (plan_end - plan_start).total_seconds()
+        total_value += plan.readings_per_week * plan_duration
+        total_weight += int(plan_duration)
+    return total_value / total_weight
@@ -1,19 +1,55 @@
-from typing import Any, Dict
+import json
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Tuple, Union
 
-import kombu_batteries_included
+from flask_batteries_included.helpers import generate_uuid
+from flask_batteries_included.sqldb import db
 from she_logging import logger
+from she_logging.request_id import current_request_id
 
+from gdm_bg_readings_api.models.outbox_message import OutboxMessage
 from gdm_bg_readings_api.models.patient_alert import PatientAlert
 from gdm_bg_readings_api.models.reading import Reading
 
+# Messages are not published here; they are added to the outbox in the current
+# transaction and published by the outbox relay once that transaction has committed.
+# Callers must therefore call these functions before committing.
+
+
+def _json_default(o: Any) -> str:
+    # Matches the encoding used by kombu_batteries_included.publish_message.
+    if isinstance(o, datetime):
+        if o.tzinfo is None:
+            o = o.replace(tzinfo=timezone.utc)
+        return o.isoformat(timespec="milliseconds")
+    raise TypeError(f"Cannot encode {type(o)} to JSON")
+
+
+def _add_to_outbox(routing_key: str, body: Union[Dict, List]) -> None:
+    db.session.add(
+        OutboxMessage(
+            uuid=generate_uuid(),
+            routing_key=routing_key,
+            body=json.dumps(body, default=_json_default),
+            correlation_id=current_request_id(),
+            attempts=0,
+            next_attempt_at=datetime.utcnow(),
+        )
+    )
+
 
 # SCTID: 166922008 Blood glucose abnormal (finding)
 def publish_abnormal_reading(reading: Reading) -> None:
     reading_data: Dict = reading.to_dict()
     logger.debug("Publishing gdm.166922008 abnormal reading")
-    kombu_batteries_included.publish_message(
-        routing_key="gdm.166922008", body=reading_data
-    )
+    _add_to_outbox(routing_key="gdm.166922008", body=reading_data)
+
+
+def publish_abnormal_readings(readings_data: List[Dict]) -> None:
+    # Takes readings already converted to dicts.
+    logger.debug("Publishing %d gdm.166922008 abnormal readings", len(readings_data))
+    for reading_data in readings_data:
+        _add_to_outbox(routing_key="gdm.166922008", body=reading_data)
 
 
 # SCTID: 424167000 At risk for unstable blood glucose level (finding)
@@ -23,15 +59,25 @@ def publish_patient_alert(
     logger.debug(
         "Publishing gdm.424167000 patient alert for patient with UUID %s", patient_uuid
     )
-    kombu_batteries_included.publish_message(
+    _add_to_outbox(
         routing_key="gdm.424167000",
         body={"patient_uuid": patient_uuid, "alert_type": alert_type.value},
     )
 
 
+def publish_patient_alerts(alerts: List[Tuple[str, PatientAlert.AlertType]]) -> None:
+    # Takes (patient UUID, alert type) pairs.
+    logger.debug("Publishing %d gdm.424167000 patient alerts", len(alerts))
+    for patient_uuid, alert_type in alerts:
+        _add_to_outbox(
+            routing_key="gdm.424167000",
+            body={"patient_uuid": patient_uuid, "alert_type": alert_type.value},
+        )
+
+
 def publish_audit_message(event_type: str, event_data: Dict[str, Any]) -> None:
     logger.debug(f"Publishing dhos.34837004 audit message of type '{event_type}'")
-    kombu_batteries_included.publish_message(
+    _add_to_outbox(
         routing_key="dhos.34837004",
         body={"event_type": event_type, "event_data": event_data},
     )
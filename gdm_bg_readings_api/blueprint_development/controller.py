@@ -9,7 +9,10 @@ def reset_database() -> None:
     session.execute("TRUNCATE TABLE patient cascade")
     session.execute("TRUNCATE TABLE hba1c_reading cascade")
     session.execute("TRUNCATE TABLE dose")
+    session.execute("TRUNCATE TABLE counts_alert_run")
+    session.execute("TRUNCATE TABLE reading_daily_rollup")
     session.execute("TRUNCATE TABLE reading cascade")
     session.execute("TRUNCATE TABLE reading_metadata cascade")
+    session.execute("TRUNCATE TABLE outbox_message")
     session.commit()
     session.close()
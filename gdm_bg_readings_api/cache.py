@@ -0,0 +1,363 @@
+import hashlib
+import threading
+import time
+import uuid
+from collections import defaultdict
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    MutableMapping,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+)
+
+import redis
+from cachetools import LRUCache
+from flask import current_app, has_app_context, json
+from flask_batteries_included.sqldb import db
+from prometheus_client import Counter
+from she_logging import logger
+from sqlalchemy import event
+from sqlalchemy.orm import ORMExecuteState, Session
+from sqlalchemy.sql import visitors
+from sqlalchemy.sql.selectable import CTE
+
+from gdm_bg_readings_api import config
+
+# Cache of expensive lookups and computed responses, shared between this process's
+# threads and (when REDIS_INSTALLED is set) between all workers through Redis. Values
+# are kept in a namespace, whose generation is part of every key: invalidating the
+# namespace moves it on to a new generation, so every worker stops using the old
+# values at once. Values must be JSON serialisable; those served from Redis are as
+# decoded from JSON (e.g. with datetimes as ISO8601 strings).
+#
+# Values may also be kept in a scope within a namespace, e.g. a patient's UUID, which
+# has its own generation and so can be invalidated apart from the rest of the namespace.
+# Each scope should hold only a few values, as the local tier evicts whole scopes.
+# Without Redis, invalidating a scope only evicts it from this process's local tier.
+
+KEY_PREFIX = "gdm-bg-readings"
+
+# How long a worker computing a value holds the lock on it, and so how long other
+# workers wait for the value before computing it themselves.
+COMPUTE_LOCK_TIMEOUT_SEC = 10
+COMPUTE_LOCK_POLL_INTERVAL_SEC = 0.05
+
+# Threads in this process computing values with the same key take the same lock. Keys
+# share a fixed number of locks so they don't pile up as generations move on.
+COMPUTE_LOCK_STRIPES = 64
+
+# Scope generations in Redis expire once unused for this long, so they don't pile up.
+# Values in a scope are cached for no longer, so none are left from before the expiry.
+SCOPE_GENERATION_TTL_SEC = 24 * 60 * 60
+
+CACHE_LOOKUP_COUNT = Counter(
+    "gdm_cache_lookup_count",
+    "Cache lookups",
+    ["namespace", "result"],
+)
+
+T = TypeVar("T")
+
+
+class _LocalEntry(NamedTuple):
+    value: Any
+    generation: int
+    expires_at: float
+
+
+_lock = threading.Lock()
+_local: LRUCache = LRUCache(maxsize=config.Configuration().CACHE_LOCAL_MAXSIZE)
+_local_scopes: LRUCache = LRUCache(
+    maxsize=config.Configuration().CACHE_LOCAL_SCOPES_MAXSIZE
+)
+_compute_locks: List[threading.Lock] = [
+    threading.Lock() for _ in range(COMPUTE_LOCK_STRIPES)
+]
+_generations: Dict[str, int] = defaultdict(int)
+_redis_client: Optional[redis.Redis] = None
+
+
+def _get_redis() -> Optional[redis.Redis]:
+    global _redis_client
+    if not current_app.config["REDIS_INSTALLED"]:
+        return None
+    if _redis_client is None:
+        _redis_client = redis.Redis(
+            host=current_app.config["REDIS_HOST"],
+            port=current_app.config["REDIS_PORT"],
+            password=current_app.config["REDIS_PASSWORD"] or None,
+            socket_timeout=current_app.config["REDIS_TIMEOUT"],
+        )
+    return _redis_client
+
+
+def _redis_key(namespace: str, *parts: Any) -> str:
+    return ":".join([KEY_PREFIX, namespace, *map(str, parts)])
+
+
+def _namespace_key(namespace: str, scope: Optional[str]) -> str:
+    return namespace if scope is None else f"{namespace}:{scope}"
+
+
+def hash_key(values: Iterable[str]) -> str:
+    """Returns a short cache key for a collection of values, e.g. UUIDs."""
+    return hashlib.sha256(",".join(sorted(values)).encode()).hexdigest()
+
+
+def _get_generation(
+    client: Optional[redis.Redis], namespace: str, scope: Optional[str]
+) -> int:
+    if client is not None:
+        generation_key: str = _redis_key(_namespace_key(namespace, scope), "generation")
+        return int(client.get(generation_key) or 0)
+    # Without Redis, a scope is invalidated by evicting its values from the local tier.
+    return _generations[namespace] if scope is None else 0
+
+
+def _local_values(
+    namespace: str, scope: Optional[str]
+) -> MutableMapping[str, _LocalEntry]:
+    # The values are keyed by full key, or by key within a scope.
+    if scope is None:
+        return _local
+    with _lock:
+        values: Optional[Dict[str, _LocalEntry]] = _local_scopes.get((namespace, scope))
+        if values is None:
+            values = _local_scopes[(namespace, scope)] = {}
+        return values
+
+
+def _get_local(
+    values: MutableMapping[str, _LocalEntry], local_key: str, generation: int
+) -> Optional[_LocalEntry]:
+    with _lock:
+        entry: Optional[_LocalEntry] = values.get(local_key)
+    if (
+        entry is None
+        or entry.generation != generation
+        or entry.expires_at < time.monotonic()
+    ):
+        return None
+    return entry
+
+
+def _set_local(
+    values: MutableMapping[str, _LocalEntry],
+    local_key: str,
+    value: Any,
+    generation: int,
+    ttl: int,
+) -> None:
+    with _lock:
+        values[local_key] = _LocalEntry(
+            value=value, generation=generation, expires_at=time.monotonic() + ttl
+        )
+
+
+def _compute_lock(full_key: str) -> threading.Lock:
+    return _compute_locks[hash(full_key) % COMPUTE_LOCK_STRIPES]
+
+
+def _get_shared(
+    client: redis.Redis,
+    namespace: str,
+    full_key: str,
+    compute: Callable[[], T],
+    ttl: int,
+) -> T:
+    raw: Optional[bytes] = client.get(full_key)
+    if raw is not None:
+        CACHE_LOOKUP_COUNT.labels(namespace, "shared_hit").inc()
+        return json.loads(raw)
+
+    # Only one worker computes the value, while the others wait for it, rather than
+    # all of them going to the database at once. The lock holds a token
+    # unique to this worker, so that it only ever releases its own lock.
+    lock_key = f"{full_key}:lock"
+    lock_token = uuid.uuid4().hex
+    if not client.set(lock_key, lock_token, nx=True, ex=COMPUTE_LOCK_TIMEOUT_SEC):
+        deadline: float = time.monotonic() + COMPUTE_LOCK_TIMEOUT_SEC
+        while time.monotonic() < deadline:
+            time.sleep(COMPUTE_LOCK_POLL_INTERVAL_SEC)
+            raw = client.get(full_key)
+            if raw is not None:
+                CACHE_LOOKUP_COUNT.labels(namespace, "shared_hit").inc()
+                return json.loads(raw)
+        logger.warning("Timed out waiting for another worker to compute %s", full_key)
+
+    CACHE_LOOKUP_COUNT.labels(namespace, "miss").inc()
+    try:
+        value: T = compute()
+        client.set(full_key, json.dumps(value), ex=ttl)
+    finally:
+        # The lock isn't this worker's if it timed out waiting for it, or if computing
+        # the value outlasted the lock and another worker has since taken it.
+        if client.get(lock_key) == lock_token.encode():
+            client.delete(lock_key)
+    return value
+
+
+def get_or_compute(
+    namespace: str,
+    key: str,
+    compute: Callable[[], T],
+    ttl: int,
+    scope: Optional[str] = None,
+) -> T:
+    """
+    Returns the cached value for the key in the namespace (and scope, if given), or
+    computes and caches it for ttl seconds. Within a process, only one thread computes a
+    given value at a time, and likewise between workers when Redis is used. If Redis
+    can't be reached the value is computed without caching, so that an invalidation
+    can't be missed.
+    """
+    if ttl <= 0:
+        return compute()
+    if scope is not None:
+        ttl = min(ttl, SCOPE_GENERATION_TTL_SEC)
+    try:
+        client: Optional[redis.Redis] = _get_redis()
+        generation: int = _get_generation(client, namespace, scope)
+    except redis.RedisError:
+        logger.exception("Failed to get cache generation for %s", namespace)
+        CACHE_LOOKUP_COUNT.labels(namespace, "error").inc()
+        return compute()
+
+    # If the scope is invalidated while the value is computed, the value is stored with
+    # the scope's discarded values, so it can't bring back what the scope held before.
+    values: MutableMapping[str, _LocalEntry] = _local_values(namespace, scope)
+    full_key: str = _redis_key(_namespace_key(namespace, scope), generation, key)
+    local_key: str = full_key if scope is None else key
+    entry: Optional[_LocalEntry] = _get_local(values, local_key, generation)
+    if entry is not None:
+        CACHE_LOOKUP_COUNT.labels(namespace, "local_hit").inc()
+        return entry.value
+
+    with _compute_lock(full_key):
+        # Another thread may have computed it while this one waited for the lock.
+        entry = _get_local(values, local_key, generation)
+        if entry is not None:
+            CACHE_LOOKUP_COUNT.labels(namespace, "local_hit").inc()
+            return entry.value
+        if client is None:
+            CACHE_LOOKUP_COUNT.labels(namespace, "miss").inc()
+            value: T = compute()
+        else:
+            try:
+                value = _get_shared(client, namespace, full_key, compute, ttl)
+            except redis.RedisError:
+                logger.exception("Failed to get cached value for %s", full_key)
+                CACHE_LOOKUP_COUNT.labels(namespace, "error").inc()
+                return compute()
+        _set_local(values, local_key, value, generation, ttl)
+        return value
+
+
+def invalidate(namespace: str, scope: Optional[str] = None) -> None:
+    """
+    Discards every cached value in the namespace, or in the given scope within it, in
+    all workers. Values in scopes are only discarded with their scope.
+    """
+    namespace_key: str = _namespace_key(namespace, scope)
+    logger.debug("Invalidating cache namespace %s", namespace_key)
+    with _lock:
+        if scope is None:
+            _generations[namespace] += 1
+        else:
+            _local_scopes.pop((namespace, scope), None)
+    try:
+        client: Optional[redis.Redis] = _get_redis()
+        if client is not None:
+            generation_key: str = _redis_key(namespace_key, "generation")
+            client.incr(generation_key)
+            if scope is not None:
+                client.expire(generation_key, SCOPE_GENERATION_TTL_SEC)
+    except redis.RedisError:
+        logger.exception("Failed to invalidate cache namespace %s", namespace_key)
+
+
+def clear() -> None:
+    """Discards every value cached in this process."""
+    with _lock:
+        _local.clear()
+        _local_scopes.clear()
+
+
+# Namespaces to invalidate when each table is written to. Writes are noted as they are
+# flushed or executed, and the namespaces invalidated once they are committed. Writes
+# that are rolled back stay noted until the next commit, as invalidating a namespace
+# more often than needed is harmless.
+_namespaces_by_table: Dict[str, Set[str]] = defaultdict(set)
+_PENDING_INVALIDATIONS_KEY = "gdm_cache_pending_invalidations"
+
+# (namespace, scope)
+_PendingInvalidation = Tuple[str, Optional[str]]
+
+
+def invalidate_on_write(namespace: str, tables: Iterable[str]) -> None:
+    """Invalidates the namespace whenever any of the tables is written to."""
+    for table in tables:
+        _namespaces_by_table[table].add(namespace)
+
+
+def invalidate_on_commit(namespace: str, scope: Optional[str] = None) -> None:
+    """
+    Invalidates the namespace, or the given scope within it, once the current
+    transaction is committed, so that no worker can cache what it held before then.
+    """
+    _pending_invalidations(db.session).add((namespace, scope))
+
+
+def _pending_invalidations(session: Session) -> Set[_PendingInvalidation]:
+    return session.info.setdefault(_PENDING_INVALIDATIONS_KEY, set())
+
+
+def _note_write(session: Session, table: Optional[str]) -> None:
+    namespaces: Set[str] = _namespaces_by_table.get(table or "", set())
+    if namespaces:
+        _pending_invalidations(session).update(
+            (namespace, None) for namespace in namespaces
+        )
+
+
+def _after_flush(session: Session, flush_context: Any) -> None:
+    for instance in [*session.new, *session.dirty, *session.deleted]:
+        _note_write(session, getattr(instance, "__tablename__", None))
+
+
+def _do_orm_execute(orm_execute_state: ORMExecuteState) -> None:
+    if (
+        orm_execute_state.is_insert
+        or orm_execute_state.is_update
+        or orm_execute_state.is_delete
+    ):
+        table: Any = getattr(orm_execute_state.statement, "table", None)
+        _note_write(orm_execute_state.session, getattr(table, "name", None))
+    elif not orm_execute_state.is_orm_statement:
+        # Core statements may write from a CTE, e.g. the INSERT ... RETURNING wrapped in
+        # a SELECT used on PostgreSQL by query/upsert.py. ORM queries are only searched
+        # by the checks above, as walking every one of them would be costly.
+        for element in visitors.iterate(orm_execute_state.statement):
+            if isinstance(element, CTE) and getattr(element.element, "is_dml", False):
+                _note_write(orm_execute_state.session, element.element.table.name)
+
+
+def _after_commit(session: Session) -> None:
+    pending: Set[_PendingInvalidation] = session.info.pop(
+        _PENDING_INVALIDATIONS_KEY, set()
+    )
+    if pending and has_app_context():
+        for namespace, scope in pending:
+            invalidate(namespace, scope)
+
+
+event.listen(Session, "after_flush", _after_flush)
+event.listen(Session, "do_orm_execute", _do_orm_execute)
+event.listen(Session, "after_commit", _after_commit)
@@ -12,6 +12,35 @@ class Configuration:
     TRUSTOMER_CONFIG_CACHE_TTL_SEC: int = env.int(
         "TRUSTOMER_CONFIG_CACHE_TTL_SEC", 60 * 60  # Cache for 1 hour by default.
     )
+    TRUSTOMER_REQUEST_TIMEOUT_SEC: float = env.float(
+        "TRUSTOMER_REQUEST_TIMEOUT_SEC", 5.0
+    )
+    TRUSTOMER_REFRESH_MAX_BACKOFF_SEC: int = env.int(
+        "TRUSTOMER_REFRESH_MAX_BACKOFF_SEC", 300
+    )
+    DIMENSIONS_CACHE_TTL_SEC: int = env.int("DIMENSIONS_CACHE_TTL_SEC", 5 * 60)
+    CACHE_LOCAL_MAXSIZE: int = env.int("CACHE_LOCAL_MAXSIZE", 1024)
+    CACHE_LOCAL_SCOPES_MAXSIZE: int = env.int("CACHE_LOCAL_SCOPES_MAXSIZE", 256)
+    PATIENT_CACHE_TTL_SEC: int = env.int("PATIENT_CACHE_TTL_SEC", 5 * 60)
+    PATIENT_SUMMARY_CACHE_TTL_SEC: int = env.int("PATIENT_SUMMARY_CACHE_TTL_SEC", 60)
+    STATISTICS_CACHE_TTL_SEC: int = env.int("STATISTICS_CACHE_TTL_SEC", 60)
+    # Redis is shared by all workers, and used for caching when installed.
+    REDIS_INSTALLED: bool = env.bool("REDIS_INSTALLED", False)
+    REDIS_HOST: str = env.str("REDIS_HOST", "localhost")
+    REDIS_PORT: int = env.int("REDIS_PORT", 6379)
+    REDIS_PASSWORD: str = env.str("REDIS_PASSWORD", "")
+    REDIS_TIMEOUT: int = env.int("REDIS_TIMEOUT", 2)
+    # Messages are only published by an outbox relay. By default the API server runs one
+    # in process; set this to false where `flask relay-outbox` runs as its own process.
+    OUTBOX_RELAY_IN_PROCESS: bool = env.bool("OUTBOX_RELAY_IN_PROCESS", True)
+    OUTBOX_RELAY_BATCH_SIZE: int = env.int("OUTBOX_RELAY_BATCH_SIZE", 100)
+    OUTBOX_RELAY_POLL_INTERVAL_SEC: float = env.float(
+        "OUTBOX_RELAY_POLL_INTERVAL_SEC", 1.0
+    )
+    OUTBOX_RELAY_MAX_BACKOFF_SEC: int = env.int("OUTBOX_RELAY_MAX_BACKOFF_SEC", 300)
+    OUTBOX_RELAY_CONFIRM_PUBLISH: bool = env.bool("OUTBOX_RELAY_CONFIRM_PUBLISH", True)
+    # With backoff capped at 5 minutes, the default gives up after about 3.5 hours.
+    OUTBOX_MAX_ATTEMPTS: int = env.int("OUTBOX_MAX_ATTEMPTS", 50)
 
 
 def init_config(app: Flask) -> None:
@@ -0,0 +1,100 @@
+import threading
+import time
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from flask import current_app
+from sqlalchemy import event
+
+from gdm_bg_readings_api.models.prandial_tag import PrandialTag
+from gdm_bg_readings_api.models.reading_banding import ReadingBanding
+
+# In-process cache of the prandial tag and reading banding tables. These hold a handful
+# of rows of static reference data, so rather than querying or joining them for every
+# reading, they are loaded once and served from memory. The cache is reloaded after
+# DIMENSIONS_CACHE_TTL_SEC, and straight away when this process changes either table.
+
+
+class _Dimensions(NamedTuple):
+    version: int
+    loaded_at: float
+    prandial_tags: Dict[str, Dict]
+    prandial_tag_uuids_by_value: Dict[int, str]
+    reading_bandings: Dict[str, Dict]
+
+
+_lock = threading.Lock()
+_version: int = 0
+_dimensions: Optional[_Dimensions] = None
+
+
+def _load() -> _Dimensions:
+    global _version, _dimensions
+    with _lock:
+        prandial_tags = PrandialTag.query.order_by(PrandialTag.value).all()
+        reading_bandings = ReadingBanding.query.all()
+        _version += 1
+        _dimensions = _Dimensions(
+            version=_version,
+            loaded_at=time.monotonic(),
+            prandial_tags={t.uuid: t.to_dict() for t in prandial_tags},
+            # If two tags share a value, the first is used, as with a query by value.
+            prandial_tag_uuids_by_value={
+                t.value: t.uuid for t in reversed(prandial_tags)
+            },
+            reading_bandings={b.uuid: b.to_dict() for b in reading_bandings},
+        )
+        return _dimensions
+
+
+def _get() -> _Dimensions:
+    dimensions = _dimensions
+    ttl: int = current_app.config["DIMENSIONS_CACHE_TTL_SEC"]
+    if dimensions is None or time.monotonic() - dimensions.loaded_at > ttl:
+        dimensions = _load()
+    return dimensions
+
+
+def invalidate() -> None:
+    """Discards the cache, so that it is reloaded on next use."""
+    global _dimensions
+    _dimensions = None
+
+
+def version() -> int:
+    """Returns the version of the currently loaded dimensions."""
+    return _get().version
+
+
+def get_prandial_tag(uuid: str) -> Optional[Dict]:
+    """Returns the prandial tag with the given UUID, as per PrandialTag.to_dict."""
+    prandial_tag: Optional[Dict] = _get().prandial_tags.get(uuid)
+    return dict(prandial_tag) if prandial_tag is not None else None
+
+
+def get_prandial_tag_uuids() -> List[str]:
+    """Returns the UUIDs of every prandial tag."""
+    return list(_get().prandial_tags)
+
+
+def find_prandial_tag_uuid(value: int) -> Optional[str]:
+    """Returns the UUID of the prandial tag with the given value."""
+    return _get().prandial_tag_uuids_by_value.get(value)
+
+
+def has_prandial_tag(uuid: str) -> bool:
+    return uuid in _get().prandial_tags
+
+
+def get_reading_banding(uuid: str) -> Optional[Dict]:
+    """Returns the reading banding with the given UUID, as per ReadingBanding.to_dict."""
+    reading_banding: Optional[Dict] = _get().reading_bandings.get(uuid)
+    return dict(reading_banding) if reading_banding is not None else None
+
+
+def _on_change(*args: Any) -> None:
+    invalidate()
+
+
+for _model in (PrandialTag, ReadingBanding):
+    for _event_name in ("after_insert", "after_update", "after_delete"):
+        event.listen(_model, _event_name, _on_change)
@@ -1,9 +1,13 @@
+from typing import Optional, Tuple
+
 import click
 from flask import Flask
 from flask_batteries_included.helpers.apispec import generate_openapi_spec
 
-from gdm_bg_readings_api import blueprint_api
+from gdm_bg_readings_api import blueprint_api, outbox
+from gdm_bg_readings_api.blueprint_api import controller
 from gdm_bg_readings_api.models.api_spec import gdm_bg_readings_api_spec
+from gdm_bg_readings_api.query import counts_alert_run, daily_rollup
 
 
 def add_cli_command(app: Flask) -> None:
@@ -16,3 +20,46 @@ def add_cli_command(app: Flask) -> None:
             blueprint_api.api_blueprint,
             blueprint_api.api_blueprint_v1,
         )
+
+    @app.cli.command("relay-outbox")
+    @click.option(
+        "--once", is_flag=True, help="Exit once there are no messages left to publish."
+    )
+    def relay_outbox(once: bool) -> None:
+        """Publish messages from the outbox to RabbitMQ."""
+        outbox.run_relay(once=once)
+
+    @app.cli.command("backfill-daily-rollups")
+    @click.option(
+        "--patient-id",
+        "patient_ids",
+        multiple=True,
+        help="Only rebuild rollups for this patient (may be repeated).",
+    )
+    def backfill_daily_rollups(patient_ids: Tuple[str, ...]) -> None:
+        """Rebuild the daily reading rollups from stored readings."""
+        written = daily_rollup.rebuild(patient_ids=list(patient_ids) or None)
+        click.echo(f"Wrote {written} daily rollups")
+
+    @app.cli.command("backfill-counts-alert-runs")
+    @click.option(
+        "--patient-id",
+        "patient_ids",
+        multiple=True,
+        help="Only rebuild runs for this patient (may be repeated).",
+    )
+    def backfill_counts_alert_runs(patient_ids: Tuple[str, ...]) -> None:
+        """Rebuild the counts alert runs from stored readings."""
+        written = counts_alert_run.rebuild(patient_ids=list(patient_ids) or None)
+        click.echo(f"Wrote {written} counts alert runs")
+
+    @app.cli.command("process-percentages-alerts")
+    @click.option(
+        "--window-days",
+        type=int,
+        help="Days of readings to consider (defaults to the trustomer config).",
+    )
+    def process_percentages_alerts(window_days: Optional[int]) -> None:
+        """Calculate and process percentages alerts from stored readings."""
+        alerts_data = controller.calculate_percentages_alerts(window_days=window_days)
+        click.echo(f"Processed percentages alerts for {len(alerts_data)} patients")
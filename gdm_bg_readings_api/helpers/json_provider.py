@@ -0,0 +1,85 @@
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, Optional, Union
+
+import orjson
+from flask import Flask, Response
+from flask.json.provider import DefaultJSONProvider
+from flask_batteries_included.helpers.timestamp import (
+    parse_date_to_iso8601_typesafe,
+    parse_datetime_to_iso8601_typesafe,
+)
+
+_MINUTE = timedelta(minutes=1)
+
+
+def _encode_datetime(dt: datetime) -> str:
+    """
+    As parse_datetime_to_iso8601, without formatting the datetime three times over.
+    Years before 1000 and offsets with seconds are formatted differently by strftime,
+    so are left to parse_datetime_to_iso8601.
+    """
+    offset: Optional[timedelta] = dt.utcoffset()
+    if dt.year < 1000 or (offset is not None and offset % _MINUTE):
+        return parse_datetime_to_iso8601_typesafe(dt)
+    text: str = dt.isoformat(timespec="milliseconds")
+    if offset is not None and not offset:
+        return text[:-6] + "Z"
+    return text
+
+
+# Datetimes are passed through to these rather than left to orjson, so responses keep
+# the ISO8601 format (with milliseconds) given by flask_batteries_included's encoder.
+_ENCODERS: Dict[type, Callable[[Any], Any]] = {
+    datetime: _encode_datetime,
+    date: parse_date_to_iso8601_typesafe,
+}
+
+
+def _default(obj: Any) -> Any:
+    encoder = _ENCODERS.get(type(obj))
+    if encoder is not None:
+        return encoder(obj)
+    # Subclasses, e.g. those given by freezegun, are looked up the slow way.
+    if isinstance(obj, datetime):
+        return _encode_datetime(obj)
+    if isinstance(obj, date):
+        return parse_date_to_iso8601_typesafe(obj)
+    return DefaultJSONProvider.default(obj)
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    Serialises JSON with orjson, giving the same JSON as the default provider with
+    flask_batteries_included's encoder. Calls with keyword arguments for json.dumps or
+    json.loads are passed on to the default provider.
+    """
+
+    def _options(self) -> int:
+        options: int = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        return options
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=_default, option=self._options()).decode()
+
+    def loads(self, s: Union[str, bytes], **kwargs: Any) -> Any:
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args: Any, **kwargs: Any) -> Response:
+        obj: Any = self._prepare_response_obj(args, kwargs)
+        options: int = self._options()
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            options |= orjson.OPT_INDENT_2
+        return self._app.response_class(
+            orjson.dumps(obj, default=_default, option=options) + b"\n",
+            mimetype=self.mimetype,
+        )
+
+
+def init_json_provider(app: Flask) -> None:
+    app.json = OrjsonProvider(app)
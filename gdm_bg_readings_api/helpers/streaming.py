@@ -0,0 +1,31 @@
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
+
+from flask import json
+
+# Pieces of the response are joined until a chunk is at least this long, rather than
+# sending a chunk per item.
+CHUNK_SIZE = 64 * 1024
+
+
+def stream_json_object_of_lists(items: Iterable[Tuple[str, Any]]) -> Iterator[str]:
+    """
+    Encodes (key, value) pairs as a JSON object mapping each key to the list of its
+    values, yielding the JSON a chunk at a time. Pairs must be grouped by key.
+    """
+    parts: List[str] = ["{"]
+    size = 1
+    current_key: Optional[str] = None
+    for key, value in items:
+        if key != current_key:
+            part = "]," if current_key is not None else ""
+            part += json.dumps(key) + ":[" + json.dumps(value)
+            current_key = key
+        else:
+            part = "," + json.dumps(value)
+        parts.append(part)
+        size += len(part)
+        if size >= CHUNK_SIZE:
+            yield "".join(parts)
+            parts, size = [], 0
+    parts.append("]}" if current_key is not None else "}")
+    yield "".join(parts)
@@ -315,6 +315,31 @@ class ReadingResponse(Identifier, ReadingCommonFields):
     )
 
 
+@openapi_schema(gdm_bg_readings_api_spec)
+class ReadingBulkResult(Schema):
+    class Meta:
+        description = "Result of creating one reading in a batch"
+        unknown = EXCLUDE
+        ordered = True
+
+    status = fields.String(
+        required=True,
+        description="Outcome of creating the reading",
+        enum=["created", "duplicate", "invalid"],
+        example="created",
+    )
+    reading_id = fields.String(
+        required=False,
+        description="UUID of the created reading, or of the existing reading if this was a duplicate",
+        example="bfd1de2d-2a8d-464a-99bc-7c3fe8f881bc",
+    )
+    message = fields.String(
+        required=False,
+        description="Reason the reading was invalid",
+        example="invalid timestamp",
+    )
+
+
 @openapi_schema(gdm_bg_readings_api_spec)
 class ReadingUpdateRequest(Schema):
     class Meta:
@@ -569,9 +594,52 @@ class ReadingsPlansRequest(Schema):
 
 
 @openapi_schema(gdm_bg_readings_api_spec)
-class ReadingStatistics(Schema):
+class DailyReadingStatistics(Schema):
     class Meta:
-        description = "Reading statistics"
+        description = "Reading statistics for a day"
+        unknown = EXCLUDE
+        ordered = True
+
+    readings_count = fields.Integer(
+        required=True, description="Total number of readings", example=4
+    )
+    readings_count_banding_normal = fields.Integer(
+        required=True,
+        description="Total number of readings banded as normal",
+        example=3,
+    )
+    min_blood_glucose_value = fields.Float(
+        required=True, description="Minimum blood glucose value", example=4.5
+    )
+    max_blood_glucose_value = fields.Float(
+        required=True, description="Maximum blood glucose value", example=8.1
+    )
+
+
+@openapi_schema(gdm_bg_readings_api_spec)
+class DailyReadingSummary(DailyReadingStatistics):
+    class Meta:
+        description = "Daily reading summary"
+        unknown = EXCLUDE
+        ordered = True
+
+    date = fields.Date(
+        required=True,
+        description="Calendar day, local to where the readings were taken",
+        example="2020-08-18",
+    )
+    prandial_tags = fields.Dict(
+        keys=fields.String(),
+        values=fields.Nested(DailyReadingStatistics),
+        required=True,
+        description="Reading statistics for the day keyed by prandial tag UUID",
+    )
+
+
+@openapi_schema(gdm_bg_readings_api_spec)
+class ReadingStatisticsBase(Schema):
+    class Meta:
+        description = "Reading statistics for a set of readings"
         unknown = EXCLUDE
         ordered = True
 
@@ -587,3 +655,19 @@ class ReadingStatistics(Schema):
     readings_count_banding_normal = fields.Integer(
         required=True, description="Total number of readings banded as normal"
     )
+
+
+@openapi_schema(gdm_bg_readings_api_spec)
+class ReadingStatistics(ReadingStatisticsBase):
+    class Meta:
+        description = "Reading statistics"
+        unknown = EXCLUDE
+        ordered = True
+
+    prandial_tags = fields.Dict(
+        keys=fields.String(),
+        values=fields.Nested(ReadingStatisticsBase),
+        required=False,
+        description="Reading statistics keyed by prandial tag UUID, if requested",
+        example={},
+    )
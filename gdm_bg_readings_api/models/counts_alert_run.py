@@ -0,0 +1,44 @@
+from typing import Any
+
+from flask_batteries_included.sqldb import ModelIdentifier, db
+from sqlalchemy import Index
+
+
+class CountsAlertRun(ModelIdentifier, db.Model):
+    """
+    The run of readings that could trigger a red "counts" alert at the end of a patient's
+    readings for one prandial tag. Rows are kept up to date as readings are stored and
+    updated (see query.counts_alert_run), so red alerts can be decided without looking
+    for a reading's neighbours in the reading table.
+    """
+
+    patient_id = db.Column(
+        db.String(length=36), db.ForeignKey("patient.uuid"), nullable=False
+    )
+    prandial_tag_id = db.Column(
+        db.String(length=36), db.ForeignKey("prandial_tag.uuid"), nullable=False
+    )
+
+    # The latest reading with the prandial tag, or null if the run is yet to be worked
+    # out from the stored readings.
+    last_reading_id = db.Column(db.String(length=36), nullable=True)
+    last_measured_timestamp = db.Column(db.DateTime, nullable=True)
+
+    # The number of consecutive readings, up to and including the latest, that could
+    # trigger a red alert, counted up to query.counts_alert_run.MAX_RUN_LENGTH. The UUIDs
+    # of those readings are in run_reading_ids, latest first.
+    run_length = db.Column(db.Integer, nullable=False, default=0)
+    run_reading_ids = db.Column(db.JSON, nullable=False, default=list)
+
+    __table_args__ = (
+        Index(
+            "counts_alert_run_unique_idx",
+            patient_id,
+            prandial_tag_id,
+            unique=True,
+        ),
+    )
+
+    def __init__(self, **kwargs: Any) -> None:
+        # Constructor to satisfy linters.
+        super(CountsAlertRun, self).__init__(**kwargs)
@@ -10,7 +10,10 @@ class Dose(ModelIdentifier, db.Model):
     medication_id = db.Column(db.String, unique=False, nullable=False)
     reading_id = db.Column(db.String, db.ForeignKey("reading.uuid"))
 
-    __table_args__ = (Index("dose_uuid", "uuid", unique=True),)
+    __table_args__ = (
+        Index("dose_uuid", "uuid", unique=True),
+        Index("dose_reading_id_idx", "reading_id"),
+    )
 
     def __init__(self, **kwargs: Any) -> None:
         # Constructor to satisfy linters.
@@ -25,8 +28,7 @@ class Dose(ModelIdentifier, db.Model):
         )
 
     def to_dict(self) -> Dict:
-        return {
-            "amount": self.amount,
-            "medication_id": self.medication_id,
-            **self.pack_identifier(),
-        }
+        resp: Dict = self.pack_identifier()
+        resp["amount"] = self.amount
+        resp["medication_id"] = self.medication_id
+        return resp
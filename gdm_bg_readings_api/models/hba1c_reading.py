@@ -56,13 +56,11 @@ class Hba1cReading(ModelIdentifier, db.Model):
         if measured_timestamp.tzinfo is None:
             # sqlite loses tzinfo, shouldn't happen outside tests
             measured_timestamp = measured_timestamp.replace(tzinfo=timezone.utc)
-        reading = {
-            "value": self.value,
-            "units": self.units,
-            "patient_id": self.patient_id,
-            "measured_timestamp": measured_timestamp,
-            **self.pack_identifier(),
-        }
+        reading: Dict = self.pack_identifier()
+        reading["value"] = self.value
+        reading["units"] = self.units
+        reading["patient_id"] = self.patient_id
+        reading["measured_timestamp"] = measured_timestamp
 
         if self.deleted is not None:
             reading["deleted"] = self.deleted
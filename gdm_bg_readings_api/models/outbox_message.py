@@ -0,0 +1,27 @@
+from typing import Any
+
+from flask_batteries_included.sqldb import ModelIdentifier, db
+
+
+class OutboxMessage(ModelIdentifier, db.Model):
+    """
+    A message waiting to be published to RabbitMQ. Rows are written in the same
+    transaction as the change they describe, and deleted by the outbox relay once the
+    broker has accepted them. This means publishing never holds up a request, and
+    messages aren't lost if the broker is unavailable.
+    """
+
+    routing_key = db.Column(db.String, nullable=False)
+    # The JSON-encoded message body, exactly as it will be published.
+    body = db.Column(db.Text, nullable=False)
+    correlation_id = db.Column(db.String, nullable=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, index=True)
+    last_error = db.Column(db.Text, nullable=True)
+    # Set once the relay gives up on the message after OUTBOX_MAX_ATTEMPTS attempts.
+    # Failed messages are kept for inspection, but no longer published.
+    failed_at = db.Column(db.DateTime, nullable=True)
+
+    def __init__(self, **kwargs: Any) -> None:
+        # Constructor to satisfy linters.
+        super(OutboxMessage, self).__init__(**kwargs)
@@ -19,6 +19,11 @@ class Patient(ModelIdentifier, db.Model):
     current_amber_alert = db.Column(db.Boolean, unique=False, nullable=True)
     current_activity_alert = db.Column(db.Boolean, unique=False, nullable=True)
 
+    # The patient's most recently measured reading, maintained as readings are stored
+    # (see upsert.advance_latest_reading) so that summaries needn't search for it.
+    latest_reading_id = db.Column(db.String(length=36), unique=False, nullable=True)
+    latest_measured_timestamp = db.Column(db.DateTime, unique=False, nullable=True)
+
     readings = db.relationship(
         "Reading", backref="patient", lazy="dynamic", uselist=True
     )
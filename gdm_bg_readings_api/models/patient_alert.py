@@ -46,11 +46,10 @@ class PatientAlert(ModelIdentifier, db.Model):
         }
 
     def to_dict(self) -> Dict:
-        return {
-            **self.pack_identifier(),
-            "dismissed_at": parse_datetime_to_iso8601(self.dismissed_at),
-            "started_at": parse_datetime_to_iso8601(self.started_at),
-            "ended_at": parse_datetime_to_iso8601(self.ended_at),
-            "alert_type": self.alert_type.value,
-            "patient_id": self.patient_id,
-        }
+        resp: Dict = self.pack_identifier()
+        resp["dismissed_at"] = parse_datetime_to_iso8601(self.dismissed_at)
+        resp["started_at"] = parse_datetime_to_iso8601(self.started_at)
+        resp["ended_at"] = parse_datetime_to_iso8601(self.ended_at)
+        resp["alert_type"] = self.alert_type.value
+        resp["patient_id"] = self.patient_id
+        return resp
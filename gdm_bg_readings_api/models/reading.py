@@ -5,6 +5,8 @@ from flask_batteries_included.helpers.timestamp import join_timestamp
 from flask_batteries_included.sqldb import ModelIdentifier, db
 from sqlalchemy import Index
 
+from gdm_bg_readings_api import dimensions
+
 
 class Reading(ModelIdentifier, db.Model):
     patient_id = db.Column(
@@ -46,6 +48,8 @@ class Reading(ModelIdentifier, db.Model):
     reading_banding = db.relationship("ReadingBanding", uselist=False)
 
     # FIXME: https://sensynehealth.atlassian.net/browse/PLAT-674
+    # The measured instant as naive UTC, with the original UTC offset (in seconds) in
+    # measured_timezone. Use get_measured_timestamp() for the timezone-aware value.
     measured_timestamp = db.Column(
         db.DateTime, unique=False, nullable=False, index=True
     )
@@ -66,6 +70,13 @@ class Reading(ModelIdentifier, db.Model):
             unique=True,
         ),
         Index("reading_uuid", "uuid", unique=True),
+        # Supports keyset pagination of a patient's readings.
+        Index(
+            "reading_patient_measured_idx",
+            patient_id,
+            measured_timestamp,
+            "uuid",
+        ),
     )
 
     def __init__(self, **kwargs: Any) -> None:
@@ -101,13 +112,16 @@ class Reading(ModelIdentifier, db.Model):
         return join_timestamp(self.measured_timestamp, self.measured_timezone)
 
     def to_dict(self, compact: bool = False) -> Dict:
-        resp = {
-            "blood_glucose_value": float("%.03f" % self.blood_glucose_value),
-            "units": self.units,
-            "patient_id": self.patient_id,
-            "measured_timestamp": self.get_measured_timestamp(),
-            **self.pack_identifier(),
-        }
+        # Fields are added to the one dict in place, rather than merging dicts, as this
+        # is called for every reading in a response.
+        resp: Dict = self.pack_identifier()
+        resp["blood_glucose_value"] = round(float(self.blood_glucose_value), 3)
+        resp["units"] = self.units
+        resp["patient_id"] = self.patient_id
+        resp["measured_timestamp"] = self.get_measured_timestamp()
+        resp["reading_metadata"] = (
+            self.reading_metadata.to_dict() if self.reading_metadata is not None else {}
+        )
 
         if self.comment:
             resp["comment"] = self.comment
@@ -115,55 +129,35 @@ class Reading(ModelIdentifier, db.Model):
             resp["snoozed"] = self.snoozed
 
         if compact is True:
-            return self._to_compact_dict(resp)
+            self._add_compact_fields(resp)
         else:
-            return self._to_expanded_dict(resp)
-
-    def _to_compact_dict(self, resp: Dict) -> Dict:
-        compacted_fields_resp = {
-            "prandial_tag": self.prandial_tag_id,
-            "reading_metadata": (
-                self.reading_metadata.to_dict()
-                if self.reading_metadata is not None
-                else {}
-            ),
-            "reading_banding": self.reading_banding_id,
-            "patient_id": self.patient_id,
-            **self.pack_identifier(),
-        }
+            self._add_expanded_fields(resp)
+        return resp
 
-        resp = {**resp, **compacted_fields_resp}
+    def _add_compact_fields(self, resp: Dict) -> None:
+        resp["prandial_tag"] = self.prandial_tag_id
+        resp["reading_banding"] = self.reading_banding_id
 
         if self.red_alert_id:
             resp["red_alert"] = self.red_alert_id
         if self.amber_alert_id:
             resp["amber_alert"] = self.amber_alert_id
 
-        return resp
-
-    def _to_expanded_dict(self, resp: Dict) -> Dict:
-        expanded_fields_resp = {
-            "doses": [dose.to_dict() for dose in self.doses],
-            "prandial_tag": (
-                self.prandial_tag.to_dict() if self.prandial_tag is not None else {}
-            ),
-            "reading_metadata": (
-                self.reading_metadata.to_dict()
-                if self.reading_metadata is not None
-                else {}
-            ),
-            "reading_banding": (
-                self.reading_banding.to_dict()
-                if self.reading_banding is not None
-                else {}
-            ),
-        }
-
-        resp = {**resp, **expanded_fields_resp}
+    def _add_expanded_fields(self, resp: Dict) -> None:
+        resp["doses"] = [dose.to_dict() for dose in self.doses]
+        # Prandial tags and bandings are rendered from the cache, not loaded.
+        resp["prandial_tag"] = (
+            dimensions.get_prandial_tag(self.prandial_tag_id) or {}
+            if self.prandial_tag_id is not None
+            else {}
+        )
+        resp["reading_banding"] = (
+            dimensions.get_reading_banding(self.reading_banding_id) or {}
+            if self.reading_banding_id is not None
+            else {}
+        )
 
         if self.red_alert:
             resp["red_alert"] = self.red_alert.to_dict()
         if self.amber_alert:
             resp["amber_alert"] = self.amber_alert.to_dict()
-
-        return resp
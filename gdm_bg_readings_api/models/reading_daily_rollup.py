@@ -0,0 +1,47 @@
+from typing import Any, Dict
+
+from flask_batteries_included.sqldb import ModelIdentifier, db
+from sqlalchemy import Index
+
+
+class ReadingDailyRollup(ModelIdentifier, db.Model):
+    """
+    Aggregates of a patient's readings for one prandial tag on one calendar day, local to
+    where each reading was taken. Rows are kept up to date as readings are stored and
+    updated (see query.daily_rollup), so per-day summaries don't scan the reading table.
+    """
+
+    patient_id = db.Column(
+        db.String(length=36), db.ForeignKey("patient.uuid"), nullable=False
+    )
+    day = db.Column(db.Date, nullable=False)
+    prandial_tag_id = db.Column(
+        db.String(length=36), db.ForeignKey("prandial_tag.uuid"), nullable=False
+    )
+
+    readings_count = db.Column(db.Integer, nullable=False)
+    readings_count_banding_normal = db.Column(db.Integer, nullable=False)
+    min_blood_glucose_value = db.Column(db.Float, nullable=False)
+    max_blood_glucose_value = db.Column(db.Float, nullable=False)
+
+    __table_args__ = (
+        Index(
+            "reading_daily_rollup_unique_idx",
+            patient_id,
+            day,
+            prandial_tag_id,
+            unique=True,
+        ),
+    )
+
+    def __init__(self, **kwargs: Any) -> None:
+        # Constructor to satisfy linters.
+        super(ReadingDailyRollup, self).__init__(**kwargs)
+
+    def to_dict(self) -> Dict:
+        return {
+            "readings_count": self.readings_count,
+            "readings_count_banding_normal": self.readings_count_banding_normal,
+            "min_blood_glucose_value": self.min_blood_glucose_value,
+            "max_blood_glucose_value": self.max_blood_glucose_value,
+        }
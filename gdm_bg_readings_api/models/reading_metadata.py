@@ -37,13 +37,11 @@ class ReadingMetadata(ModelIdentifier, db.Model):
         }
 
     def to_dict(self) -> Dict:
-        resp = {
-            "manual": self.manual,
-            "control": self.control,
-            "reading_is_correct": self.reading_is_correct,
-            "transmitted_reading": self.transmitted_reading,
-            **self.pack_identifier(),
-        }
+        resp: Dict = self.pack_identifier()
+        resp["manual"] = self.manual
+        resp["control"] = self.control
+        resp["reading_is_correct"] = self.reading_is_correct
+        resp["transmitted_reading"] = self.transmitted_reading
 
         if not self.manual:
             resp["meter_serial_number"] = self.meter_serial_number
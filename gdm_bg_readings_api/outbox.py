@@ -0,0 +1,216 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+import kombu_batteries_included
+from flask import Flask, current_app
+from flask_batteries_included.sqldb import db
+from kombu import Connection, Producer
+from kombu.pools import ProducerPool
+from kombu_batteries_included import config as kombu_config
+from kombu_batteries_included import infra
+from prometheus_client import Counter, Histogram
+from she_logging import logger
+
+from gdm_bg_readings_api.models.outbox_message import OutboxMessage
+
+# How many times kombu retries a publish (e.g. reconnecting) before the relay gives up
+# on the message for this round and schedules it for a later attempt.
+PUBLISH_RETRY_POLICY = {"max_retries": 3, "interval_start": 0, "interval_step": 1}
+
+OUTBOX_PUBLISH_BATCH_LATENCY = Histogram(
+    "gdm_outbox_publish_batch_latency_seconds",
+    "Time taken to publish a batch of outbox messages",
+)
+OUTBOX_PUBLISH_COUNT = Counter(
+    "gdm_outbox_publish_count",
+    "Outbox messages publish attempts",
+    ["result"],
+)
+
+
+class Publisher:
+    """
+    Publishes outbox messages to the task exchange. The producer comes from a kombu
+    pool, so the broker connection and channel are reused from one batch to the next
+    rather than opened per message. With confirm=True, the broker must confirm each message before
+    it counts as published (on transports that support publisher confirms).
+    """
+
+    def __init__(self, connection_string: str, confirm: bool = True) -> None:
+        connection = Connection(
+            connection_string, transport_options={"confirm_publish": confirm}
+        )
+        # The relay publishes from a single thread, so one pooled producer is enough.
+        self._producers = ProducerPool(connection.Pool(limit=1), limit=1)
+
+    def publish_batch(self, messages: List[OutboxMessage]) -> Dict[str, Exception]:
+        """
+        Publishes the messages in order. Returns the error for each message that could
+        not be published, keyed by message UUID.
+        """
+        failures: Dict[str, Exception] = {}
+        with OUTBOX_PUBLISH_BATCH_LATENCY.time():
+            with self._producers.acquire(block=True) as producer:
+                for message in messages:
+                    try:
+                        _publish(producer, message)
+                    except Exception as e:
+                        failures[message.uuid] = e
+        OUTBOX_PUBLISH_COUNT.labels("published").inc(len(messages) - len(failures))
+        OUTBOX_PUBLISH_COUNT.labels("failed").inc(len(failures))
+        return failures
+
+    def close(self) -> None:
+        self._producers.force_close_all()
+        self._producers.connections.force_close_all()
+
+
+def get_publisher(connection_string: Optional[str] = None) -> Optional[Publisher]:
+    """
+    Returns a publisher for the given kombu connection string, defaulting to the
+    RabbitMQ connection configured for kombu_batteries_included. Returns None if no
+    connection string is given and RabbitMQ is disabled.
+    """
+    if connection_string is None:
+        if kombu_config.RABBITMQ_DISABLED:
+            return None
+        connection_string = kombu_batteries_included.get_connection_string()
+    return Publisher(
+        connection_string, confirm=current_app.config["OUTBOX_RELAY_CONFIRM_PUBLISH"]
+    )
+
+
+def _backoff(attempts: int) -> timedelta:
+    max_backoff: int = current_app.config["OUTBOX_RELAY_MAX_BACKOFF_SEC"]
+    return timedelta(seconds=min(2 ** (attempts - 1), max_backoff))
+
+
+def _claim_batch(batch_size: int) -> List[OutboxMessage]:
+    # SKIP LOCKED lets several relays drain the outbox without publishing a message
+    # twice (it is ignored on SQLite).
+    return (
+        OutboxMessage.query.filter(
+            OutboxMessage.failed_at.is_(None),
+            OutboxMessage.next_attempt_at <= datetime.utcnow(),
+        )
+        .order_by(OutboxMessage.created)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+
+
+def _publish(producer: Producer, message: OutboxMessage) -> None:
+    producer.publish(
+        body=message.body,
+        exchange=infra.TASK_EXCHANGE_NAME,
+        routing_key=message.routing_key,
+        content_type="application/text",
+        compression=kombu_config.RABBITMQ_COMPRESSION,
+        retry=True,
+        retry_policy=PUBLISH_RETRY_POLICY,
+        timestamp=int(message.created.replace(tzinfo=timezone.utc).timestamp()),
+        correlation_id=message.correlation_id,
+    )
+
+
+def relay_batch(
+    publisher: Optional[Publisher], batch_size: Optional[int] = None
+) -> int:
+    """
+    Publishes a batch of due outbox messages to RabbitMQ, deleting each one that the
+    broker accepts. Messages that fail to publish are kept, and retried after an
+    exponential backoff, until they have failed OUTBOX_MAX_ATTEMPTS times. They are
+    then marked as failed, and not published again. Without a publisher (i.e. RabbitMQ
+    is disabled) messages are discarded. Returns the number of messages removed from
+    the outbox.
+    """
+    if batch_size is None:
+        batch_size = current_app.config["OUTBOX_RELAY_BATCH_SIZE"]
+    messages: List[OutboxMessage] = _claim_batch(batch_size)
+    if not messages:
+        db.session.commit()
+        return 0
+
+    if publisher is None:
+        logger.debug("Discarding %d outbox messages due to config", len(messages))
+        for message in messages:
+            db.session.delete(message)
+        db.session.commit()
+        return len(messages)
+
+    max_attempts: int = current_app.config["OUTBOX_MAX_ATTEMPTS"]
+    failures: Dict[str, Exception] = publisher.publish_batch(messages)
+    for message in messages:
+        error: Optional[Exception] = failures.get(message.uuid)
+        if error is None:
+            db.session.delete(message)
+            continue
+        message.attempts += 1
+        message.last_error = str(error)
+        extra: Dict = {
+            "outbox_message_uuid": message.uuid,
+            "attempts": message.attempts,
+            "error": str(error),
+        }
+        if message.attempts >= max_attempts:
+            message.failed_at = datetime.utcnow()
+            OUTBOX_PUBLISH_COUNT.labels("dead_lettered").inc()
+            logger.error(
+                "Giving up on %s outbox message", message.routing_key, extra=extra
+            )
+            continue
+        message.next_attempt_at = datetime.utcnow() + _backoff(message.attempts)
+        logger.warning(
+            "Failed to publish %s outbox message", message.routing_key, extra=extra
+        )
+    db.session.commit()
+    published = len(messages) - len(failures)
+    logger.debug("Published %d of %d outbox messages", published, len(messages))
+    return published
+
+
+def run_relay(connection_string: Optional[str] = None, once: bool = False) -> None:
+    """
+    Drains the outbox continuously, sleeping between polls only when there is nothing
+    to publish. With once=True, stops as soon as no messages are due.
+    """
+    poll_interval: float = current_app.config["OUTBOX_RELAY_POLL_INTERVAL_SEC"]
+    batch_size: int = current_app.config["OUTBOX_RELAY_BATCH_SIZE"]
+    publisher: Optional[Publisher] = get_publisher(connection_string)
+    logger.info("Starting outbox relay")
+    try:
+        while True:
+            try:
+                relayed = relay_batch(publisher=publisher, batch_size=batch_size)
+            except Exception:
+                logger.exception("Outbox relay failed to process batch")
+                db.session.rollback()
+                relayed = 0
+            if relayed < batch_size:
+                if once:
+                    return
+                time.sleep(poll_interval)
+    finally:
+        if publisher is not None:
+            publisher.close()
+
+
+def start_relay_thread(app: Flask) -> threading.Thread:
+    """
+    Runs the outbox relay on a daemon thread of this process, so that the API server
+    publishes its own messages without `flask relay-outbox` running alongside it.
+    """
+
+    def _run() -> None:
+        with app.app_context():
+            try:
+                run_relay()
+            except Exception:
+                logger.exception("Outbox relay stopped")
+
+    thread = threading.Thread(target=_run, name="outbox-relay", daemon=True)
+    thread.start()
+    return thread
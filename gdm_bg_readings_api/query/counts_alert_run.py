@@ -0,0 +1,237 @@
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from flask_batteries_included.sqldb import db, generate_uuid
+from she_logging import logger
+from sqlalchemy import tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.sql.dml import Insert
+
+from gdm_bg_readings_api.models.counts_alert_run import CountsAlertRun
+from gdm_bg_readings_api.models.reading import Reading
+from gdm_bg_readings_api.models.red_alert import RedAlert
+from gdm_bg_readings_api.query.upsert import identifier_values
+
+NORMAL_BANDING_ID = "BG-READING-BANDING-NORMAL"
+
+# A red alert is given to three readings in a row that could trigger one (as per
+# counts_alerting.MIN_ABNORMAL_READINGS_FOR_COUNTS_ALERT), so longer runs are counted
+# no further.
+MAX_RUN_LENGTH = 3
+
+RUN_UNIQUE_COLUMNS = ("patient_id", "prandial_tag_id")
+
+# (patient_id, prandial_tag_id)
+RunKey = Tuple[str, str]
+
+
+def run_key(reading: Reading) -> RunKey:
+    return reading.patient_id, reading.prandial_tag_id
+
+
+def _could_trigger_red_alert(
+    snoozed: Optional[bool],
+    reading_banding_id: Optional[str],
+    red_alert_dismissed: Optional[bool],
+) -> bool:
+    # As per counts_alerting.reading_could_trigger_red_alert.
+    return (
+        not snoozed
+        and reading_banding_id != NORMAL_BANDING_ID
+        and not red_alert_dismissed
+    )
+
+
+def _advance(run: CountsAlertRun, reading: Reading) -> None:
+    # A new reading has no red alert yet, so only its snooze and banding count.
+    if _could_trigger_red_alert(reading.snoozed, reading.reading_banding_id, None):
+        run.run_length = min(run.run_length + 1, MAX_RUN_LENGTH)
+        run.run_reading_ids = [reading.uuid, *run.run_reading_ids][:MAX_RUN_LENGTH]
+    else:
+        run.run_length = 0
+        run.run_reading_ids = []
+    run.last_reading_id = reading.uuid
+    run.last_measured_timestamp = reading.measured_timestamp
+
+
+def _recalculate(run: CountsAlertRun) -> bool:
+    """
+    Works out the run from the latest few readings with its prandial tag. Returns False
+    if there are no such readings.
+    """
+    rows: List[Any] = (
+        db.session.query(
+            Reading.uuid,
+            Reading.measured_timestamp,
+            Reading.snoozed,
+            Reading.reading_banding_id,
+            RedAlert.dismissed,
+        )
+        .outerjoin(RedAlert, RedAlert.uuid == Reading.red_alert_id)
+        .filter(
+            Reading.patient_id == run.patient_id,
+            Reading.prandial_tag_id == run.prandial_tag_id,
+        )
+        .order_by(Reading.measured_timestamp.desc(), Reading.uuid.desc())
+        .limit(MAX_RUN_LENGTH)
+        .all()
+    )
+    if not rows:
+        return False
+
+    run_reading_ids: List[str] = []
+    for row in rows:
+        if not _could_trigger_red_alert(
+            row.snoozed, row.reading_banding_id, row.dismissed
+        ):
+            break
+        run_reading_ids.append(row.uuid)
+    run.run_length = len(run_reading_ids)
+    run.run_reading_ids = run_reading_ids
+    run.last_reading_id = rows[0].uuid
+    run.last_measured_timestamp = rows[0].measured_timestamp
+    return True
+
+
+def _insert(values: List[Dict[str, Any]]) -> Insert:
+    if db.engine.dialect.name == "postgresql":
+        return postgresql.insert(CountsAlertRun.__table__).values(values)
+    return sqlite.insert(CountsAlertRun.__table__).values(values)
+
+
+def _lock_runs(keys: Set[RunKey]) -> Dict[RunKey, CountsAlertRun]:
+    """
+    Loads the runs with the given keys for update, first creating any that don't exist
+    yet. Creating them with ON CONFLICT DO NOTHING means concurrent ingests for the same
+    patient and prandial tag queue up on the one row, rather than both creating it.
+    """
+    audit_values: Dict[str, Any] = identifier_values()
+    db.session.execute(
+        _insert(
+            [
+                {
+                    "uuid": generate_uuid(),
+                    **audit_values,
+                    **dict(zip(RUN_UNIQUE_COLUMNS, key)),
+                    "run_length": 0,
+                    "run_reading_ids": [],
+                }
+                for key in keys
+            ]
+        ).on_conflict_do_nothing(index_elements=RUN_UNIQUE_COLUMNS)
+    )
+    return {
+        (run.patient_id, run.prandial_tag_id): run
+        for run in CountsAlertRun.query.filter(
+            tuple_(CountsAlertRun.patient_id, CountsAlertRun.prandial_tag_id).in_(
+                list(keys)
+            )
+        )
+        .populate_existing()
+        .with_for_update()
+    }
+
+
+def _order_key(reading: Any) -> Tuple[datetime, str]:
+    return reading.measured_timestamp, reading.uuid
+
+
+def add_readings(readings: Iterable[Reading]) -> None:
+    """
+    Adds newly stored readings to the runs for their prandial tags. A reading later than
+    any other with its prandial tag extends or ends the run in place. A backdated reading
+    may split a run, so the run is worked out again from the latest few readings.
+    """
+    readings_by_key: Dict[RunKey, List[Reading]] = defaultdict(list)
+    for reading in readings:
+        if reading.prandial_tag_id is None:
+            # As for the daily rollups, readings without a prandial tag are left out.
+            continue
+        readings_by_key[run_key(reading)].append(reading)
+    if not readings_by_key:
+        return
+
+    runs: Dict[RunKey, CountsAlertRun] = _lock_runs(set(readings_by_key))
+    for key, key_readings in readings_by_key.items():
+        run: CountsAlertRun = runs[key]
+        key_readings.sort(key=_order_key)
+        if run.last_reading_id is None or _order_key(key_readings[0]) < (
+            run.last_measured_timestamp,
+            run.last_reading_id,
+        ):
+            logger.debug("Recalculating counts alert run for %s", key)
+            _recalculate(run)
+            continue
+        for reading in key_readings:
+            _advance(run, reading)
+
+
+def refresh(keys: Iterable[RunKey]) -> None:
+    """
+    Works out the given runs again from the latest few readings with their prandial tags,
+    e.g. after a reading has been moved between them or an alert has been dismissed. A
+    run that no longer has any readings is deleted.
+    """
+    keys_to_refresh: Set[RunKey] = {key for key in keys if key[1] is not None}
+    if not keys_to_refresh:
+        return
+
+    for run in _lock_runs(keys_to_refresh).values():
+        if not _recalculate(run):
+            db.session.delete(run)
+
+
+def refresh_patient(patient_id: str) -> None:
+    """Works out all of the patient's runs again, as per refresh."""
+    refresh_patients([patient_id])
+
+
+def refresh_patients(patient_ids: List[str]) -> None:
+    """Works out all of the given patients' runs again, as per refresh."""
+    refresh(
+        (patient_id, prandial_tag_id)
+        for patient_id, prandial_tag_id in db.session.query(
+            CountsAlertRun.patient_id, CountsAlertRun.prandial_tag_id
+        )
+        .filter(CountsAlertRun.patient_id.in_(patient_ids))
+        .all()
+    )
+
+
+def rebuild(patient_ids: Optional[List[str]] = None) -> int:
+    """
+    Rebuilds the runs for the given patients (or all patients) from the stored readings,
+    committing after each patient. Returns the number of runs written.
+    """
+    patients_query = db.session.query(Reading.patient_id).distinct()
+    if patient_ids is not None:
+        patients_query = patients_query.filter(Reading.patient_id.in_(patient_ids))
+    written = 0
+    for (patient_id,) in patients_query.order_by(Reading.patient_id).all():
+        keys: Set[RunKey] = {
+            (patient_id, prandial_tag_id)
+            for (prandial_tag_id,) in db.session.query(Reading.prandial_tag_id)
+            .filter(
+                Reading.patient_id == patient_id, Reading.prandial_tag_id.isnot(None)
+            )
+            .distinct()
+        }
+        CountsAlertRun.query.filter_by(patient_id=patient_id).delete(
+            synchronize_session=False
+        )
+        refresh(keys)
+        db.session.commit()
+        written += len(keys)
+        logger.debug(
+            "Rebuilt %d counts alert runs for patient with UUID %s",
+            len(keys),
+            patient_id,
+        )
+    return written
+
+
+def get_run(patient_id: str, prandial_tag_id: str) -> Optional[CountsAlertRun]:
+    return CountsAlertRun.query.filter_by(
+        patient_id=patient_id, prandial_tag_id=prandial_tag_id
+    ).first()
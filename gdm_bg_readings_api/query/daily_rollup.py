@@ -0,0 +1,222 @@
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from flask_batteries_included.sqldb import db, generate_uuid
+from she_logging import logger
+from sqlalchemy import func, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.sql.dml import Insert
+
+from gdm_bg_readings_api.models.reading import Reading
+from gdm_bg_readings_api.models.reading_daily_rollup import ReadingDailyRollup
+from gdm_bg_readings_api.query.upsert import identifier_values
+
+NORMAL_BANDING_ID = "BG-READING-BANDING-NORMAL"
+
+# UTC offsets range from -12:00 to +14:00, so a local day falls within this much of
+# the same UTC day.
+MAX_UTC_OFFSET = timedelta(hours=14)
+
+ROLLUP_UNIQUE_COLUMNS = ("patient_id", "day", "prandial_tag_id")
+
+# (patient_id, day, prandial_tag_id)
+RollupKey = Tuple[str, date, str]
+
+
+def local_day(measured_timestamp: datetime, measured_timezone: int) -> date:
+    """The calendar day on which a reading was taken, local to where it was taken."""
+    return (measured_timestamp + timedelta(seconds=measured_timezone)).date()
+
+
+def rollup_key(reading: Reading) -> RollupKey:
+    return (
+        reading.patient_id,
+        local_day(reading.measured_timestamp, reading.measured_timezone),
+        reading.prandial_tag_id,
+    )
+
+
+def _aggregate(readings: Iterable[Any]) -> Dict[RollupKey, Dict[str, Any]]:
+    rollups: Dict[RollupKey, Dict[str, Any]] = {}
+    for reading in readings:
+        if reading.prandial_tag_id is None:
+            # Readings have had a prandial tag since it defaulted to "none", so any older
+            # readings without one are left out of the rollups.
+            continue
+        value: float = reading.blood_glucose_value
+        normal: int = 1 if reading.reading_banding_id == NORMAL_BANDING_ID else 0
+        rollup: Optional[Dict[str, Any]] = rollups.get(rollup_key(reading))
+        if rollup is None:
+            rollups[rollup_key(reading)] = {
+                "readings_count": 1,
+                "readings_count_banding_normal": normal,
+                "min_blood_glucose_value": value,
+                "max_blood_glucose_value": value,
+            }
+            continue
+        rollup["readings_count"] += 1
+        rollup["readings_count_banding_normal"] += normal
+        rollup["min_blood_glucose_value"] = min(
+            rollup["min_blood_glucose_value"], value
+        )
+        rollup["max_blood_glucose_value"] = max(
+            rollup["max_blood_glucose_value"], value
+        )
+    return rollups
+
+
+def _insert(values: List[Dict[str, Any]]) -> Insert:
+    if db.engine.dialect.name == "postgresql":
+        return postgresql.insert(ReadingDailyRollup.__table__).values(values)
+    return sqlite.insert(ReadingDailyRollup.__table__).values(values)
+
+
+def _values(rollups: Dict[RollupKey, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    audit_values: Dict[str, Any] = identifier_values()
+    return [
+        {
+            "uuid": generate_uuid(),
+            **audit_values,
+            **dict(zip(ROLLUP_UNIQUE_COLUMNS, key)),
+            **rollup,
+        }
+        for key, rollup in rollups.items()
+    ]
+
+
+def add_readings(readings: Iterable[Reading]) -> None:
+    """
+    Adds newly stored readings to their daily rollups, creating rollups as needed, in a
+    single INSERT ... ON CONFLICT DO UPDATE that adds to any existing rollups in place.
+    """
+    rollups: Dict[RollupKey, Dict[str, Any]] = _aggregate(readings)
+    if not rollups:
+        return
+
+    # SQLite's multi-argument min() and max() are PostgreSQL's least() and greatest().
+    if db.engine.dialect.name == "postgresql":
+        least, greatest = func.least, func.greatest
+    else:
+        least, greatest = func.min, func.max
+    statement = _insert(_values(rollups))
+    existing = ReadingDailyRollup.__table__.c
+    db.session.execute(
+        statement.on_conflict_do_update(
+            index_elements=ROLLUP_UNIQUE_COLUMNS,
+            set_={
+                "readings_count": existing.readings_count
+                + statement.excluded.readings_count,
+                "readings_count_banding_normal": (
+                    existing.readings_count_banding_normal
+                    + statement.excluded.readings_count_banding_normal
+                ),
+                "min_blood_glucose_value": least(
+                    existing.min_blood_glucose_value,
+                    statement.excluded.min_blood_glucose_value,
+                ),
+                "max_blood_glucose_value": greatest(
+                    existing.max_blood_glucose_value,
+                    statement.excluded.max_blood_glucose_value,
+                ),
+                "modified": statement.excluded.modified,
+                "modified_by_": statement.excluded.modified_by_,
+            },
+        )
+    )
+
+
+def refresh(keys: Iterable[RollupKey]) -> None:
+    """
+    Recalculates the given daily rollups from the readings they cover, e.g. after a
+    reading has been moved between them. A rollup that no longer covers any readings is
+    deleted. Only the readings around each day are read, so the cost doesn't grow with the
+    number of readings a patient has.
+    """
+    keys_to_refresh: Set[RollupKey] = set(keys)
+    if not keys_to_refresh:
+        return
+
+    readings: List[Any] = []
+    for patient_id, day, prandial_tag_id in keys_to_refresh:
+        start = datetime.combine(day, datetime.min.time()) - MAX_UTC_OFFSET
+        end = start + timedelta(days=1) + 2 * MAX_UTC_OFFSET
+        readings.extend(
+            _reading_columns().filter(
+                Reading.patient_id == patient_id,
+                Reading.prandial_tag_id == prandial_tag_id,
+                Reading.measured_timestamp >= start,
+                Reading.measured_timestamp < end,
+            )
+        )
+    rollups: Dict[RollupKey, Dict[str, Any]] = {
+        key: rollup
+        for key, rollup in _aggregate(readings).items()
+        if key in keys_to_refresh
+    }
+
+    ReadingDailyRollup.query.filter(
+        tuple_(
+            ReadingDailyRollup.patient_id,
+            ReadingDailyRollup.day,
+            ReadingDailyRollup.prandial_tag_id,
+        ).in_(list(keys_to_refresh))
+    ).delete(synchronize_session=False)
+    if rollups:
+        db.session.execute(_insert(_values(rollups)))
+
+
+def rebuild(patient_ids: Optional[List[str]] = None, batch_size: int = 1000) -> int:
+    """
+    Rebuilds the daily rollups for the given patients (or all patients) from scratch,
+    committing after each patient. Returns the number of rollups written.
+    """
+    patients_query = db.session.query(Reading.patient_id).distinct()
+    if patient_ids is not None:
+        patients_query = patients_query.filter(Reading.patient_id.in_(patient_ids))
+    written = 0
+    for (patient_id,) in patients_query.order_by(Reading.patient_id).all():
+        rollups: Dict[RollupKey, Dict[str, Any]] = _aggregate(
+            _reading_columns()
+            .filter(Reading.patient_id == patient_id)
+            .yield_per(batch_size)
+        )
+        ReadingDailyRollup.query.filter_by(patient_id=patient_id).delete(
+            synchronize_session=False
+        )
+        if rollups:
+            db.session.execute(_insert(_values(rollups)))
+        db.session.commit()
+        written += len(rollups)
+        logger.debug(
+            "Rebuilt %d daily rollups for patient with UUID %s",
+            len(rollups),
+            patient_id,
+        )
+    return written
+
+
+def get_daily_rollups(
+    patient_id: str, start_day: date, end_day: date
+) -> List[ReadingDailyRollup]:
+    """Returns the patient's daily rollups from start_day to end_day inclusive."""
+    return (
+        ReadingDailyRollup.query.filter(
+            ReadingDailyRollup.patient_id == patient_id,
+            ReadingDailyRollup.day >= start_day,
+            ReadingDailyRollup.day <= end_day,
+        )
+        .order_by(ReadingDailyRollup.day, ReadingDailyRollup.prandial_tag_id)
+        .all()
+    )
+
+
+def _reading_columns() -> Any:
+    # Only the columns needed for rollups, without loading the readings as objects.
+    return db.session.query(
+        Reading.patient_id,
+        Reading.measured_timestamp,
+        Reading.measured_timezone,
+        Reading.prandial_tag_id,
+        Reading.blood_glucose_value,
+        Reading.reading_banding_id,
+    )
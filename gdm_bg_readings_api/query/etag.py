@@ -0,0 +1,59 @@
+import hashlib
+from typing import Any, Optional
+
+from flask_batteries_included.sqldb import db
+from sqlalchemy import func
+
+from gdm_bg_readings_api.models.amber_alert import AmberAlert
+from gdm_bg_readings_api.models.dose import Dose
+from gdm_bg_readings_api.models.patient import Patient
+from gdm_bg_readings_api.models.reading import Reading
+from gdm_bg_readings_api.models.reading_metadata import ReadingMetadata
+from gdm_bg_readings_api.models.red_alert import RedAlert
+
+
+def _etag(*values: Any) -> str:
+    return hashlib.sha256(repr(values).encode()).hexdigest()
+
+
+def readings_etag(*criteria: Any) -> Optional[str]:
+    """
+    Returns a strong ETag for the readings matching the criteria, as rendered along with
+    their doses, metadata and alerts, or None if there are no such readings. It changes
+    whenever any of those rows is added, modified or deleted, and is worked out in a
+    single aggregate query, without loading any readings.
+    """
+    row: Any = (
+        db.session.query(
+            func.count(Reading.uuid.distinct()),
+            func.max(Reading.modified),
+            func.count(Dose.uuid.distinct()),
+            func.max(Dose.modified),
+            func.max(ReadingMetadata.modified),
+            func.max(RedAlert.modified),
+            func.max(AmberAlert.modified),
+        )
+        .select_from(Reading)
+        .outerjoin(Dose, Dose.reading_id == Reading.uuid)
+        .outerjoin(ReadingMetadata, ReadingMetadata.uuid == Reading.reading_metadata_id)
+        .outerjoin(RedAlert, RedAlert.uuid == Reading.red_alert_id)
+        .outerjoin(AmberAlert, AmberAlert.uuid == Reading.amber_alert_id)
+        .filter(*criteria)
+        .one()
+    )
+    if row[0] == 0:
+        return None
+    return _etag(*row)
+
+
+def patient_etag(patient_id: str) -> Optional[str]:
+    """
+    Returns a strong ETag for the patient, which changes whenever the patient is
+    modified, or None if there is no such patient.
+    """
+    modified: Optional[Any] = (
+        db.session.query(Patient.modified).filter(Patient.uuid == patient_id).scalar()
+    )
+    if modified is None:
+        return None
+    return _etag(patient_id, modified)
@@ -0,0 +1,98 @@
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Literal, NamedTuple, Optional
+
+from flask_batteries_included.sqldb import db
+from sqlalchemy import case, func, or_
+
+from gdm_bg_readings_api.models.reading import Reading
+from gdm_bg_readings_api.trustomer import TrustomerThreshold
+
+PRANDIAL_TAG_ID_PREFIX = "PRANDIAL-TAG-"
+OTHER_THRESHOLD_KEY = "OTHER"
+MGDL_PER_MMOLL = 18.0
+
+
+class OutOfThresholdCounts(NamedTuple):
+    readings_count: int
+    out_of_threshold_count: int
+
+    @property
+    def percentage(self) -> float:
+        return 100 * self.out_of_threshold_count / self.readings_count
+
+
+def _is_complete(threshold: Optional[TrustomerThreshold]) -> bool:
+    return (
+        threshold is not None
+        and threshold.get("high") is not None
+        and threshold.get("low") is not None
+    )
+
+
+def get_prandial_tags_without_thresholds(
+    thresholds: Dict[str, TrustomerThreshold], prandial_tag_ids: Iterable[str]
+) -> List[str]:
+    """
+    Returns the given prandial tags (by UUID) that have neither a high and low threshold
+    of their own nor an "OTHER" one to fall back on. get_out_of_threshold_counts would
+    count every reading with one of these tags as in range.
+    """
+    has_default: bool = _is_complete(thresholds.get(OTHER_THRESHOLD_KEY))
+    missing: List[str] = []
+    for prandial_tag_id in prandial_tag_ids:
+        key: str = prandial_tag_id[len(PRANDIAL_TAG_ID_PREFIX) :]
+        threshold: Optional[TrustomerThreshold] = thresholds.get(key)
+        if not (_is_complete(threshold) or (threshold is None and has_default)):
+            missing.append(prandial_tag_id)
+    return missing
+
+
+def _threshold(
+    thresholds: Dict[str, TrustomerThreshold], end: Literal["high", "low"]
+) -> Any:
+    # The given end of the threshold for each reading's prandial tag, as an expression.
+    other: Optional[TrustomerThreshold] = thresholds.get(OTHER_THRESHOLD_KEY)
+    default: Optional[float] = other[end] if other else None
+    by_prandial_tag_id: Dict[str, float] = {
+        PRANDIAL_TAG_ID_PREFIX + key: threshold[end]
+        for key, threshold in thresholds.items()
+        if key != OTHER_THRESHOLD_KEY
+    }
+    if not by_prandial_tag_id:
+        return default
+    return case(by_prandial_tag_id, value=Reading.prandial_tag_id, else_=default)
+
+
+def get_out_of_threshold_counts(
+    since: datetime, thresholds: Dict[str, TrustomerThreshold]
+) -> Dict[str, OutOfThresholdCounts]:
+    """
+    Counts each patient's readings measured since the given time, and how many of them
+    are above or below the thresholds (in mmol/L) for their prandial tags, in a single
+    grouped query. Patients without readings in that time are left out. Every prandial
+    tag must have thresholds, as per get_prandial_tags_without_thresholds.
+    """
+    value_mmoll = case(
+        (Reading.units == "mg/dL", Reading.blood_glucose_value / MGDL_PER_MMOLL),
+        else_=Reading.blood_glucose_value,
+    )
+    out_of_threshold = or_(
+        value_mmoll > _threshold(thresholds, "high"),
+        value_mmoll < _threshold(thresholds, "low"),
+    )
+    rows = (
+        db.session.query(
+            Reading.patient_id,
+            func.count().label("readings_count"),
+            func.count().filter(out_of_threshold).label("out_of_threshold_count"),
+        )
+        .filter(Reading.measured_timestamp >= since)
+        .group_by(Reading.patient_id)
+    )
+    return {
+        row.patient_id: OutOfThresholdCounts(
+            readings_count=row.readings_count,
+            out_of_threshold_count=row.out_of_threshold_count,
+        )
+        for row in rows
+    }
@@ -0,0 +1,132 @@
+from datetime import datetime
+from typing import Any, Dict, List, NamedTuple
+
+from flask_batteries_included.sqldb import db
+from sqlalchemy import func, or_, select
+from sqlalchemy.sql.selectable import Select
+
+from gdm_bg_readings_api.models.reading import Reading
+
+NORMAL_BANDING_ID = "BG-READING-BANDING-NORMAL"
+
+
+class ReadingStatisticsRow(NamedTuple):
+    min_reading_id: str
+    max_reading_id: str
+    readings_count: int
+    readings_count_banding_normal: int
+
+
+class PatientReadingStatistics(NamedTuple):
+    overall: ReadingStatisticsRow
+    # Keyed by prandial tag UUID; empty unless requested.
+    by_prandial_tag: Dict[str, ReadingStatisticsRow]
+
+
+def _window_columns(prefix: str, *partition_by: Any) -> List[Any]:
+    # The minimum is the most recent of equal lowest readings, and the maximum the
+    # earliest of equal highest readings.
+    return [
+        func.row_number()
+        .over(
+            partition_by=partition_by,
+            order_by=(
+                Reading.blood_glucose_value.asc(),
+                Reading.measured_timestamp.desc(),
+                Reading.uuid,
+            ),
+        )
+        .label(f"{prefix}_min_rank"),
+        func.row_number()
+        .over(
+            partition_by=partition_by,
+            order_by=(
+                Reading.blood_glucose_value.desc(),
+                Reading.measured_timestamp.asc(),
+                Reading.uuid,
+            ),
+        )
+        .label(f"{prefix}_max_rank"),
+        func.count().over(partition_by=partition_by).label(f"{prefix}_count"),
+        func.count()
+        .filter(Reading.reading_banding_id == NORMAL_BANDING_ID)
+        .over(partition_by=partition_by)
+        .label(f"{prefix}_normal_count"),
+    ]
+
+
+def _statistics_query(earliest_allowed: datetime, by_prandial_tag: bool) -> Select:
+    """
+    Ranks each reading in the window among its patient's readings (and, optionally,
+    among the readings for the patient with the same prandial tag), alongside the
+    counts for the partition, then keeps only the extreme readings.
+    """
+    prefixes = ["patient", "tag"] if by_prandial_tag else ["patient"]
+    columns = _window_columns("patient", Reading.patient_id)
+    if by_prandial_tag:
+        columns += _window_columns("tag", Reading.patient_id, Reading.prandial_tag_id)
+    ranked = (
+        select(Reading.uuid, Reading.patient_id, Reading.prandial_tag_id, *columns)
+        .where(Reading.measured_timestamp > earliest_allowed)
+        .subquery("ranked")
+    )
+    return select(ranked).where(
+        or_(
+            *(
+                ranked.c[f"{prefix}_{end}_rank"] == 1
+                for prefix in prefixes
+                for end in ("min", "max")
+            )
+        )
+    )
+
+
+def _add_extreme(
+    partial: Dict[Any, Dict[str, Any]], key: Any, row: Any, prefix: str
+) -> None:
+    stats = partial.setdefault(
+        key,
+        {
+            "readings_count": row[f"{prefix}_count"],
+            "readings_count_banding_normal": row[f"{prefix}_normal_count"],
+        },
+    )
+    if row[f"{prefix}_min_rank"] == 1:
+        stats["min_reading_id"] = row["uuid"]
+    if row[f"{prefix}_max_rank"] == 1:
+        stats["max_reading_id"] = row["uuid"]
+
+
+def reading_statistics(
+    earliest_allowed: datetime, by_prandial_tag: bool = False
+) -> Dict[str, PatientReadingStatistics]:
+    """
+    Computes, in a single query, each patient's minimum and maximum readings (as reading
+    UUIDs), number of readings, and number of readings banded as normal, over readings
+    measured after the given (naive UTC) time. Optionally, the same statistics are also
+    computed per prandial tag. Returns a map of patient UUID to statistics.
+    """
+    overall: Dict[Any, Dict[str, Any]] = {}
+    by_tag: Dict[Any, Dict[str, Any]] = {}
+    for row in db.session.execute(_statistics_query(earliest_allowed, by_prandial_tag)):
+        mapping = row._mapping
+        if mapping["patient_min_rank"] == 1 or mapping["patient_max_rank"] == 1:
+            _add_extreme(overall, mapping["patient_id"], mapping, "patient")
+        if by_prandial_tag and (
+            mapping["tag_min_rank"] == 1 or mapping["tag_max_rank"] == 1
+        ):
+            key = (mapping["patient_id"], mapping["prandial_tag_id"])
+            _add_extreme(by_tag, key, mapping, "tag")
+
+    tag_statistics: Dict[str, Dict[str, ReadingStatisticsRow]] = {}
+    for (patient_id, prandial_tag_id), stats in by_tag.items():
+        tag_statistics.setdefault(patient_id, {})[
+            prandial_tag_id
+        ] = ReadingStatisticsRow(**stats)
+    return {
+        patient_id: PatientReadingStatistics(
+            overall=ReadingStatisticsRow(**stats),
+            by_prandial_tag=tag_statistics.get(patient_id, {}),
+        )
+        for patient_id, stats in overall.items()
+    }
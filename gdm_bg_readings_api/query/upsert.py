@@ -0,0 +1,229 @@
+from datetime import datetime
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from flask_batteries_included.helpers.security.jwt import current_jwt_user
+from flask_batteries_included.sqldb import db
+from sqlalchemy import false, or_, select, true, tuple_, union_all, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.sql.selectable import CompoundSelect
+
+from gdm_bg_readings_api.models.patient import Patient
+from gdm_bg_readings_api.models.reading import Reading
+
+# Columns of reading_unique_idx, used as the ON CONFLICT target.
+READING_UNIQUE_COLUMNS = (
+    "blood_glucose_value",
+    "units",
+    "measured_timestamp",
+    "measured_timezone",
+    "patient_id",
+)
+
+
+class PatientSnoozePeriod(NamedTuple):
+    suppress_reading_alerts_from: Optional[datetime]
+    suppress_reading_alerts_until: Optional[datetime]
+
+
+def identifier_values() -> Dict[str, Any]:
+    """
+    Values for the ModelIdentifier audit columns. Column defaults are not applied to an
+    INSERT embedded in a CTE, so they must be supplied explicitly.
+    """
+    now = datetime.utcnow()
+    user = current_jwt_user()
+    return {"created": now, "created_by_": user, "modified": now, "modified_by_": user}
+
+
+def _postgresql_insert_reading(values: Dict[str, Any]) -> CompoundSelect:
+    """
+    WITH inserted AS (INSERT ... ON CONFLICT DO NOTHING RETURNING uuid)
+    SELECT uuid, true FROM inserted UNION ALL SELECT uuid, false FROM reading WHERE ...
+
+    The second SELECT sees the table as it was before the insert, so at most one of the
+    two halves returns a row.
+    """
+    inserted = (
+        postgresql.insert(Reading.__table__)
+        .values(**values)
+        .on_conflict_do_nothing(index_elements=READING_UNIQUE_COLUMNS)
+        .returning(Reading.uuid)
+        .cte("inserted")
+    )
+    return union_all(
+        select(inserted.c.uuid, true().label("is_new")),
+        select(Reading.uuid, false().label("is_new")).filter_by(
+            **{c: values[c] for c in READING_UNIQUE_COLUMNS}
+        ),
+    )
+
+
+def _reading_values(reading: Reading, audit_values: Dict[str, Any]) -> Dict[str, Any]:
+    values: Dict[str, Any] = {
+        column.key: getattr(reading, column.key) for column in Reading.__table__.columns
+    }
+    values.update(audit_values)
+    values["snoozed"] = bool(values["snoozed"])
+    return values
+
+
+def _unique_key(values: Dict[str, Any]) -> Tuple:
+    return tuple(values[c] for c in READING_UNIQUE_COLUMNS)
+
+
+def insert_reading(reading: Reading) -> Tuple[str, bool]:
+    """
+    Inserts the row for a (transient) reading unless it duplicates a stored reading, using
+    INSERT ... ON CONFLICT DO NOTHING on reading_unique_idx. Returns the UUID of the stored
+    reading and whether it was newly inserted.
+
+    On PostgreSQL the duplicate's UUID comes back in the same round-trip as the insert. A
+    duplicate committed by a concurrent transaction while the statement runs is not
+    visible to it, so in that case we fall back to a separate query.
+    """
+    values: Dict[str, Any] = _reading_values(reading, identifier_values())
+
+    if db.engine.dialect.name == "postgresql":
+        row = db.session.execute(_postgresql_insert_reading(values)).first()
+        if row is not None:
+            return row.uuid, row.is_new
+    else:
+        # SQLite (used for tests) supports ON CONFLICT but SQLAlchemy 1.4 cannot use
+        # RETURNING with it, so the row count tells us whether the row was inserted.
+        result = db.session.execute(
+            sqlite.insert(Reading.__table__)
+            .values(**values)
+            .on_conflict_do_nothing(index_elements=READING_UNIQUE_COLUMNS)
+        )
+        if result.rowcount == 1:
+            return values["uuid"], True
+
+    existing_uuid: str = (
+        db.session.query(Reading.uuid)
+        .filter_by(**{c: values[c] for c in READING_UNIQUE_COLUMNS})
+        .scalar()
+    )
+    return existing_uuid, False
+
+
+def insert_readings(readings: List[Reading]) -> Dict[str, str]:
+    """
+    Inserts the rows for (transient) readings, skipping any that duplicate a stored
+    reading, as per insert_reading. The readings must not duplicate each other. The rows
+    are inserted with one INSERT ... ON CONFLICT DO NOTHING on reading_unique_idx, and the
+    stored readings found with one SELECT, which also sees any duplicates committed by
+    concurrent transactions. Returns the UUID of the stored reading for each reading's
+    UUID, which is the reading's own if it was inserted.
+    """
+    if not readings:
+        return {}
+    audit_values: Dict[str, Any] = identifier_values()
+    rows: List[Dict[str, Any]] = [
+        _reading_values(reading, audit_values) for reading in readings
+    ]
+    if db.engine.dialect.name == "postgresql":
+        insert = postgresql.insert(Reading.__table__)
+    else:
+        insert = sqlite.insert(Reading.__table__)
+    db.session.execute(
+        insert.on_conflict_do_nothing(index_elements=READING_UNIQUE_COLUMNS), rows
+    )
+    # The readings are given the audit values they were stored with, for rendering.
+    for reading in readings:
+        for key, value in audit_values.items():
+            setattr(reading, key, value)
+
+    unique_columns: List[Any] = [getattr(Reading, c) for c in READING_UNIQUE_COLUMNS]
+    stored_reading_ids: Dict[Tuple, str] = {
+        tuple(row[1:]): row[0]
+        for row in db.session.query(Reading.uuid, *unique_columns).filter(
+            tuple_(*unique_columns).in_([_unique_key(values) for values in rows])
+        )
+    }
+    return {values["uuid"]: stored_reading_ids[_unique_key(values)] for values in rows}
+
+
+def _postgresql_ensure_patient(values: Dict[str, Any]) -> CompoundSelect:
+    """
+    WITH inserted AS (INSERT ... ON CONFLICT DO NOTHING RETURNING <snooze columns>)
+    SELECT <snooze columns> FROM inserted UNION ALL SELECT <snooze columns> FROM patient ...
+    """
+    inserted = (
+        postgresql.insert(Patient.__table__)
+        .values(**values)
+        .on_conflict_do_nothing(index_elements=["uuid"])
+        .returning(
+            Patient.suppress_reading_alerts_from,
+            Patient.suppress_reading_alerts_until,
+        )
+        .cte("inserted")
+    )
+    return union_all(
+        select(
+            inserted.c.suppress_reading_alerts_from,
+            inserted.c.suppress_reading_alerts_until,
+        ),
+        select(
+            Patient.suppress_reading_alerts_from,
+            Patient.suppress_reading_alerts_until,
+        ).filter_by(uuid=values["uuid"]),
+    )
+
+
+def ensure_patient(patient_id: str) -> PatientSnoozePeriod:
+    """
+    Creates the patient with the given UUID if they don't already exist, using
+    INSERT ... ON CONFLICT DO NOTHING so that concurrent first writes for a patient don't
+    race on the primary key. Returns the patient's alerts snooze period, which is what the
+    reading ingest path needs.
+    """
+    values: Dict[str, Any] = {"uuid": patient_id, **identifier_values()}
+
+    if db.engine.dialect.name == "postgresql":
+        row = db.session.execute(_postgresql_ensure_patient(values)).first()
+        if row is not None:
+            return PatientSnoozePeriod(*row)
+    else:
+        result = db.session.execute(
+            sqlite.insert(Patient.__table__)
+            .values(**values)
+            .on_conflict_do_nothing(index_elements=["uuid"])
+        )
+        if result.rowcount == 1:
+            return PatientSnoozePeriod(None, None)
+
+    return PatientSnoozePeriod(
+        *db.session.query(
+            Patient.suppress_reading_alerts_from,
+            Patient.suppress_reading_alerts_until,
+        )
+        .filter_by(uuid=patient_id)
+        .one()
+    )
+
+
+def advance_latest_reading(
+    patient_id: str, reading_uuid: str, measured_timestamp: datetime
+) -> None:
+    """
+    Points the patient's latest reading at the given reading, unless the patient already
+    has a later one, so that storing a backdated reading leaves it as it is. Readings
+    measured at the same instant are ordered by UUID, as for keyset pagination. The
+    comparison is made in the UPDATE itself, so concurrent ingests for a patient can't
+    move the pointer backwards.
+    """
+    db.session.execute(
+        update(Patient.__table__)
+        .where(
+            Patient.uuid == patient_id,
+            or_(
+                Patient.latest_measured_timestamp.is_(None),
+                tuple_(Patient.latest_measured_timestamp, Patient.latest_reading_id)
+                < tuple_(measured_timestamp, reading_uuid),
+            ),
+        )
+        .values(
+            latest_reading_id=reading_uuid,
+            latest_measured_timestamp=measured_timestamp,
+        )
+    )
@@ -1,15 +1,26 @@
+import threading
+import time
 import uuid
 from enum import Enum
-from typing import Dict, TypedDict
+from typing import Dict, NamedTuple, Optional, TypedDict
 
 import requests
-from cachetools import TTLCache, cached
-from flask import current_app
+from flask import Flask, current_app
 from flask_batteries_included.helpers.error_handler import ServiceUnavailableException
+from prometheus_client import Counter
 from she_logging import logger
 from she_logging.request_id import current_request_id
 
-from gdm_bg_readings_api import config
+TRUSTOMER_CONFIG_CACHE_COUNT = Counter(
+    "gdm_trustomer_config_cache_count",
+    "Trustomer config cache lookups",
+    ["result"],
+)
+TRUSTOMER_CONFIG_REFRESH_COUNT = Counter(
+    "gdm_trustomer_config_refresh_count",
+    "Trustomer config background refreshes",
+    ["result"],
+)
 
 
 class AlertsSystem(Enum):
@@ -22,27 +33,36 @@ class TrustomerThreshold(TypedDict):
     low: float
 
 
+class PercentagesAlertsConfig(TypedDict):
+    # The number of days of readings to consider, up to now.
+    window_days: int
+    # The percentages of out-of-threshold readings at which alerts are raised.
+    red_percentage: float
+    amber_percentage: float
+
+
 def get_trustomer_base_url() -> str:
     return current_app.config["DHOS_TRUSTOMER_API_HOST"]
 
 
-_cache: TTLCache = TTLCache(1, config.Configuration().TRUSTOMER_CONFIG_CACHE_TTL_SEC)
+# Requests to trustomer reuse pooled connections rather than opening one each time.
+_session = requests.Session()
 
 
-@cached(cache=_cache)  # cache for 1 hour
-def get_trustomer_config() -> Dict:
-    customer_code = current_app.config["CUSTOMER_CODE"].lower()
-    url = f"{get_trustomer_base_url()}/dhos/v1/trustomer/{customer_code}"
+def _fetch_trustomer_config(app: Flask, request_id: Optional[str]) -> Dict:
+    customer_code = app.config["CUSTOMER_CODE"].lower()
+    url = f"{app.config['DHOS_TRUSTOMER_API_HOST']}/dhos/v1/trustomer/{customer_code}"
     logger.info("Fetching trustomer config from %s", url)
     try:
-        response = requests.get(
+        response = _session.get(
             url=url,
             headers={
-                "X-Request-ID": current_request_id() or str(uuid.uuid4()),
-                "Authorization": current_app.config["POLARIS_API_KEY"],
+                "X-Request-ID": request_id or str(uuid.uuid4()),
+                "Authorization": app.config["POLARIS_API_KEY"],
                 "X-Trustomer": customer_code,
                 "X-Product": "polaris",
             },
+            timeout=app.config["TRUSTOMER_REQUEST_TIMEOUT_SEC"],
         )
         response.raise_for_status()
     except requests.RequestException as e:
@@ -51,6 +71,103 @@ def get_trustomer_config() -> Dict:
     return response.json()
 
 
+class _CachedConfig(NamedTuple):
+    config: Dict
+    fetched_at: float
+
+
+class _TrustomerConfigCache:
+    """
+    Holds the trustomer config for TRUSTOMER_CONFIG_CACHE_TTL_SEC. Once it is stale, the
+    last good config is still served while a single background thread fetches it again.
+    If that fails, refreshes back off exponentially up to
+    TRUSTOMER_REFRESH_MAX_BACKOFF_SEC. Only the first fetch, before there is any config
+    to serve, blocks the request. Each worker fetches the config from trustomer itself,
+    so the config it serves is never more than TRUSTOMER_CONFIG_CACHE_TTL_SEC old
+    (besides while refreshes are failing).
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._entry: Optional[_CachedConfig] = None
+        self._refresh_thread: Optional[threading.Thread] = None
+        self._failures: int = 0
+        self._retry_at: float = 0.0
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entry = None
+            self._failures = 0
+            self._retry_at = 0.0
+
+    def get(self, app: Flask) -> Dict:
+        entry: Optional[_CachedConfig] = self._entry
+        if entry is None:
+            return self._load(app)
+        ttl: int = app.config["TRUSTOMER_CONFIG_CACHE_TTL_SEC"]
+        if time.monotonic() - entry.fetched_at <= ttl:
+            TRUSTOMER_CONFIG_CACHE_COUNT.labels("hit").inc()
+        else:
+            TRUSTOMER_CONFIG_CACHE_COUNT.labels("stale").inc()
+            self._start_refresh(app)
+        return entry.config
+
+    def _load(self, app: Flask) -> Dict:
+        with self._lock:
+            # Another request may have fetched it while this one waited for the lock.
+            if self._entry is not None:
+                TRUSTOMER_CONFIG_CACHE_COUNT.labels("hit").inc()
+                return self._entry.config
+            TRUSTOMER_CONFIG_CACHE_COUNT.labels("miss").inc()
+            config: Dict = _fetch_trustomer_config(app, current_request_id())
+            self._entry = _CachedConfig(config=config, fetched_at=time.monotonic())
+            return config
+
+    def _start_refresh(self, app: Flask) -> None:
+        with self._lock:
+            if (
+                self._refresh_thread is not None and self._refresh_thread.is_alive()
+            ) or time.monotonic() < self._retry_at:
+                return
+            self._refresh_thread = threading.Thread(
+                target=self._refresh,
+                args=(app, current_request_id()),
+                name="trustomer-config-refresh",
+                daemon=True,
+            )
+            self._refresh_thread.start()
+
+    def _refresh(self, app: Flask, request_id: Optional[str]) -> None:
+        try:
+            config: Dict = _fetch_trustomer_config(app, request_id)
+        except Exception:
+            # Any failure, e.g. an unexpected response, backs off rather than killing
+            # the refresh thread and leaving every stale request to start another.
+            logger.exception("Failed to refresh trustomer config")
+            TRUSTOMER_CONFIG_REFRESH_COUNT.labels("failed").inc()
+            with self._lock:
+                self._failures += 1
+                backoff: int = min(
+                    2 ** (self._failures - 1),
+                    app.config["TRUSTOMER_REFRESH_MAX_BACKOFF_SEC"],
+                )
+                self._retry_at = time.monotonic() + backoff
+            logger.warning("Serving stale trustomer config, retrying in %ds", backoff)
+            return
+        TRUSTOMER_CONFIG_REFRESH_COUNT.labels("success").inc()
+        with self._lock:
+            self._entry = _CachedConfig(config=config, fetched_at=time.monotonic())
+            self._failures = 0
+            self._retry_at = 0.0
+
+
+_cache = _TrustomerConfigCache()
+
+
+def get_trustomer_config() -> Dict:
+    return _cache.get(current_app._get_current_object())  # type: ignore[attr-defined]
+
+
 def get_alerts_system() -> AlertsSystem:
     """
     Returns the blood glucose readings alerts system from trustomer. Defaults to "counts".
@@ -68,3 +185,27 @@ def get_alerts_snooze_duration_days() -> int:
     trustomer_config = get_trustomer_config()
     gdm_config = trustomer_config.get("gdm_config", {})
     return gdm_config.get("alerts_snooze_duration_days", 2)
+
+
+def get_blood_glucose_thresholds() -> Dict[str, TrustomerThreshold]:
+    """
+    Returns the blood glucose thresholds (in mmol/L) from trustomer, keyed by prandial
+    tag (e.g. "BEFORE-BREAKFAST"). Readings with other prandial tags use "OTHER".
+    """
+    trustomer_config = get_trustomer_config()
+    gdm_config = trustomer_config.get("gdm_config", {})
+    return gdm_config.get("blood_glucose_thresholds_mmoll", {})
+
+
+def get_percentages_alerts_config() -> PercentagesAlertsConfig:
+    """
+    Returns the settings for calculating "percentages" alerts from trustomer. Defaults to
+    a red alert at 30% and an amber alert at 10% of readings out of threshold over 7 days.
+    """
+    trustomer_config = get_trustomer_config()
+    gdm_config = trustomer_config.get("gdm_config", {})
+    return {
+        "window_days": gdm_config.get("alerts_percentages_window_days", 7),
+        "red_percentage": gdm_config.get("alerts_percentages_red_percentage", 30),
+        "amber_percentage": gdm_config.get("alerts_percentages_amber_percentage", 10),
+    }
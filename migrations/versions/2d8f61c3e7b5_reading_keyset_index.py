@@ -0,0 +1,27 @@
+"""reading keyset index
+
+Revision ID: 2d8f61c3e7b5
+Revises: 7c1e4d2b9a60
+Create Date: 2026-10-16 14:02:17.550921
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "2d8f61c3e7b5"
+down_revision = "7c1e4d2b9a60"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        "reading_patient_measured_idx",
+        "reading",
+        ["patient_id", "measured_timestamp", "uuid"],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index("reading_patient_measured_idx", table_name="reading")
@@ -0,0 +1,48 @@
+"""reading daily rollup
+
+Revision ID: 4f7c2e9a8b16
+Revises: 9e2a7b4c1d03
+Create Date: 2026-10-17 11:26:52.730415
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "4f7c2e9a8b16"
+down_revision = "9e2a7b4c1d03"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Populate with "flask backfill-daily-rollups" after upgrading.
+    op.create_table(
+        "reading_daily_rollup",
+        sa.Column("uuid", sa.String(length=36), nullable=False),
+        sa.Column("created", sa.DateTime(), nullable=False),
+        sa.Column("created_by_", sa.String(), nullable=False),
+        sa.Column("modified", sa.DateTime(), nullable=False),
+        sa.Column("modified_by_", sa.String(), nullable=False),
+        sa.Column("patient_id", sa.String(length=36), nullable=False),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("prandial_tag_id", sa.String(length=36), nullable=False),
+        sa.Column("readings_count", sa.Integer(), nullable=False),
+        sa.Column("readings_count_banding_normal", sa.Integer(), nullable=False),
+        sa.Column("min_blood_glucose_value", sa.Float(), nullable=False),
+        sa.Column("max_blood_glucose_value", sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(["patient_id"], ["patient.uuid"]),
+        sa.ForeignKeyConstraint(["prandial_tag_id"], ["prandial_tag.uuid"]),
+        sa.PrimaryKeyConstraint("uuid"),
+    )
+    op.create_index(
+        "reading_daily_rollup_unique_idx",
+        "reading_daily_rollup",
+        ["patient_id", "day", "prandial_tag_id"],
+        unique=True,
+    )
+
+
+def downgrade():
+    op.drop_index("reading_daily_rollup_unique_idx", table_name="reading_daily_rollup")
+    op.drop_table("reading_daily_rollup")
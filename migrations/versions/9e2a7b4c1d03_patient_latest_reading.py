@@ -0,0 +1,44 @@
+"""patient latest reading
+
+Revision ID: 9e2a7b4c1d03
+Revises: 2d8f61c3e7b5
+Create Date: 2026-10-17 09:41:05.218634
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "9e2a7b4c1d03"
+down_revision = "2d8f61c3e7b5"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "patient",
+        sa.Column("latest_reading_id", sa.String(length=36), nullable=True),
+    )
+    op.add_column(
+        "patient",
+        sa.Column("latest_measured_timestamp", sa.DateTime(), nullable=True),
+    )
+    op.execute(
+        """
+        UPDATE patient
+        SET latest_reading_id = latest.uuid,
+            latest_measured_timestamp = latest.measured_timestamp
+        FROM (
+            SELECT DISTINCT ON (patient_id) patient_id, uuid, measured_timestamp
+            FROM reading
+            ORDER BY patient_id, measured_timestamp DESC, uuid DESC
+        ) AS latest
+        WHERE patient.uuid = latest.patient_id
+        """
+    )
+
+
+def downgrade():
+    op.drop_column("patient", "latest_measured_timestamp")
+    op.drop_column("patient", "latest_reading_id")
@@ -0,0 +1,22 @@
+"""dose reading id index
+
+Revision ID: b5e1c8d4f270
+Revises: 4f7c2e9a8b16
+Create Date: 2026-10-17 15:21:43.208417
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "b5e1c8d4f270"
+down_revision = "4f7c2e9a8b16"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index("dose_reading_id_idx", "dose", ["reading_id"], unique=False)
+
+
+def downgrade():
+    op.drop_index("dose_reading_id_idx", table_name="dose")
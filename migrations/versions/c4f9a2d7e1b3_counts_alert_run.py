@@ -0,0 +1,47 @@
+"""counts alert run
+
+Revision ID: c4f9a2d7e1b3
+Revises: e8d3a6f1c2b7
+Create Date: 2026-10-17 18:22:41.907314
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "c4f9a2d7e1b3"
+down_revision = "e8d3a6f1c2b7"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Populate with "flask backfill-counts-alert-runs" after upgrading.
+    op.create_table(
+        "counts_alert_run",
+        sa.Column("uuid", sa.String(length=36), nullable=False),
+        sa.Column("created", sa.DateTime(), nullable=False),
+        sa.Column("created_by_", sa.String(), nullable=False),
+        sa.Column("modified", sa.DateTime(), nullable=False),
+        sa.Column("modified_by_", sa.String(), nullable=False),
+        sa.Column("patient_id", sa.String(length=36), nullable=False),
+        sa.Column("prandial_tag_id", sa.String(length=36), nullable=False),
+        sa.Column("last_reading_id", sa.String(length=36), nullable=True),
+        sa.Column("last_measured_timestamp", sa.DateTime(), nullable=True),
+        sa.Column("run_length", sa.Integer(), nullable=False),
+        sa.Column("run_reading_ids", sa.JSON(), nullable=False),
+        sa.ForeignKeyConstraint(["patient_id"], ["patient.uuid"]),
+        sa.ForeignKeyConstraint(["prandial_tag_id"], ["prandial_tag.uuid"]),
+        sa.PrimaryKeyConstraint("uuid"),
+    )
+    op.create_index(
+        "counts_alert_run_unique_idx",
+        "counts_alert_run",
+        ["patient_id", "prandial_tag_id"],
+        unique=True,
+    )
+
+
+def downgrade():
+    op.drop_index("counts_alert_run_unique_idx", table_name="counts_alert_run")
+    op.drop_table("counts_alert_run")
@@ -0,0 +1,25 @@
+"""outbox message failed at
+
+Revision ID: e8d3a6f1c2b7
+Revises: b5e1c8d4f270
+Create Date: 2026-10-17 16:04:12.583120
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "e8d3a6f1c2b7"
+down_revision = "b5e1c8d4f270"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "outbox_message", sa.Column("failed_at", sa.DateTime(), nullable=True)
+    )
+
+
+def downgrade():
+    op.drop_column("outbox_message", "failed_at")
@@ -23,7 +23,7 @@ from mock import Mock
 from pytest_mock import MockFixture
 from sqlalchemy.orm import Session
 
-from gdm_bg_readings_api import trustomer
+from gdm_bg_readings_api import cache, trustomer
 from gdm_bg_readings_api.blueprint_api import controller
 from gdm_bg_readings_api.models.patient import Patient
 from gdm_bg_readings_api.models.reading import Reading
@@ -36,6 +36,12 @@ def mock_publish_abnormal(mocker: MockFixture) -> Mock:
     )
 
 
+@pytest.fixture(autouse=True)
+def clear_cache() -> None:
+    # Cached values would otherwise outlive the database they came from.
+    cache.clear()
+
+
 @pytest.fixture(scope="session")
 def session_app() -> Flask:
     import gdm_bg_readings_api.app
@@ -299,6 +299,63 @@ class TestApi:
         response_reading_id: str = response.json["uuid"]
         assert response_reading_id == reading_id
 
+    def test_post_readings_success(
+        self,
+        client: FlaskClient,
+        mocker: MockFixture,
+        reading_dict_in: Dict,
+        patient_uuid: str,
+    ) -> None:
+        mock_create: Mock = mocker.patch.object(
+            controller,
+            "create_readings",
+            return_value=[{"status": "created", "reading_id": generate_uuid()}],
+        )
+        response = client.post(
+            f"/gdm/v2/patient/{patient_uuid}/readings",
+            json=[reading_dict_in],
+            headers={"Authorization": "Bearer TOKEN"},
+        )
+        assert response.status_code == 200
+        assert response.json == mock_create.return_value
+        mock_create.assert_called_once_with(
+            patient_id=patient_uuid, readings_data=[reading_dict_in]
+        )
+
+    def test_post_readings_per_item_status(self, client: FlaskClient) -> None:
+        reading_data = {
+            "blood_glucose_value": 5.5,
+            "units": "mmol/L",
+            "measured_timestamp": "2000-01-01T01:01:01.000Z",
+            "banding_id": "BG-READING-BANDING-NORMAL",
+        }
+        response = client.post(
+            "/gdm/v2/patient/123/readings",
+            json=[
+                reading_data,
+                {**reading_data, "measured_timestamp": "t1m3st4mp"},
+                reading_data,
+            ],
+            headers={"Authorization": "Bearer TOKEN"},
+        )
+        assert response.status_code == 200
+        assert response.json
+        created, invalid, duplicate = response.json
+        assert created["status"] == "created"
+        assert invalid["status"] == "invalid"
+        assert duplicate == {"status": "duplicate", "reading_id": created["reading_id"]}
+
+        # Resending the batch finds the stored reading.
+        response = client.post(
+            "/gdm/v2/patient/123/readings",
+            json=[reading_data],
+            headers={"Authorization": "Bearer TOKEN"},
+        )
+        assert response.status_code == 200
+        assert response.json == [
+            {"status": "duplicate", "reading_id": created["reading_id"]}
+        ]
+
     def test_get_reading_by_uuid(
         self, client: FlaskClient, mocker: MockFixture, patient_uuid: str
     ) -> None:
@@ -338,6 +395,116 @@ class TestApi:
             patient_id=patient_uuid, prandial_tag_value=None
         )
 
+    def test_get_readings_not_modified(
+        self, client: FlaskClient, mocker: MockFixture, patient_uuid: str
+    ) -> None:
+        mocker.patch.object(controller, "get_readings_etag", return_value="abc")
+        mock_retrieve: Mock = mocker.patch.object(
+            controller,
+            "retrieve_readings_for_patient_with_tag",
+            return_value=[{"uuid": generate_uuid()}],
+        )
+        response = client.get(
+            f"/gdm/v1/patient/{patient_uuid}/reading",
+            headers={"Authorization": "Bearer TOKEN"},
+        )
+        assert response.status_code == 200
+        assert response.headers["ETag"] == '"abc"'
+        assert mock_retrieve.call_count == 1
+
+        # The readings aren't retrieved again if the client already has them.
+        response = client.get(
+            f"/gdm/v1/patient/{patient_uuid}/reading",
+            headers={"Authorization": "Bearer TOKEN", "If-None-Match": '"abc"'},
+        )
+        assert response.status_code == 304
+        assert response.headers["ETag"] == '"abc"'
+        assert not response.data
+        assert mock_retrieve.call_count == 1
+
+        response = client.get(
+            f"/gdm/v1/patient/{patient_uuid}/reading",
+            headers={"Authorization": "Bearer TOKEN", "If-None-Match": '"old"'},
+        )
+        assert response.status_code == 200
+        assert mock_retrieve.call_count == 2
+
+    def test_get_patient_by_uuid_not_modified(
+        self, client: FlaskClient, mocker: MockFixture, patient_uuid: str
+    ) -> None:
+        mocker.patch.object(controller, "get_patient_etag", return_value="abc")
+        mock_get: Mock = mocker.patch.object(controller, "get_patient")
+        response = client.get(
+            f"/gdm/v1/patient/{patient_uuid}",
+            headers={"Authorization": "Bearer TOKEN", "If-None-Match": '"abc"'},
+        )
+        assert response.status_code == 304
+        assert mock_get.call_count == 0
+
+    def test_get_readings_paginated(
+        self, client: FlaskClient, mocker: MockFixture, patient_uuid: str
+    ) -> None:
+        mock_retrieve: Mock = mocker.patch.object(
+            controller,
+            "retrieve_reading_page_for_patient",
+            return_value=controller.ReadingPage(
+                readings=[{"uuid": generate_uuid()}],
+                next_cursor="next",
+                previous_cursor=None,
+            ),
+        )
+        response = client.get(
+            f"/gdm/v1/patient/{patient_uuid}/reading?limit=1&before=cursor",
+            headers={"Authorization": "Bearer TOKEN"},
+        )
+        assert response.status_code == 200
+        assert response.json is not None
+        assert len(response.json) == 1
+        assert response.headers["X-Next-Cursor"] == "next"
+        assert "X-Previous-Cursor" not in response.headers
+        mock_retrieve.assert_called_with(
+            patient_id=patient_uuid,
+            prandial_tag_value=None,
+            limit=1,
+            before="cursor",
+            after=None,
+        )
+
+    def test_get_readings_filter_paginated_default_limit(
+        self, client: FlaskClient, mocker: MockFixture, patient_uuid: str
+    ) -> None:
+        mock_retrieve: Mock = mocker.patch.object(
+            controller,
+            "retrieve_reading_page_for_patient",
+            return_value=controller.ReadingPage(
+                readings=[], next_cursor=None, previous_cursor="previous"
+            ),
+        )
+        response = client.get(
+            f"/gdm/v1/patient/{patient_uuid}/reading/filter/2?after=cursor",
+            headers={"Authorization": "Bearer TOKEN"},
+        )
+        assert response.status_code == 200
+        assert response.json == []
+        assert response.headers["X-Previous-Cursor"] == "previous"
+        mock_retrieve.assert_called_with(
+            patient_id=patient_uuid,
+            prandial_tag_value=2,
+            limit=controller.DEFAULT_READING_PAGE_SIZE,
+            before=None,
+            after="cursor",
+        )
+
+    @pytest.mark.parametrize("limit", [0, 1001])
+    def test_get_readings_invalid_limit(
+        self, client: FlaskClient, patient_uuid: str, limit: int
+    ) -> None:
+        response = client.get(
+            f"/gdm/v1/patient/{patient_uuid}/reading?limit={limit}",
+            headers={"Authorization": "Bearer TOKEN"},
+        )
+        assert response.status_code == 400
+
     def test_get_readings_recent_success(
         self, client: FlaskClient, mocker: MockFixture, patient_uuid: str
     ) -> None:
@@ -371,6 +538,33 @@ class TestApi:
         assert mock_get.call_count == 1
         mock_get.assert_called_with(days=30, compact=False)
 
+    def test_get_readings_recent_stream(
+        self, client: FlaskClient, mocker: MockFixture, patient_uuid: str
+    ) -> None:
+        mock_iter: Mock = mocker.patch.object(
+            controller,
+            "iter_readings_for_period",
+            return_value=iter(
+                [
+                    (patient_uuid, {"uuid": "reading_1"}),
+                    (patient_uuid, {"uuid": "reading_2"}),
+                    ("other_patient", {"uuid": "reading_3"}),
+                ]
+            ),
+        )
+        response = client.get(
+            "/gdm/v1/reading/recent?days=30&stream=true",
+            headers={"Authorization": "Bearer TOKEN"},
+        )
+        assert response.status_code == 200
+        assert response.is_streamed
+        assert response.mimetype == "application/json"
+        assert response.json == {
+            patient_uuid: [{"uuid": "reading_1"}, {"uuid": "reading_2"}],
+            "other_patient": [{"uuid": "reading_3"}],
+        }
+        mock_iter.assert_called_with(days=30, compact=True)
+
     def test_get_readings_filter(
         self, client: FlaskClient, mocker: MockFixture, patient_uuid: str
     ) -> None:
@@ -408,6 +602,29 @@ class TestApi:
         assert mock_retrieve.call_count == 1
         mock_retrieve.assert_called_with(patient_id=patient_uuid)
 
+    def test_get_daily_reading_summaries(
+        self, client: FlaskClient, mocker: MockFixture, patient_uuid: str
+    ) -> None:
+        mock_retrieve: Mock = mocker.patch.object(
+            controller, "retrieve_daily_summaries_for_patient", return_value=[]
+        )
+        response = client.get(
+            f"/gdm/v1/patient/{patient_uuid}/reading/daily?days=14",
+            headers={"Authorization": "Bearer TOKEN"},
+        )
+        assert response.status_code == 200
+        assert response.json == []
+        mock_retrieve.assert_called_with(patient_id=patient_uuid, days=14)
+
+    def test_get_daily_reading_summaries_invalid_days(
+        self, client: FlaskClient, patient_uuid: str
+    ) -> None:
+        response = client.get(
+            f"/gdm/v1/patient/{patient_uuid}/reading/daily?days=0",
+            headers={"Authorization": "Bearer TOKEN"},
+        )
+        assert response.status_code == 400
+
     def test_get_patient_summary_success(
         self, client: FlaskClient, mocker: MockFixture, patient_uuid: str
     ) -> None:
@@ -591,6 +808,22 @@ class TestApi:
         assert response.status_code == 200
         assert response.json == expected
 
+    def test_clear_alerts_for_patients_success(
+        self, client: FlaskClient, mocker: MockFixture
+    ) -> None:
+        expected = {"patient_uuid_1": {"completed": True}}
+        mock_clear: Mock = mocker.patch.object(
+            controller, "clear_alerts_for_patients", return_value=expected
+        )
+        response = client.post(
+            "/gdm/v1/clear_alerts/patients",
+            json=["patient_uuid_1"],
+            headers={"Authorization": "Bearer TOKEN"},
+        )
+        assert response.status_code == 200
+        assert response.json == expected
+        mock_clear.assert_called_once_with(patient_ids=["patient_uuid_1"])
+
     def test_get_recent_readings(
         self, client: FlaskClient, mocker: MockFixture
     ) -> None:
@@ -737,6 +970,38 @@ class TestApi:
         assert mock_process.call_count == 1
         mock_process.assert_called_with(reading_id=reading_uuid)
 
+    def test_process_counts_alerts_for_readings(
+        self, client: FlaskClient, mocker: MockFixture
+    ) -> None:
+        reading_uuids: List[str] = [generate_uuid(), generate_uuid()]
+        mock_process: Mock = mocker.patch.object(
+            controller,
+            "process_counts_alerts_for_readings",
+            return_value=[{"uuid": u} for u in reading_uuids],
+        )
+        response = client.post(
+            "/gdm/v1/process_alerts/readings",
+            json=reading_uuids,
+            headers={"Authorization": "Bearer TOKEN"},
+        )
+        assert response.status_code == 200
+        assert response.json == [{"uuid": u} for u in reading_uuids]
+        mock_process.assert_called_once_with(reading_ids=reading_uuids)
+
+    def test_process_counts_alerts_for_readings_empty(
+        self, client: FlaskClient, mocker: MockFixture
+    ) -> None:
+        mock_process: Mock = mocker.patch.object(
+            controller, "process_counts_alerts_for_readings"
+        )
+        response = client.post(
+            "/gdm/v1/process_alerts/readings",
+            json=[],
+            headers={"Authorization": "Bearer TOKEN"},
+        )
+        assert response.status_code == 400
+        assert mock_process.call_count == 0
+
     def test_process_activity_alerts(
         self,
         client: FlaskClient,
@@ -761,13 +1026,40 @@ class TestApi:
             patient_id=patient_uuid, readings_plans=sample_readings_plans
         )
 
+    def test_process_activity_alerts_for_patients(
+        self,
+        client: FlaskClient,
+        mocker: MockFixture,
+        patient_uuid: str,
+        sample_readings_plans: List[Dict],
+    ) -> None:
+        mock_process: Mock = mocker.patch.object(
+            controller,
+            "process_activity_alerts_for_patients",
+            return_value={patient_uuid: {"uuid": patient_uuid, "alert_now": True}},
+        )
+        response = client.post(
+            "/gdm/v1/process_activity_alerts",
+            json={patient_uuid: sample_readings_plans},
+            headers={"Authorization": "Bearer TOKEN"},
+        )
+        assert response.status_code == 200
+        assert response.json
+        assert response.json[patient_uuid]["alert_now"] is True
+        mock_process.assert_called_with(
+            readings_plans_by_patient={patient_uuid: sample_readings_plans}
+        )
+
     @pytest.mark.parametrize(
         "endpoint",
         [
             "/gdm/v1/patient/patient-uuid/reading",
+            "/gdm/v2/patient/patient-uuid/readings",
             "/gdm/v1/patient/summary",
             "/gdm/v1/process_activity_alerts/patient/patient-uuid",
+            "/gdm/v1/process_activity_alerts",
             "/gdm/v1/process_alerts",
+            "/gdm/v1/clear_alerts/patients",
         ],
     )
     def test_post_endpoints_mandatory_request_body(
@@ -0,0 +1,306 @@
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, Generator, Optional, Set
+
+import pytest
+import redis
+from cachetools import LRUCache
+from flask import Flask
+from flask_batteries_included.sqldb import db
+from mock import Mock, patch
+from pytest_mock import MockFixture
+
+from gdm_bg_readings_api import cache
+from gdm_bg_readings_api.blueprint_api import controller
+from gdm_bg_readings_api.models.patient import Patient
+from gdm_bg_readings_api.models.reading import Reading
+from gdm_bg_readings_api.query import upsert
+
+
+class FakeRedis:
+    """Stands in for a Redis server shared between workers."""
+
+    def __init__(self) -> None:
+        self.values: Dict[str, bytes] = {}
+        self.expiries: Dict[str, int] = {}
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.values.get(key)
+
+    def set(
+        self, key: str, value: Any, nx: bool = False, ex: Optional[int] = None
+    ) -> bool:
+        if nx and key in self.values:
+            return False
+        self.values[key] = str(value).encode()
+        return True
+
+    def delete(self, key: str) -> None:
+        self.values.pop(key, None)
+
+    def incr(self, key: str) -> int:
+        value = int(self.values.get(key, b"0")) + 1
+        self.values[key] = str(value).encode()
+        return value
+
+    def expire(self, key: str, time: int) -> None:
+        self.expiries[key] = time
+
+
+class LocalTier:
+    """Stands in for the local tier of one worker's cache."""
+
+    def __init__(self) -> None:
+        self.local: LRUCache = LRUCache(maxsize=16)
+        self.local_scopes: LRUCache = LRUCache(maxsize=16)
+        self.generations: Dict[str, int] = defaultdict(int)
+
+    @contextmanager
+    def active(self) -> Generator[None, None, None]:
+        with patch.multiple(
+            cache,
+            _local=self.local,
+            _local_scopes=self.local_scopes,
+            _generations=self.generations,
+        ):
+            yield
+
+
+@pytest.mark.usefixtures("app")
+class TestCache:
+    @pytest.fixture
+    def fake_redis(self, mocker: MockFixture) -> FakeRedis:
+        fake_redis = FakeRedis()
+        mocker.patch.object(cache, "_get_redis", return_value=fake_redis)
+        return fake_redis
+
+    def test_get_or_compute_local(self) -> None:
+        compute = Mock(return_value={"some": "value"})
+        for _ in range(2):
+            value = cache.get_or_compute("test", "key", compute, ttl=60)
+            assert value == {"some": "value"}
+        assert compute.call_count == 1
+
+        cache.invalidate("test")
+        cache.get_or_compute("test", "key", compute, ttl=60)
+        assert compute.call_count == 2
+
+    def test_get_or_compute_shared(self, fake_redis: FakeRedis) -> None:
+        compute = Mock(return_value={"when": datetime(2020, 1, 1)})
+        cache.get_or_compute("test", "key", compute, ttl=60)
+
+        # Another worker gets the value from Redis, as decoded from JSON.
+        cache.clear()
+        value = cache.get_or_compute("test", "key", compute, ttl=60)
+        assert isinstance(value["when"], str)
+        assert compute.call_count == 1
+
+        # Invalidating in one worker is seen by all of them.
+        cache.invalidate("test")
+        cache.get_or_compute("test", "key", compute, ttl=60)
+        assert compute.call_count == 2
+        assert not any(key.endswith(":lock") for key in fake_redis.values)
+
+    def test_get_or_compute_waits_for_other_worker(self, fake_redis: FakeRedis) -> None:
+        # Another worker holds the lock while it computes the value.
+        full_key = cache._redis_key("test", 0, "key")
+        fake_redis.set(f"{full_key}:lock", 1)
+        threading.Timer(
+            0.1, fake_redis.set, args=(full_key, '{"some": "value"}')
+        ).start()
+
+        compute = Mock()
+        value = cache.get_or_compute("test", "key", compute, ttl=60)
+        assert value == {"some": "value"}
+        assert compute.call_count == 0
+
+    def test_get_or_compute_keeps_other_workers_lock(
+        self, fake_redis: FakeRedis, mocker: MockFixture
+    ) -> None:
+        # Another worker holds the lock, but takes too long to compute the value.
+        mocker.patch.object(cache, "COMPUTE_LOCK_TIMEOUT_SEC", 0.1)
+        lock_key = f"{cache._redis_key('test', 0, 'key')}:lock"
+        fake_redis.set(lock_key, "other_worker")
+
+        compute = Mock(return_value={"some": "value"})
+        assert cache.get_or_compute("test", "key", compute, ttl=60) == {"some": "value"}
+        assert compute.call_count == 1
+        assert fake_redis.values[lock_key] == b"other_worker"
+
+    def test_get_or_compute_redis_error(self, fake_redis: FakeRedis) -> None:
+        fake_redis.get = Mock(side_effect=redis.ConnectionError)  # type: ignore
+        compute = Mock(return_value={"some": "value"})
+        for _ in range(2):
+            cache.get_or_compute("test", "key", compute, ttl=60)
+        assert compute.call_count == 2
+
+    def test_get_or_compute_scoped(self) -> None:
+        compute = Mock(return_value={"some": "value"})
+        for scope in ("first", "second", "first", "second"):
+            cache.get_or_compute("test", "key", compute, ttl=60, scope=scope)
+        assert compute.call_count == 2
+
+        # Only the invalidated scope is computed again.
+        cache.invalidate("test", scope="first")
+        for scope in ("first", "second"):
+            cache.get_or_compute("test", "key", compute, ttl=60, scope=scope)
+        assert compute.call_count == 3
+
+    def test_get_or_compute_scoped_shared(self, fake_redis: FakeRedis) -> None:
+        compute = Mock(return_value={"some": "value"})
+        cache.get_or_compute("test", "key", compute, ttl=60, scope="first")
+        cache.get_or_compute("test", "key", compute, ttl=60, scope="first")
+        assert compute.call_count == 1
+
+        # Another worker invalidating the scope moves it on to a new generation.
+        generation_key = cache._redis_key("test:first", "generation")
+        fake_redis.incr(generation_key)
+        cache.get_or_compute("test", "key", compute, ttl=60, scope="first")
+        assert compute.call_count == 2
+
+        cache.invalidate("test", scope="first")
+        assert fake_redis.values[generation_key] == b"2"
+        assert fake_redis.expiries[generation_key] == cache.SCOPE_GENERATION_TTL_SEC
+
+    def test_patient_cache_invalidated_on_write(
+        self,
+        app: Flask,
+        fake_redis: FakeRedis,
+        patient_uuid: str,
+        reading_dict_in: Dict,
+        statement_counter: Callable,
+    ) -> None:
+        app.config["REDIS_INSTALLED"] = True
+        controller.create_reading(patient_uuid, dict(reading_dict_in))
+        readings = controller.retrieve_readings_for_patient_with_tag(patient_uuid)
+        assert len(list(readings)) == 1
+
+        # Polling again doesn't touch the database.
+        with statement_counter() as counter:
+            assert (
+                controller.retrieve_readings_for_patient_with_tag(patient_uuid)
+                == readings
+            )
+        assert counter.count == 0
+
+        controller.create_reading(
+            patient_uuid, {**reading_dict_in, "blood_glucose_value": 6.0}
+        )
+        readings = controller.retrieve_readings_for_patient_with_tag(patient_uuid)
+        assert len(list(readings)) == 2
+
+    @pytest.mark.parametrize("redis_installed", [True, False])
+    def test_patient_cache_invalidated_in_other_workers(
+        self,
+        app: Flask,
+        mocker: MockFixture,
+        redis_installed: bool,
+        patient_uuid: str,
+        reading_dict_in: Dict,
+    ) -> None:
+        app.config["REDIS_INSTALLED"] = redis_installed
+        if redis_installed:
+            mocker.patch.object(cache, "_get_redis", return_value=FakeRedis())
+        worker, other_worker = LocalTier(), LocalTier()
+        controller.create_reading(patient_uuid, dict(reading_dict_in))
+        with worker.active():
+            readings = controller.retrieve_readings_for_patient_with_tag(patient_uuid)
+            assert len(list(readings)) == 1
+
+        # A write handled by another worker is seen straight away.
+        with other_worker.active():
+            controller.create_reading(
+                patient_uuid, {**reading_dict_in, "blood_glucose_value": 6.0}
+            )
+        with worker.active():
+            readings = controller.retrieve_readings_for_patient_with_tag(patient_uuid)
+            assert len(list(readings)) == 2
+        assert len(worker.local_scopes) == int(redis_installed)
+
+    def test_invalidate_on_commit(self, app: Flask, patient_uuid: str) -> None:
+        app.config["PATIENT_SUMMARY_CACHE_TTL_SEC"] = 60
+        reading = Reading(
+            uuid="reading_uuid",
+            patient_id=patient_uuid,
+            measured_timestamp=datetime(2020, 1, 1),
+            measured_timezone=0,
+            blood_glucose_value=5.5,
+            units="mmol/L",
+            prandial_tag_id="PRANDIAL-TAG-NONE",
+            reading_banding_id="BG-READING-BANDING-NORMAL",
+        )
+        patient = Patient(uuid=patient_uuid)
+        db.session.add_all([patient, reading])
+        db.session.flush()
+        patient.latest_reading_id = reading.uuid
+        db.session.commit()
+        summaries = controller.retrieve_patient_summaries([patient_uuid])
+        assert summaries[patient_uuid]["current_red_alert"] is False
+
+        # Uncommitted changes leave the cached summaries alone.
+        Patient.query.filter_by(uuid=patient_uuid).update({"current_red_alert": True})
+        assert controller.retrieve_patient_summaries([patient_uuid]) == summaries
+
+        db.session.commit()
+        summaries = controller.retrieve_patient_summaries([patient_uuid])
+        assert summaries[patient_uuid]["current_red_alert"] is True
+
+    @pytest.mark.parametrize(
+        ["statement", "namespaces"],
+        [
+            (
+                upsert._postgresql_insert_reading,
+                {
+                    controller.PATIENT_SUMMARY_CACHE_NAMESPACE,
+                    controller.STATISTICS_CACHE_NAMESPACE,
+                },
+            ),
+            (
+                upsert._postgresql_ensure_patient,
+                {controller.PATIENT_SUMMARY_CACHE_NAMESPACE},
+            ),
+        ],
+    )
+    def test_write_from_cte_noted(
+        self, statement: Callable[[Dict], Any], namespaces: Set[str]
+    ) -> None:
+        # The PostgreSQL upserts can't run on SQLite, so the hook is given the statement
+        # as the session would give it.
+        values: Dict = {
+            **{column.key: None for column in Reading.__table__.columns},
+            **{column.key: None for column in Patient.__table__.columns},
+        }
+        cache._do_orm_execute(
+            Mock(
+                statement=statement(values),
+                session=db.session,
+                is_insert=False,
+                is_update=False,
+                is_delete=False,
+                is_orm_statement=False,
+            )
+        )
+        assert cache._pending_invalidations(db.session) == {
+            (namespace, None) for namespace in namespaces
+        }
+
+    def test_get_or_compute_single_flight(self, app: Flask) -> None:
+        def compute() -> int:
+            time.sleep(0.1)
+            return 1
+
+        def get_or_compute() -> None:
+            # As in a request, each thread has its own app context.
+            with app.app_context():
+                cache.get_or_compute("test", "key", mock_compute, ttl=60)
+
+        mock_compute = Mock(side_effect=compute)
+        threads = [threading.Thread(target=get_or_compute) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert mock_compute.call_count == 1
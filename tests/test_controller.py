@@ -1,4 +1,4 @@
-from datetime import datetime, timedelta, timezone
+from datetime import date, datetime, timedelta, timezone
 from typing import Callable, Dict, Generator, Iterable, List, Optional, Tuple
 
 import pytest
@@ -15,6 +15,7 @@ from gdm_bg_readings_api.blueprint_api import (
     counts_alerting,
     percentages_alerting,
 )
+from gdm_bg_readings_api.blueprint_api.exceptions import DuplicateReadingException
 from gdm_bg_readings_api.models.api_spec import (
     Hba1cReadingResponse,
     Hba1cTargetResponse,
@@ -22,9 +23,12 @@ from gdm_bg_readings_api.models.api_spec import (
     ReadingResponseCompact,
     ReadingStatistics,
 )
+from gdm_bg_readings_api.models.dose import Dose
 from gdm_bg_readings_api.models.patient import Patient
 from gdm_bg_readings_api.models.patient_alert import PatientAlert
 from gdm_bg_readings_api.models.reading import Reading
+from gdm_bg_readings_api.models.reading_metadata import ReadingMetadata
+from gdm_bg_readings_api.query import percentages
 from gdm_bg_readings_api.trustomer import AlertsSystem
 
 
@@ -170,6 +174,161 @@ class TestController:
         assert reading["reading_banding"]["uuid"] == banding_id
         assert reading["reading_banding"]["value"] == banding_value
 
+    def test_create_reading_in_snooze_period(
+        self,
+        patient_uuid: str,
+        reading_dict_in_abnormal: Dict,
+        mock_publish_abnormal: Mock,
+    ) -> None:
+        patient = Patient(uuid=patient_uuid)
+        patient.set_suppress_reading_alerts_from("2000-01-01T00:00:00.000Z")
+        patient.set_suppress_reading_alerts_until("2000-01-02T00:00:00.000Z")
+        db.session.add(patient)
+        db.session.commit()
+        result = controller.create_reading(
+            patient_id=patient_uuid, reading_data=reading_dict_in_abnormal
+        )
+        assert result["snoozed"] is True
+        assert mock_publish_abnormal.call_count == 0
+
+    def test_create_reading_duplicate(
+        self, patient_uuid: str, reading_dict_in: Dict, mocker: MockFixture
+    ) -> None:
+        mock_audit: Mock = mocker.patch.object(controller, "publish_audit_message")
+        original = controller.create_reading(
+            patient_id=patient_uuid, reading_data=dict(reading_dict_in)
+        )
+        with pytest.raises(DuplicateReadingException) as e:
+            controller.create_reading(
+                patient_id=patient_uuid, reading_data=dict(reading_dict_in)
+            )
+        assert e.value.extra == {"reading_id": original["uuid"]}
+        mock_audit.assert_called_once_with(
+            event_type="duplicate_reading",
+            event_data={
+                "patient_id": patient_uuid,
+                "duplicate_reading_id": original["uuid"],
+            },
+        )
+        # Nothing stored for the duplicate is left behind.
+        assert ReadingMetadata.query.count() == 1
+        assert Dose.query.count() == 1
+
+    def test_create_reading_duplicate_keeps_transaction(
+        self, patient_uuid: str, reading_dict_in: Dict
+    ) -> None:
+        controller.create_reading(
+            patient_id=patient_uuid, reading_data=dict(reading_dict_in)
+        )
+        # Work already flushed in the transaction survives the duplicate.
+        db.session.add(Patient(uuid="other_patient_uuid"))
+        db.session.flush()
+        controller.create_reading_v1(
+            patient_id=patient_uuid, reading_data=dict(reading_dict_in)
+        )
+        assert Patient.query.filter_by(uuid="other_patient_uuid").count() == 1
+        assert ReadingMetadata.query.count() == 1
+
+    def test_create_reading_v1_duplicate(
+        self, patient_uuid: str, reading_dict_in: Dict, mocker: MockFixture
+    ) -> None:
+        mock_audit: Mock = mocker.patch.object(controller, "publish_audit_message")
+        original = controller.create_reading_v1(
+            patient_id=patient_uuid, reading_data=dict(reading_dict_in)
+        )
+        duplicate = controller.create_reading_v1(
+            patient_id=patient_uuid, reading_data=dict(reading_dict_in)
+        )
+        assert duplicate["uuid"] == original["uuid"]
+        assert mock_audit.call_count == 1
+        assert ReadingMetadata.query.count() == 1
+
+    def test_create_readings_success(
+        self,
+        patient_uuid: str,
+        reading_dict_in: Dict,
+        reading_dict_in_abnormal: Dict,
+        statement_counter: Callable,
+        mocker: MockFixture,
+    ) -> None:
+        mock_publish: Mock = mocker.patch.object(
+            controller, "publish_abnormal_readings"
+        )
+        readings_data = [
+            {
+                **(reading_dict_in_abnormal if i % 2 else reading_dict_in),
+                "measured_timestamp": f"2000-01-01T01:{i:02}:00.000Z",
+            }
+            for i in range(20)
+        ]
+        # The number of statements doesn't depend on the number of readings.
+        with statement_counter(limit=13):
+            results = controller.create_readings(
+                patient_id=patient_uuid, readings_data=readings_data
+            )
+        assert [r["status"] for r in results] == ["created"] * 20
+        readings: List[Dict] = list(
+            controller.retrieve_readings_for_patient_with_tag(patient_uuid)
+        )
+        assert {r["uuid"] for r in readings} == {r["reading_id"] for r in results}
+        assert all(len(r["doses"]) == 1 for r in readings)
+        assert all(r["reading_metadata"] for r in readings)
+        published: List[Dict] = mock_publish.call_args[1]["readings_data"]
+        assert {r["uuid"] for r in published} == {
+            r["reading_id"] for r in results[1::2]
+        }
+        # Published readings are rendered as they are stored.
+        readings_by_uuid: Dict[str, Dict] = {r["uuid"]: r for r in readings}
+        assert all(r == readings_by_uuid[r["uuid"]] for r in published)
+
+    def test_create_readings_duplicate_and_invalid(
+        self, patient_uuid: str, reading_dict_in: Dict, mocker: MockFixture
+    ) -> None:
+        existing = controller.create_reading(
+            patient_id=patient_uuid, reading_data=dict(reading_dict_in)
+        )
+        mock_audit: Mock = mocker.patch.object(controller, "publish_audit_message")
+        new_reading = {**reading_dict_in, "blood_glucose_value": 6.0}
+        results = controller.create_readings(
+            patient_id=patient_uuid,
+            readings_data=[
+                dict(reading_dict_in),
+                dict(new_reading),
+                {**reading_dict_in, "prandial_tag": {"value": 99}},
+                {**reading_dict_in, "units": None},
+                dict(new_reading),
+            ],
+        )
+        assert results[0] == {"status": "duplicate", "reading_id": existing["uuid"]}
+        assert results[1]["status"] == "created"
+        assert results[2]["status"] == "invalid"
+        assert results[3]["status"] == "invalid"
+        assert results[4] == {
+            "status": "duplicate",
+            "reading_id": results[1]["reading_id"],
+        }
+        readings: List[Dict] = list(
+            controller.retrieve_readings_for_patient_with_tag(patient_uuid)
+        )
+        assert {r["uuid"] for r in readings} == {
+            existing["uuid"],
+            results[1]["reading_id"],
+        }
+        # Each duplicate is audited, and nothing stored for it is left behind.
+        assert [c[1]["event_data"] for c in mock_audit.call_args_list] == [
+            {"patient_id": patient_uuid, "duplicate_reading_id": existing["uuid"]},
+            {
+                "patient_id": patient_uuid,
+                "duplicate_reading_id": results[1]["reading_id"],
+            },
+        ]
+        assert ReadingMetadata.query.count() == 2
+
+    def test_create_readings_empty(self, patient_uuid: str) -> None:
+        assert (
+            controller.create_readings(patient_id=patient_uuid, readings_data=[]) == []
+        )
+
     def test_create_reading_counts_alerts(
         self, mock_trustomer: Mock, patient_uuid: str
     ) -> None:
@@ -266,6 +425,92 @@ class TestController:
         ):
             assert ("red_alert" in reading) == expected_retrospective_red_alert[i]
 
+    def test_process_counts_alerts_for_readings(
+        self, mock_trustomer: Mock, mocker: MockFixture
+    ) -> None:
+        banding_ids = [
+            "BG-READING-BANDING-HIGH",
+            "BG-READING-BANDING-NORMAL",
+            "BG-READING-BANDING-LOW",
+            "BG-READING-BANDING-HIGH",
+            "BG-READING-BANDING-HIGH",
+            "BG-READING-BANDING-NORMAL",
+            "BG-READING-BANDING-HIGH",
+        ]
+        now = datetime.now(tz=timezone.utc)
+        patient_ids: List[str] = [generate_uuid(), generate_uuid()]
+        reading_ids: Dict[str, List[str]] = {}
+        for patient_id in patient_ids:
+            results: List[Dict] = controller.create_readings(
+                patient_id,
+                [
+                    {
+                        "prandial_tag": {"value": 2 + i % 2},
+                        "blood_glucose_value": 5,
+                        "units": "mmol/L",
+                        "banding_id": banding_id,
+                        "measured_timestamp": (
+                            now - timedelta(hours=6 * (len(banding_ids) - i))
+                        ).isoformat(timespec="milliseconds"),
+                    }
+                    for i, banding_id in enumerate(banding_ids)
+                ],
+            )
+            reading_ids[patient_id] = [r["reading_id"] for r in results]
+        mock_publish: Mock = mocker.patch.object(controller, "publish_patient_alert")
+        mock_publish_amber: Mock = mocker.patch.object(
+            counts_alerting, "publish_patient_alert"
+        )
+
+        # The first patient's readings are processed one at a time, the second's in a
+        # batch, which should give the same alerts.
+        for reading_id in reading_ids[patient_ids[0]]:
+            controller.process_counts_alerts_for_reading(reading_id=reading_id)
+        assert mock_publish.call_count > 1
+        assert mock_publish_amber.call_count > 1
+        mock_publish.reset_mock()
+        mock_publish_amber.reset_mock()
+
+        batch_reading_ids: List[str] = list(reversed(reading_ids[patient_ids[1]]))
+        results = controller.process_counts_alerts_for_readings(
+            reading_ids=batch_reading_ids
+        )
+        assert [r["uuid"] for r in results] == batch_reading_ids
+        mock_publish.assert_called_once_with(
+            patient_uuid=patient_ids[1], alert_type=PatientAlert.AlertType.COUNTS_RED
+        )
+        mock_publish_amber.assert_called_once_with(
+            patient_uuid=patient_ids[1], alert_type=PatientAlert.AlertType.COUNTS_AMBER
+        )
+
+        alerts: List[List[Tuple[bool, bool]]] = [
+            [
+                ("amber_alert" in r, "red_alert" in r)
+                for r in sorted(
+                    controller.retrieve_readings_for_patient_with_tag(
+                        patient_id=patient_id
+                    ),
+                    key=lambda x: x["measured_timestamp"],
+                )
+            ]
+            for patient_id in patient_ids
+        ]
+        assert alerts[0] == alerts[1]
+        assert any(amber for amber, _ in alerts[1])
+        assert any(red for _, red in alerts[1])
+        patients: List[Patient] = Patient.query.filter(
+            Patient.uuid.in_(patient_ids)
+        ).all()
+        assert all(p.current_amber_alert and p.current_red_alert for p in patients)
+
+    def test_process_counts_alerts_for_readings_unknown(
+        self, mock_trustomer: Mock, patient_with_readings: Patient
+    ) -> None:
+        with pytest.raises(EntityNotFoundException):
+            controller.process_counts_alerts_for_readings(
+                reading_ids=[patient_with_readings.readings[0].uuid, "unknown"]
+            )
+
     def test_get_reading_by_uuid(
         self, patient_uuid: str, reading_dict_in: Dict, assert_valid_schema: Callable
     ) -> None:
@@ -406,6 +651,155 @@ class TestController:
         }
         assert actual_timestamps == set(expected_timestamps)
 
+    def test_retrieve_reading_page_for_patient(
+        self, patient_uuid: str, reading_dict_in: Dict
+    ) -> None:
+        # Two readings share each timestamp, so pages must also be split by UUID.
+        for i in range(7):
+            controller.create_reading(
+                patient_id=patient_uuid,
+                reading_data={
+                    **reading_dict_in,
+                    "blood_glucose_value": 5.0 + i % 2,
+                    "measured_timestamp": f"2020-01-0{1 + i // 2}T12:00:00.000Z",
+                },
+            )
+        expected_uuids: List[str] = [
+            r["uuid"]
+            for r in sorted(
+                controller.retrieve_readings_for_patient_with_tag(patient_uuid),
+                key=lambda r: (r["measured_timestamp"], r["uuid"]),
+                reverse=True,
+            )
+        ]
+
+        # Walk backwards through history a page at a time.
+        pages: List[controller.ReadingPage] = [
+            controller.retrieve_reading_page_for_patient(patient_uuid, limit=3)
+        ]
+        while pages[-1].next_cursor is not None:
+            pages.append(
+                controller.retrieve_reading_page_for_patient(
+                    patient_uuid, limit=3, before=pages[-1].next_cursor
+                )
+            )
+        assert [len(p.readings) for p in pages] == [3, 3, 1]
+        assert [r["uuid"] for p in pages for r in p.readings] == expected_uuids
+        assert pages[0].previous_cursor is None
+        assert pages[1].previous_cursor is not None
+
+        # And forwards again from the last page.
+        previous = controller.retrieve_reading_page_for_patient(
+            patient_uuid, limit=3, after=pages[2].previous_cursor
+        )
+        assert previous == pages[1]
+        first = controller.retrieve_reading_page_for_patient(
+            patient_uuid, limit=3, after=previous.previous_cursor
+        )
+        assert first.readings == pages[0].readings
+        assert first.previous_cursor is None
+        assert first.next_cursor == pages[0].next_cursor
+
+    def test_retrieve_reading_page_for_patient_with_tag(
+        self, patient_uuid: str, reading_dict_in: Dict
+    ) -> None:
+        for i in range(4):
+            controller.create_reading(
+                patient_id=patient_uuid,
+                reading_data={
+                    **reading_dict_in,
+                    "measured_timestamp": f"2020-01-0{1 + i}T12:00:00.000Z",
+                    "prandial_tag": {"value": 1 + i % 2},
+                },
+            )
+        page = controller.retrieve_reading_page_for_patient(
+            patient_uuid, prandial_tag_value="2", limit=10
+        )
+        assert [r["prandial_tag"]["value"] for r in page.readings] == [2, 2]
+        assert page.next_cursor is None
+
+    @pytest.mark.parametrize(
+        "kwargs",
+        [
+            {"before": "not-a-cursor"},
+            {"after": "bm90LWEtY3Vyc29y"},
+            {"before": "bm90LWEtY3Vyc29y", "after": "bm90LWEtY3Vyc29y"},
+            {"limit": 0},
+        ],
+    )
+    def test_retrieve_reading_page_for_patient_invalid(
+        self, patient_uuid: str, kwargs: Dict
+    ) -> None:
+        with pytest.raises(ValueError):
+            controller.retrieve_reading_page_for_patient(patient_uuid, **kwargs)
+
+    def test_retrieve_reading_page_for_patient_statements(
+        self, patient_uuid: str, reading_dict_in: Dict, statement_counter: Callable
+    ) -> None:
+        for i in range(5):
+            controller.create_reading(
+                patient_id=patient_uuid,
+                reading_data={
+                    **reading_dict_in,
+                    "measured_timestamp": f"2020-01-0{1 + i}T12:00:00.000Z",
+                },
+            )
+        with statement_counter(limit=1):
+            page = controller.retrieve_reading_page_for_patient(patient_uuid, limit=2)
+        assert len(page.readings) == 2
+
+    @pytest.mark.parametrize("compact", [True, False])
+    def test_iter_readings_for_period(
+        self, reading_dict_in: Dict, compact: bool, mocker: MockFixture
+    ) -> None:
+        mocker.patch.object(controller, "STREAM_READINGS_BATCH_SIZE", 3)
+        patient_ids = [generate_uuid() for _ in range(3)]
+        base_time = datetime.now(tz=timezone.utc)
+        for i in range(10):
+            controller.create_reading(
+                patient_id=patient_ids[i % 3],
+                reading_data={
+                    **reading_dict_in,
+                    "measured_timestamp": (base_time - timedelta(hours=i)).isoformat(),
+                },
+            )
+
+        items = list(controller.iter_readings_for_period(days=1, compact=compact))
+
+        # Grouped by patient, with the same readings in the same order as before.
+        streamed_ids = [patient_id for patient_id, _ in items]
+        assert streamed_ids == sorted(streamed_ids)
+        streamed: Dict[str, List[Dict]] = {}
+        for patient_id, reading in items:
+            streamed.setdefault(patient_id, []).append(reading)
+        assert streamed == controller.retrieve_readings_for_period(
+            days=1, compact=compact
+        )
+
+    @pytest.mark.freeze_time("2020-08-21T00:00:00.000+00:00")
+    def test_get_recent_readings_filters_in_sql(
+        self, patient_uuid: str, reading_dict_in: Dict, statement_counter: Callable
+    ) -> None:
+        for ts in [
+            "2020-08-20T00:00:00.001+00:00",
+            "2020-08-20T00:00:00.000+00:00",
+            "2020-08-19T12:00:00.000+00:00",
+        ]:
+            controller.create_reading(
+                patient_id=patient_uuid,
+                reading_data={**reading_dict_in, "measured_timestamp": ts},
+            )
+        db.session.expunge_all()
+
+        with statement_counter(limit=1) as counter:
+            readings = controller._get_recent_readings(days=1)
+        # Readings outside the window are not loaded at all.
+        loaded = [o for o in db.session.identity_map.values() if isinstance(o, Reading)]
+        assert len(loaded) == len(readings) == 1
+        assert counter.clauses[0].compile().params["measured_timestamp_1"] == (
+            datetime(2020, 8, 20)
+        )
+
     @pytest.mark.freeze_time("2020-08-21T00:00:00.000+00:00")
     def test_retrieve_statistics_for_period(
         self, reading_dict_in: Dict, assert_valid_schema: Callable
@@ -452,6 +846,62 @@ class TestController:
         assert results[patient_3]["readings_count_banding_normal"] == 1
         assert patient_4 not in results
 
+    @pytest.mark.freeze_time("2020-08-21T00:00:00.000+00:00")
+    def test_retrieve_statistics_for_period_by_prandial_tag(
+        self,
+        reading_dict_in: Dict,
+        assert_valid_schema: Callable,
+        statement_counter: Callable,
+    ) -> None:
+        patient_1 = generate_uuid()
+        data = [
+            (patient_1, "2020-08-20T00:00:00.000+00:00", 5.0, 2),
+            (patient_1, "2020-08-19T00:00:00.000+00:00", 5.0, 2),
+            (patient_1, "2020-08-18T00:00:00.000+00:00", 9.0, 2),
+            (patient_1, "2020-08-17T00:00:00.000+00:00", 4.0, 3),
+            (patient_1, "2020-08-16T00:00:00.000+00:00", 9.0, 3),
+        ]
+        uuids = []
+        for patient_id, ts, val, prandial_tag in data:
+            reading = controller.create_reading(
+                patient_id=patient_id,
+                reading_data={
+                    **reading_dict_in,
+                    "measured_timestamp": ts,
+                    "blood_glucose_value": val,
+                    "prandial_tag": {"value": prandial_tag},
+                    "banding_id": "BG-READING-BANDING-NORMAL",
+                },
+            )
+            uuids.append(reading["uuid"])
+        db.session.expunge_all()
+
+        # One query for the statistics, and one to load only the extreme readings.
+        with statement_counter(limit=2):
+            results = controller.retrieve_statistics_for_period(
+                days=7, compact=False, by_prandial_tag=True
+            )
+        assert_valid_schema(ReadingStatistics, list(results.values()), many=True)
+        stats = results[patient_1]
+        assert stats["min_reading"]["uuid"] == uuids[3]
+        # The earliest of the highest readings is the maximum.
+        assert stats["max_reading"]["uuid"] == uuids[4]
+        assert stats["readings_count"] == 5
+        assert stats["readings_count_banding_normal"] == 5
+        assert set(stats["prandial_tags"]) == {
+            "PRANDIAL-TAG-AFTER-BREAKFAST",
+            "PRANDIAL-TAG-BEFORE-LUNCH",
+        }
+        after_breakfast = stats["prandial_tags"]["PRANDIAL-TAG-AFTER-BREAKFAST"]
+        # The most recent of the lowest readings is the minimum.
+        assert after_breakfast["min_reading"]["uuid"] == uuids[0]
+        assert after_breakfast["max_reading"]["uuid"] == uuids[2]
+        assert after_breakfast["readings_count"] == 3
+        before_lunch = stats["prandial_tags"]["PRANDIAL-TAG-BEFORE-LUNCH"]
+        assert before_lunch["min_reading"]["uuid"] == uuids[3]
+        assert before_lunch["max_reading"]["uuid"] == uuids[4]
+        assert before_lunch["readings_count"] == 2
+
     def test_retrieve_latest_reading(
         self, patient_uuid: str, reading_dict_in: Dict
     ) -> None:
@@ -471,6 +921,114 @@ class TestController:
         assert result is not None
         assert result["uuid"] == reading_uuids[0]
 
+    @pytest.mark.freeze_time("2020-08-21T12:00:00.000+00:00")
+    def test_retrieve_daily_summaries_for_patient(
+        self, patient_uuid: str, reading_dict_in: Dict, statement_counter: Callable
+    ) -> None:
+        data = [
+            ("2020-08-20T08:00:00.000+00:00", 5.0, 1, "NORMAL"),
+            ("2020-08-20T09:00:00.000+00:00", 9.0, 2, "HIGH"),
+            ("2020-08-20T10:00:00.000+00:00", 6.0, 2, "NORMAL"),
+            # The 21st locally, although still the 20th in UTC.
+            ("2020-08-21T00:30:00.000+01:00", 4.0, 1, "NORMAL"),
+            # Before the period.
+            ("2020-08-14T08:00:00.000+00:00", 3.0, 1, "LOW"),
+        ]
+        for ts, val, prandial_tag, banding in data:
+            controller.create_reading(
+                patient_id=patient_uuid,
+                reading_data={
+                    **reading_dict_in,
+                    "measured_timestamp": ts,
+                    "blood_glucose_value": val,
+                    "prandial_tag": {"value": prandial_tag},
+                    "banding_id": f"BG-READING-BANDING-{banding}",
+                },
+            )
+        controller.create_readings(
+            patient_id=patient_uuid,
+            readings_data=[
+                {
+                    **reading_dict_in,
+                    "measured_timestamp": "2020-08-21T08:00:00.000+00:00",
+                    "blood_glucose_value": 7.0,
+                    "prandial_tag": {"value": 1},
+                    "banding_id": "BG-READING-BANDING-NORMAL",
+                }
+            ],
+        )
+
+        with statement_counter(limit=1):
+            summaries = controller.retrieve_daily_summaries_for_patient(
+                patient_id=patient_uuid, days=7
+            )
+        assert summaries == [
+            {
+                "date": date(2020, 8, 20),
+                "readings_count": 3,
+                "readings_count_banding_normal": 2,
+                "min_blood_glucose_value": 5.0,
+                "max_blood_glucose_value": 9.0,
+                "prandial_tags": {
+                    "PRANDIAL-TAG-BEFORE-BREAKFAST": {
+                        "readings_count": 1,
+                        "readings_count_banding_normal": 1,
+                        "min_blood_glucose_value": 5.0,
+                        "max_blood_glucose_value": 5.0,
+                    },
+                    "PRANDIAL-TAG-AFTER-BREAKFAST": {
+                        "readings_count": 2,
+                        "readings_count_banding_normal": 1,
+                        "min_blood_glucose_value": 6.0,
+                        "max_blood_glucose_value": 9.0,
+                    },
+                },
+            },
+            {
+                "date": date(2020, 8, 21),
+                "readings_count": 2,
+                "readings_count_banding_normal": 2,
+                "min_blood_glucose_value": 4.0,
+                "max_blood_glucose_value": 7.0,
+                "prandial_tags": {
+                    "PRANDIAL-TAG-BEFORE-BREAKFAST": {
+                        "readings_count": 2,
+                        "readings_count_banding_normal": 2,
+                        "min_blood_glucose_value": 4.0,
+                        "max_blood_glucose_value": 7.0,
+                    }
+                },
+            },
+        ]
+
+    @pytest.mark.freeze_time("2020-08-21T12:00:00.000+00:00")
+    def test_update_reading_refreshes_daily_rollups(
+        self, patient_uuid: str, reading_dict_in: Dict
+    ) -> None:
+        reading = controller.create_reading(
+            patient_id=patient_uuid,
+            reading_data={
+                **reading_dict_in,
+                "measured_timestamp": "2020-08-20T08:00:00.000+00:00",
+                "prandial_tag": {"value": 1},
+                "banding_id": "BG-READING-BANDING-NORMAL",
+            },
+        )
+        controller.update_reading(
+            patient_id=patient_uuid,
+            reading_id=reading["uuid"],
+            reading_data={
+                "prandial_tag": {"value": 2},
+                "banding_id": "BG-READING-BANDING-HIGH",
+            },
+        )
+        summaries = controller.retrieve_daily_summaries_for_patient(
+            patient_id=patient_uuid, days=7
+        )
+        assert len(summaries) == 1
+        assert summaries[0]["readings_count_banding_normal"] == 0
+        assert list(summaries[0]["prandial_tags"]) == ["PRANDIAL-TAG-AFTER-BREAKFAST"]
+
     def test_retrieve_patient_summaries(self, mocker: MockFixture) -> None:
         mocker.patch(
             "gdm_bg_readings_api.blueprint_api.controller._query_patient_summaries_from_db",
@@ -487,6 +1045,61 @@ class TestController:
     def test_retrieve_patient_summaries_empty(self) -> None:
         assert controller.retrieve_patient_summaries([]) == {}
 
+    def test_retrieve_patient_summaries_latest_reading(
+        self,
+        patient_uuid: str,
+        reading_dict_in: Dict,
+        statement_counter: Callable,
+    ) -> None:
+        def _create(measured_timestamp: str, value: float) -> str:
+            return controller.create_reading(
+                patient_id=patient_uuid,
+                reading_data={
+                    **reading_dict_in,
+                    "measured_timestamp": measured_timestamp,
+                    "blood_glucose_value": value,
+                },
+            )["uuid"]
+
+        latest_uuid = _create("2020-08-18T09:00:00.000+01:00", 5.0)
+        # A backdated reading leaves the latest reading as it is.
+        _create("2020-08-17T09:00:00.000+01:00", 6.0)
+        # A reading with a later local time but an earlier instant is not the latest.
+        _create("2020-08-18T09:30:00.000+05:00", 7.0)
+        controller.create_readings(
+            patient_id=patient_uuid,
+            readings_data=[
+                {**reading_dict_in, "measured_timestamp": "2020-08-16T00:00:00.000Z"}
+            ],
+        )
+        patient: Patient = Patient.query.get(patient_uuid)
+        assert patient.latest_reading_id == latest_uuid
+        assert patient.latest_measured_timestamp == datetime(2020, 8, 18, 8, 0)
+
+        with statement_counter(limit=1):
+            summary = controller.retrieve_patient_summaries(
+                [patient_uuid, "unknown-patient"]
+            )
+        assert summary["unknown-patient"] == {}
+        assert summary[patient_uuid]["uuid"] == patient_uuid
+        assert summary[patient_uuid]["latest_reading"]["uuid"] == latest_uuid
+        assert summary[patient_uuid]["latest_reading"]["blood_glucose_value"] == 5.0
+
+    def test_create_readings_advances_latest_reading(
+        self, patient_uuid: str, reading_dict_in: Dict
+    ) -> None:
+        results = controller.create_readings(
+            patient_id=patient_uuid,
+            readings_data=[
+                {**reading_dict_in, "measured_timestamp": "2020-08-16T00:00:00.000Z"},
+                {**reading_dict_in, "measured_timestamp": "2020-08-18T00:00:00.000Z"},
+                {**reading_dict_in, "measured_timestamp": "2020-08-17T00:00:00.000Z"},
+            ],
+        )
+        patient: Patient = Patient.query.get(patient_uuid)
+        assert patient.latest_reading_id == results[1]["reading_id"]
+        assert patient.latest_measured_timestamp == datetime(2020, 8, 18)
+
     @pytest.mark.parametrize(
         "update_details,is_published",
         [
@@ -686,6 +1299,55 @@ class TestController:
             assert len(active_alerts) == 0
             assert preexisting_activity_alerts[1].ended_at is not None
 
+    @pytest.mark.parametrize(
+        ["reading_count", "should_have_alert"], [(13, True), (14, False)]
+    )
+    def test_process_activity_alerts_for_patients(
+        self,
+        sample_readings_plans: List[Dict],
+        reading_count: int,
+        should_have_alert: bool,
+        patient_with_readings: Patient,
+        preexisting_activity_alerts: Tuple,
+    ) -> None:
+        other_patient = Patient(uuid=generate_uuid(), current_activity_alert=False)
+        db.session.add(other_patient)
+        db.session.commit()
+
+        results: Dict[str, Dict] = controller.process_activity_alerts_for_patients(
+            readings_plans_by_patient={
+                patient_with_readings.uuid: sample_readings_plans,
+                other_patient.uuid: sample_readings_plans,
+            }
+        )
+        assert results[patient_with_readings.uuid]["alert_now"] is should_have_alert
+        assert (
+            results[patient_with_readings.uuid]["current_activity_alert"]
+            is should_have_alert
+        )
+        # A patient without readings has an activity alert.
+        assert results[other_patient.uuid]["current_activity_alert"] is True
+        active_alerts: List[PatientAlert] = PatientAlert.query.filter_by(
+            alert_type=PatientAlert.AlertType.ACTIVITY_GREY, ended_at=None
+        ).all()
+        assert {a.patient_id for a in active_alerts} == (
+            {patient_with_readings.uuid, other_patient.uuid}
+            if should_have_alert
+            else {other_patient.uuid}
+        )
+        if should_have_alert:
+            assert preexisting_activity_alerts[1].uuid in {
+                a.uuid for a in active_alerts
+            }
+
+    def test_process_activity_alerts_for_patients_unknown_patient(
+        self, sample_readings_plans: List[Dict]
+    ) -> None:
+        with pytest.raises(EntityNotFoundException):
+            controller.process_activity_alerts_for_patients(
+                readings_plans_by_patient={"patient_uuid_1": sample_readings_plans}
+            )
+
     def test_process_percentages_alerts_unknown_patient(self) -> None:
         alerts_data = {"patient_uuid_1": {"red_alert": True, "amber_alert": True}}
         with pytest.raises(EntityNotFoundException):
@@ -698,24 +1360,24 @@ class TestController:
             single_sample_patient.uuid: {"red_alert": True, "amber_alert": False}
         }
         mock_db_commit = mocker.patch.object(db.session, "commit")
-        mock_update_alerts = mocker.patch.object(
-            percentages_alerting, "update_alerts_for_patient"
+        mock_reconcile_alerts = mocker.patch.object(
+            percentages_alerting, "reconcile_alerts"
         )
         controller.process_percentages_alerts(alerts_data)
         assert single_sample_patient.current_red_alert is True
         assert single_sample_patient.current_amber_alert is False
-        calls = mock_update_alerts.call_args_list
-        assert len(calls) == 2
-        assert calls[0][1] == {
-            "patient": single_sample_patient,
-            "alert_type": PatientAlert.AlertType.PERCENTAGES_RED,
-            "alert_now": True,
-        }
-        assert calls[1][1] == {
-            "patient": single_sample_patient,
-            "alert_type": PatientAlert.AlertType.PERCENTAGES_AMBER,
-            "alert_now": False,
-        }
+        mock_reconcile_alerts.assert_called_once_with(
+            alerts_now={
+                (
+                    single_sample_patient.uuid,
+                    PatientAlert.AlertType.PERCENTAGES_RED,
+                ): True,
+                (
+                    single_sample_patient.uuid,
+                    PatientAlert.AlertType.PERCENTAGES_AMBER,
+                ): False,
+            }
+        )
         assert mock_db_commit.call_count == 1
 
     def test_process_percentages_alerts_multiple_patients_success(
@@ -731,8 +1393,8 @@ class TestController:
             patient_3.uuid: {"red_alert": True, "amber_alert": False},
             patient_4.uuid: {"red_alert": False, "amber_alert": True},
         }
-        mock_update_alerts = mocker.patch.object(
-            percentages_alerting, "update_alerts_for_patient"
+        mock_reconcile_alerts = mocker.patch.object(
+            percentages_alerting, "reconcile_alerts"
         )
         controller.process_percentages_alerts(alerts_data)
         assert patient_1.current_red_alert is True
@@ -743,7 +1405,8 @@ class TestController:
         assert patient_3.current_amber_alert is False
         assert patient_4.current_red_alert is False
         assert patient_4.current_amber_alert is True
-        assert mock_update_alerts.call_count == 8
+        assert mock_reconcile_alerts.call_count == 1
+        assert len(mock_reconcile_alerts.call_args[1]["alerts_now"]) == 8
 
     def test_process_percentages_alerts_multiple_patients_snoozed_success(
         self, four_sample_patients: List[Patient], mocker: MockFixture
@@ -761,8 +1424,8 @@ class TestController:
         mock_is_snoozed = mocker.patch.object(
             percentages_alerting, "is_patient_in_snooze_period", return_value=True
         )
-        mock_update_alerts = mocker.patch.object(
-            percentages_alerting, "update_alerts_for_patient"
+        mock_reconcile_alerts = mocker.patch.object(
+            percentages_alerting, "reconcile_alerts"
         )
         controller.process_percentages_alerts(alerts_data)
         assert patient_1.current_red_alert is False
@@ -774,7 +1437,169 @@ class TestController:
         assert patient_4.current_red_alert is False
         assert patient_4.current_amber_alert is False
         assert mock_is_snoozed.call_count == 4
-        assert mock_update_alerts.call_count == 8
+        assert mock_reconcile_alerts.call_count == 1
+        assert len(mock_reconcile_alerts.call_args[1]["alerts_now"]) == 8
+
+    @pytest.mark.freeze_time("2020-08-21T00:00:00.000+00:00")
+    def test_calculate_percentages_alerts(
+        self, reading_dict_in: Dict, mocker: MockFixture
+    ) -> None:
+        mocker.patch.object(
+            trustomer, "get_alerts_system", return_value=AlertsSystem.PERCENTAGES
+        )
+        mocker.patch.object(
+            trustomer,
+            "get_blood_glucose_thresholds",
+            return_value={
+                "BEFORE-BREAKFAST": {"high": 5.3, "low": 4.0},
+                "OTHER": {"high": 7.8, "low": 4.0},
+            },
+        )
+        mocker.patch.object(
+            trustomer,
+            "get_percentages_alerts_config",
+            return_value={
+                "window_days": 7,
+                "red_percentage": 30,
+                "amber_percentage": 10,
+            },
+        )
+        red_patient = generate_uuid()
+        amber_patient = generate_uuid()
+        normal_patient = generate_uuid()
+        lapsed_patient = generate_uuid()
+        data = [
+            (red_patient, "2020-08-20T08:00:00.000+00:00", 1, 5.0, "mmol/L"),
+            (red_patient, "2020-08-19T08:00:00.000+00:00", 1, 6.0, "mmol/L"),
+            (red_patient, "2020-08-18T08:00:00.000+00:00", 2, 7.0, "mmol/L"),
+            (red_patient, "2020-08-17T08:00:00.000+00:00", 2, 144.0, "mg/dL"),
+            (amber_patient, "2020-08-20T08:00:00.000+00:00", 1, 3.5, "mmol/L"),
+            *(
+                (amber_patient, f"2020-08-1{day}T08:00:00.000+00:00", 2, 7.8, "mmol/L")
+                for day in range(5, 9)
+            ),
+            (normal_patient, "2020-08-20T08:00:00.000+00:00", 1, 4.0, "mmol/L"),
+            (normal_patient, "2020-08-01T08:00:00.000+00:00", 1, 9.0, "mmol/L"),
+            (lapsed_patient, "2020-08-01T08:00:00.000+00:00", 1, 9.0, "mmol/L"),
+        ]
+        for patient_id, ts, prandial_tag_value, val, units in data:
+            controller.create_reading(
+                patient_id=patient_id,
+                reading_data={
+                    **reading_dict_in,
+                    "measured_timestamp": ts,
+                    "prandial_tag": {"value": prandial_tag_value},
+                    "blood_glucose_value": val,
+                    "units": units,
+                },
+            )
+        db.session.add(
+            PatientAlert(
+                uuid=generate_uuid(),
+                started_at=datetime(2020, 8, 1),
+                alert_type=PatientAlert.AlertType.PERCENTAGES_AMBER,
+                patient_id=lapsed_patient,
+            )
+        )
+        db.session.commit()
+
+        assert controller.calculate_percentages_alerts() == {
+            red_patient: {"red_alert": True, "amber_alert": False},
+            amber_patient: {"red_alert": False, "amber_alert": True},
+            normal_patient: {"red_alert": False, "amber_alert": False},
+            lapsed_patient: {"red_alert": False, "amber_alert": False},
+        }
+        active_alerts = PatientAlert.query.filter_by(ended_at=None).all()
+        assert {(a.patient_id, a.alert_type) for a in active_alerts} == {
+            (red_patient, PatientAlert.AlertType.PERCENTAGES_RED),
+            (amber_patient, PatientAlert.AlertType.PERCENTAGES_AMBER),
+        }
+
+        # Over a single day, only each patient's latest reading counts.
+        assert controller.calculate_percentages_alerts(window_days=1) == {
+            red_patient: {"red_alert": False, "amber_alert": False},
+            amber_patient: {"red_alert": True, "amber_alert": False},
+            normal_patient: {"red_alert": False, "amber_alert": False},
+        }
+
+    @pytest.mark.parametrize(
+        "thresholds",
+        [
+            {},
+            {"BEFORE-BREAKFAST": {"high": 5.3, "low": 4.0}},
+            {"OTHER": {"high": 7.8}},
+            {
+                "BEFORE-BREAKFAST": {"high": 5.3},
+                "OTHER": {"high": 7.8, "low": 4.0},
+            },
+        ],
+    )
+    def test_calculate_percentages_alerts_aborts_without_thresholds(
+        self,
+        thresholds: Dict,
+        mocker: MockFixture,
+        caplog: LogCaptureFixture,
+    ) -> None:
+        mocker.patch.object(
+            trustomer, "get_alerts_system", return_value=AlertsSystem.PERCENTAGES
+        )
+        mocker.patch.object(
+            trustomer, "get_blood_glucose_thresholds", return_value=thresholds
+        )
+        mocker.patch.object(
+            trustomer,
+            "get_percentages_alerts_config",
+            return_value={
+                "window_days": 7,
+                "red_percentage": 30,
+                "amber_percentage": 10,
+            },
+        )
+        mock_process: Mock = mocker.patch.object(
+            controller, "process_percentages_alerts"
+        )
+        db.session.add(
+            PatientAlert(
+                uuid=generate_uuid(),
+                started_at=datetime(2020, 8, 1),
+                alert_type=PatientAlert.AlertType.PERCENTAGES_RED,
+                patient_id=generate_uuid(),
+            )
+        )
+        db.session.commit()
+
+        assert controller.calculate_percentages_alerts() == {}
+        assert mock_process.call_count == 0
+        assert caplog.messages[-1].startswith("Calculate percentages alerts aborted")
+        assert PatientAlert.query.filter_by(ended_at=None).count() == 1
+
+    def test_get_prandial_tags_without_thresholds(self) -> None:
+        # Tags with their own thresholds don't need an "OTHER" one to fall back on.
+        prandial_tag_ids = ["PRANDIAL-TAG-BEFORE-BREAKFAST", "PRANDIAL-TAG-NONE"]
+        thresholds: Dict = {"BEFORE-BREAKFAST": {"high": 5.3, "low": 4.0}}
+        assert percentages.get_prandial_tags_without_thresholds(
+            thresholds, prandial_tag_ids
+        ) == ["PRANDIAL-TAG-NONE"]
+        thresholds["NONE"] = {"high": 7.8, "low": 4.0}
+        assert (
+            percentages.get_prandial_tags_without_thresholds(
+                thresholds, prandial_tag_ids
+            )
+            == []
+        )
+
+    def test_calculate_percentages_alerts_aborts_when_counts(
+        self, mocker: MockFixture, caplog: LogCaptureFixture
+    ) -> None:
+        mocker.patch.object(
+            trustomer, "get_alerts_system", return_value=AlertsSystem.COUNTS
+        )
+        mock_process: Mock = mocker.patch.object(
+            controller, "process_percentages_alerts"
+        )
+        assert controller.calculate_percentages_alerts() == {}
+        assert mock_process.call_count == 0
+        assert caplog.messages[-1].startswith("Calculate percentages alerts ignored")
 
     @pytest.mark.freeze_time("2019-01-01 12:00:00")
     def test_clear_alerts_for_patient_percentages(
@@ -788,10 +1613,10 @@ class TestController:
             trustomer, "get_alerts_snooze_duration_days", return_value=3
         )
         mock_dismiss_percentages = mocker.patch.object(
-            percentages_alerting, "dismiss_active_alerts_for_patient"
+            percentages_alerting, "dismiss_active_alerts_for_patients"
         )
         mock_dismiss_counts = mocker.patch.object(
-            counts_alerting, "dismiss_active_alerts_for_patient"
+            counts_alerting, "dismiss_active_alerts_for_patients"
         )
         result: Dict = controller.clear_alerts_for_patient(patient_with_readings.uuid)
         assert result == {
@@ -799,10 +1624,12 @@ class TestController:
             "suppress_reading_alerts_from": expected_from,
             "suppress_reading_alerts_until": expected_until,
         }
-        assert mock_dismiss_percentages.called_with(
-            patient_id=patient_with_readings.uuid
+        mock_dismiss_percentages.assert_called_once_with(
+            patient_ids=[patient_with_readings.uuid]
+        )
+        mock_dismiss_counts.assert_called_once_with(
+            patient_ids=[patient_with_readings.uuid]
         )
-        assert mock_dismiss_counts.called_with(patient_id=patient_with_readings.uuid)
         assert patient_with_readings.current_amber_alert is False
         assert patient_with_readings.current_amber_alert is False
         assert patient_with_readings.suppress_reading_alerts_from == expected_from
@@ -820,7 +1647,7 @@ class TestController:
             trustomer, "get_alerts_snooze_duration_days", return_value=3
         )
         mock_dismiss = mocker.patch.object(
-            percentages_alerting, "dismiss_active_alerts_for_patient"
+            percentages_alerting, "dismiss_active_alerts_for_patients"
         )
         result: Dict = controller.clear_alerts_for_patient(patient_with_readings.uuid)
         assert result == {
@@ -828,12 +1655,77 @@ class TestController:
             "suppress_reading_alerts_from": expected_from,
             "suppress_reading_alerts_until": expected_until,
         }
-        assert mock_dismiss.called_with(patient_id=patient_with_readings.uuid)
+        mock_dismiss.assert_called_once_with(patient_ids=[patient_with_readings.uuid])
         assert patient_with_readings.current_amber_alert is False
         assert patient_with_readings.current_amber_alert is False
         assert patient_with_readings.suppress_reading_alerts_from == expected_from
         assert patient_with_readings.suppress_reading_alerts_until == expected_until
 
+    @pytest.mark.freeze_time("2019-01-01 12:00:00")
+    def test_clear_alerts_for_patients(
+        self, mocker: MockFixture, four_sample_patients: List[Patient]
+    ) -> None:
+        mocker.patch.object(
+            trustomer, "get_alerts_snooze_duration_days", return_value=3
+        )
+        patient_ids: List[str] = [p.uuid for p in four_sample_patients[:2]]
+        alerts: List[PatientAlert] = [
+            PatientAlert(
+                uuid=generate_uuid(),
+                started_at=datetime(2018, 12, 31),
+                alert_type=alert_type,
+                patient_id=patient.uuid,
+            )
+            for patient in four_sample_patients
+            for alert_type in (
+                PatientAlert.AlertType.PERCENTAGES_RED,
+                PatientAlert.AlertType.ACTIVITY_GREY,
+            )
+        ]
+        for patient in four_sample_patients:
+            patient.current_red_alert = True
+        db.session.add_all(alerts)
+        db.session.commit()
+
+        result: Dict[str, Dict] = controller.clear_alerts_for_patients(patient_ids)
+        assert result == {
+            patient_id: {
+                "completed": True,
+                "suppress_reading_alerts_from": datetime(2019, 1, 1, 12),
+                "suppress_reading_alerts_until": datetime(2019, 1, 4),
+            }
+            for patient_id in patient_ids
+        }
+        # Only the given patients' percentages alerts are dismissed.
+        assert {a.patient_id for a in alerts if a.dismissed_at is not None} == set(
+            patient_ids
+        )
+        assert all(
+            a.dismissed_at is None
+            for a in alerts
+            if a.alert_type == PatientAlert.AlertType.ACTIVITY_GREY
+        )
+        assert [p.current_red_alert for p in four_sample_patients] == [
+            False,
+            False,
+            True,
+            True,
+        ]
+
+        for a in alerts:
+            db.session.delete(a)
+        db.session.commit()
+
+    def test_clear_alerts_for_patients_unknown(
+        self, single_sample_patient: Patient
+    ) -> None:
+        with pytest.raises(EntityNotFoundException):
+            controller.clear_alerts_for_patients(
+                [single_sample_patient.uuid, "non_existent_uuid"]
+            )
+        db.session.rollback()
+        assert single_sample_patient.suppress_reading_alerts_from is None
+
     def test_clear_alerts_for_patient_unknown(self) -> None:
         with pytest.raises(EntityNotFoundException):
             controller.clear_alerts_for_patient("non_existent_uuid")
@@ -852,6 +1744,24 @@ class TestController:
         assert result["uuid"] == reading.uuid
         assert caplog.messages[-1].startswith("Process alerts for reading ignored")
 
+    def test_process_counts_alerts_for_readings_aborts_when_percentages(
+        self,
+        patient_with_readings: Patient,
+        mocker: MockFixture,
+        caplog: LogCaptureFixture,
+    ) -> None:
+        reading: Reading = patient_with_readings.readings[0]
+        mocker.patch.object(
+            trustomer, "get_alerts_system", return_value=AlertsSystem.PERCENTAGES
+        )
+        mock_evaluate: Mock = mocker.patch.object(
+            counts_alerting, "evaluate_counts_alerts_for_readings"
+        )
+        results = controller.process_counts_alerts_for_readings([reading.uuid])
+        assert [r["uuid"] for r in results] == [reading.uuid]
+        assert mock_evaluate.call_count == 0
+        assert caplog.messages[-1].startswith("Process alerts for readings ignored")
+
     @pytest.mark.parametrize("reading_count", [4])
     def test_get_first_reading(
         self, reading_count: int, patient_with_readings: Patient
@@ -944,6 +1854,31 @@ class TestController:
         )
         assert result["current_activity_alert"] is expected
 
+    def test_get_readings_etag(
+        self, patient_uuid: str, reading_dict_in: Dict, statement_counter: Callable
+    ) -> None:
+        assert controller.get_readings_etag(patient_uuid) is None
+        assert controller.get_patient_etag(patient_uuid) is None
+        reading = controller.create_reading(patient_uuid, reading_dict_in)
+        assert controller.get_patient_etag(patient_uuid) is not None
+
+        # A single aggregate query, whatever the number of readings.
+        with statement_counter(limit=1):
+            etag = controller.get_readings_etag(patient_uuid)
+        assert etag is not None
+        reading_etag = controller.get_reading_etag(patient_uuid, reading["uuid"])
+        assert reading_etag is not None
+        assert controller.get_reading_etag(patient_uuid, generate_uuid()) is None
+
+        # Changing a reading's doses changes its ETag, and that of the readings.
+        dose_details = {"medication_id": generate_uuid(), "amount": 1.5}
+        controller.add_dose_to_reading(patient_uuid, reading["uuid"], dose_details)
+        assert controller.get_readings_etag(patient_uuid) not in (None, etag)
+        assert controller.get_reading_etag(patient_uuid, reading["uuid"]) not in (
+            None,
+            reading_etag,
+        )
+
     def test_add_dose_to_reading(
         self, patient_uuid: str, reading_dict_in: Dict
     ) -> None:
@@ -1161,10 +2096,10 @@ class TestController:
                 },
             )
 
-        with statement_counter(limit=1):
+        with statement_counter(limit=8):
             results = controller.retrieve_readings_for_period(days=10, compact=True)
         assert len(results[patient_1]) == 5000
 
-        with statement_counter(limit=1):
+        with statement_counter(limit=8):
             results = controller.retrieve_readings_for_period(days=10, compact=False)
         assert len(results[patient_1]) == 5000
@@ -0,0 +1,169 @@
+from datetime import datetime
+from typing import Callable, List, Optional
+
+import pytest
+from flask import Flask
+from flask_batteries_included.sqldb import db, generate_uuid
+
+from gdm_bg_readings_api.models.counts_alert_run import CountsAlertRun
+from gdm_bg_readings_api.models.patient import Patient
+from gdm_bg_readings_api.models.reading import Reading
+from gdm_bg_readings_api.models.red_alert import RedAlert
+from gdm_bg_readings_api.query import counts_alert_run
+
+
+@pytest.mark.usefixtures("app")
+class TestCountsAlertRun:
+    @pytest.fixture
+    def patient(self, patient_uuid: str) -> Patient:
+        patient = Patient(uuid=patient_uuid)
+        db.session.add(patient)
+        db.session.commit()
+        return patient
+
+    def _reading(
+        self,
+        patient: Patient,
+        measured_timestamp: datetime,
+        prandial_tag_id: str = "PRANDIAL-TAG-NONE",
+        banding_id: str = "BG-READING-BANDING-HIGH",
+        snoozed: bool = False,
+    ) -> Reading:
+        reading = Reading(
+            uuid=generate_uuid(),
+            patient_id=patient.uuid,
+            blood_glucose_value=9.0,
+            units="mmol/L",
+            measured_timestamp=measured_timestamp,
+            measured_timezone=0,
+            prandial_tag_id=prandial_tag_id,
+            reading_banding_id=banding_id,
+            snoozed=snoozed,
+        )
+        db.session.add(reading)
+        db.session.flush()
+        return reading
+
+    def _run(
+        self, patient: Patient, prandial_tag_id: str = "PRANDIAL-TAG-NONE"
+    ) -> Optional[CountsAlertRun]:
+        return counts_alert_run.get_run(
+            patient_id=patient.uuid, prandial_tag_id=prandial_tag_id
+        )
+
+    def test_add_readings_in_order(
+        self, patient: Patient, statement_counter: Callable
+    ) -> None:
+        first: Reading = self._reading(patient, datetime(2020, 1, 1, 8))
+        counts_alert_run.add_readings([first])
+        db.session.commit()
+
+        readings: List[Reading] = [
+            self._reading(patient, datetime(2020, 1, 2, 8)),
+            self._reading(patient, datetime(2020, 1, 3, 8)),
+            self._reading(patient, datetime(2020, 1, 4, 8)),
+        ]
+        # Creating the run if needed, locking it and updating it, with no reading query.
+        with statement_counter(limit=3):
+            counts_alert_run.add_readings(readings)
+            db.session.flush()
+        db.session.commit()
+
+        run = self._run(patient)
+        assert run is not None
+        assert run.run_length == 3
+        assert run.run_reading_ids == [r.uuid for r in reversed(readings)]
+        assert run.last_reading_id == readings[-1].uuid
+        assert run.last_measured_timestamp == datetime(2020, 1, 4, 8)
+
+        # A normal reading ends the run.
+        normal: Reading = self._reading(
+            patient, datetime(2020, 1, 5, 8), banding_id="BG-READING-BANDING-NORMAL"
+        )
+        counts_alert_run.add_readings([normal])
+        db.session.commit()
+        run = self._run(patient)
+        assert run is not None
+        assert run.run_length == 0
+        assert run.run_reading_ids == []
+        assert run.last_reading_id == normal.uuid
+
+    def test_add_readings_backdated(self, patient: Patient) -> None:
+        readings: List[Reading] = [
+            self._reading(patient, datetime(2020, 1, 1, 8)),
+            self._reading(patient, datetime(2020, 1, 3, 8)),
+        ]
+        counts_alert_run.add_readings(readings)
+        db.session.commit()
+
+        # A snoozed reading between the two splits the run.
+        backdated: Reading = self._reading(
+            patient, datetime(2020, 1, 2, 8), snoozed=True
+        )
+        counts_alert_run.add_readings([backdated])
+        db.session.commit()
+        run = self._run(patient)
+        assert run is not None
+        assert run.run_length == 1
+        assert run.run_reading_ids == [readings[1].uuid]
+        assert run.last_reading_id == readings[1].uuid
+
+    def test_refresh(self, patient: Patient) -> None:
+        readings: List[Reading] = [
+            self._reading(patient, datetime(2020, 1, day, 8)) for day in (1, 2, 3)
+        ]
+        counts_alert_run.add_readings(readings)
+        db.session.flush()
+
+        # A dismissed red alert ends the run at the reading after it.
+        readings[1].red_alert = RedAlert(uuid=generate_uuid(), dismissed=True)
+        db.session.flush()
+        counts_alert_run.refresh([counts_alert_run.run_key(readings[1])])
+        db.session.commit()
+        run = self._run(patient)
+        assert run is not None
+        assert run.run_reading_ids == [readings[2].uuid]
+
+        # A run left with no readings is removed.
+        old_key = counts_alert_run.run_key(readings[0])
+        for reading in readings:
+            reading.prandial_tag_id = "PRANDIAL-TAG-BEFORE-BREAKFAST"
+        db.session.flush()
+        counts_alert_run.refresh({old_key, counts_alert_run.run_key(readings[0])})
+        db.session.commit()
+        assert self._run(patient) is None
+        run = self._run(patient, "PRANDIAL-TAG-BEFORE-BREAKFAST")
+        assert run is not None
+        assert run.run_length == 1
+        assert run.last_reading_id == readings[2].uuid
+
+    def test_rebuild(self, patient: Patient) -> None:
+        readings: List[Reading] = [
+            self._reading(patient, datetime(2020, 1, day, 8)) for day in (1, 2, 3, 4)
+        ]
+        self._reading(
+            patient,
+            datetime(2020, 1, 1, 9),
+            prandial_tag_id="PRANDIAL-TAG-BEFORE-BREAKFAST",
+            banding_id="BG-READING-BANDING-NORMAL",
+        )
+        db.session.commit()
+
+        assert counts_alert_run.rebuild() == 2
+        run = self._run(patient)
+        assert run is not None
+        assert run.run_length == 3
+        assert run.run_reading_ids == [r.uuid for r in reversed(readings[1:])]
+        run = self._run(patient, "PRANDIAL-TAG-BEFORE-BREAKFAST")
+        assert run is not None
+        assert run.run_length == 0
+
+    def test_backfill_command(self, app: Flask, patient: Patient) -> None:
+        self._reading(patient, datetime(2020, 1, 1, 8))
+        db.session.commit()
+        result = app.test_cli_runner().invoke(
+            args=["backfill-counts-alert-runs", "--patient-id", patient.uuid]
+        )
+        assert result.exit_code == 0
+        assert "Wrote 1 counts alert runs" in result.output
+        assert CountsAlertRun.query.filter_by(patient_id=patient.uuid).count() == 1
@@ -1,5 +1,6 @@
+import random
 from datetime import datetime, timedelta
-from typing import Any, Generator
+from typing import Any, Callable, Dict, Generator, List, Set, Tuple
 
 import pytest
 from flask_batteries_included.sqldb import db, generate_uuid
@@ -8,10 +9,13 @@ from pytest_mock import MockFixture
 
 from gdm_bg_readings_api.blueprint_api import counts_alerting
 from gdm_bg_readings_api.models.amber_alert import AmberAlert
+from gdm_bg_readings_api.models.counts_alert_run import CountsAlertRun
 from gdm_bg_readings_api.models.patient import Patient
 from gdm_bg_readings_api.models.patient_alert import PatientAlert
 from gdm_bg_readings_api.models.reading import Reading
 from gdm_bg_readings_api.models.red_alert import RedAlert
+from gdm_bg_readings_api.query import counts_alert_run
+from gdm_bg_readings_api.query.upsert import PatientSnoozePeriod
 
 
 @pytest.mark.usefixtures("app")
@@ -104,6 +108,102 @@ class TestCountsAlerting:
         assert reading.red_alert.dismissed is True
         assert reading.amber_alert.dismissed is True
 
+    def test_dismiss_active_alerts_for_patients(
+        self, patient_with_active_counts_alerts: Patient, statement_counter: Callable
+    ) -> None:
+        patient_uuid: str = patient_with_active_counts_alerts.uuid
+        reading = patient_with_active_counts_alerts.readings[0]
+        # One UPDATE for each alert table, plus any statements needed to keep the
+        # session in step, and refreshing the (empty) counts alert runs.
+        with statement_counter(limit=5):
+            counts_alerting.dismiss_active_alerts_for_patients(
+                patient_ids=[patient_uuid, generate_uuid()]
+            )
+        assert reading.red_alert.dismissed is True
+        assert reading.amber_alert.dismissed is True
+
+    def test_get_alertable_readings_from_run(
+        self, patient_uuid: str, statement_counter: Callable
+    ) -> None:
+        db.session.add(Patient(uuid=patient_uuid))
+        readings: List[Reading] = [
+            Reading(
+                uuid=generate_uuid(),
+                patient_id=patient_uuid,
+                measured_timestamp=datetime(2020, 1, day, 8),
+                measured_timezone=0,
+                blood_glucose_value=14,
+                units="mmol/L",
+                prandial_tag_id="PRANDIAL-TAG-BEFORE-BREAKFAST",
+                reading_banding_id="BG-READING-BANDING-HIGH",
+            )
+            for day in (1, 2, 3)
+        ]
+        for reading in readings:
+            db.session.add(reading)
+            db.session.flush()
+            counts_alert_run.add_readings([reading])
+            db.session.flush()
+            if reading is readings[1]:
+                # Until there are three in a row, only the run is read.
+                with statement_counter(limit=1):
+                    assert counts_alerting.get_alertable_readings(reading) == {}
+
+        # The latest reading's run covers the readings before it.
+        with statement_counter(limit=2):
+            alertable: Dict = counts_alerting.get_alertable_readings(readings[2])
+        assert {i: r.uuid for i, r in alertable.items()} == {
+            0: readings[2].uuid,
+            1: readings[1].uuid,
+            2: readings[0].uuid,
+        }
+        # The run is loaded with the reading, and then only the amber window is read.
+        with statement_counter(limit=2):
+            decision = counts_alerting.evaluate_counts_alerts(readings[2])
+        assert decision.red_reading_ids == [r.uuid for r in reversed(readings)]
+
+        # Earlier readings are checked against their neighbours, with the same result.
+        assert set(counts_alerting.get_alertable_readings(readings[0]).values()) == set(
+            readings
+        )
+        assert set(
+            counts_alerting.evaluate_counts_alerts(readings[0]).red_reading_ids
+        ) == {r.uuid for r in readings}
+
+    def test_dismiss_active_alerts_refreshes_runs(self, patient_uuid: str) -> None:
+        db.session.add(Patient(uuid=patient_uuid))
+        readings: List[Reading] = [
+            Reading(
+                uuid=generate_uuid(),
+                patient_id=patient_uuid,
+                measured_timestamp=datetime(2020, 1, day, 8),
+                measured_timezone=0,
+                blood_glucose_value=14,
+                units="mmol/L",
+                prandial_tag_id="PRANDIAL-TAG-BEFORE-BREAKFAST",
+                reading_banding_id="BG-READING-BANDING-HIGH",
+            )
+            for day in (1, 2, 3)
+        ]
+        db.session.add_all(readings)
+        db.session.flush()
+        counts_alert_run.add_readings(readings)
+        for reading in readings:
+            counts_alerting.add_red_alert_to_reading(reading)
+        db.session.commit()
+
+        counts_alerting.dismiss_active_alerts_for_patients(patient_ids=[patient_uuid])
+        db.session.commit()
+
+        # Readings with dismissed red alerts end the run, so there is no new red alert.
+        run = counts_alert_run.get_run(
+            patient_id=patient_uuid, prandial_tag_id="PRANDIAL-TAG-BEFORE-BREAKFAST"
+        )
+        assert run is not None
+        assert run.run_length == 0
+        assert run.last_reading_id == readings[2].uuid
+        assert counts_alerting.evaluate_counts_alerts(readings[2]).red_reading_ids == []
+
     def test_is_reading_in_snooze_period(self) -> None:
         reading = Reading()
         patient = Patient()
@@ -124,6 +224,20 @@ class TestCountsAlerting:
         reading.measured_timestamp = datetime(2019, 1, 12, 0, 0, 0)
         assert counts_alerting.is_reading_in_snooze_period(reading, patient) is False
 
+    def test_is_reading_in_snooze_period_from_upsert(self) -> None:
+        snooze_period = PatientSnoozePeriod(
+            suppress_reading_alerts_from=datetime(2019, 1, 2, 0, 0, 0),
+            suppress_reading_alerts_until=datetime(2019, 1, 10, 0, 0, 0),
+        )
+        reading = Reading(measured_timestamp=datetime(2019, 1, 6, 0, 0, 0))
+        assert (
+            counts_alerting.is_reading_in_snooze_period(reading, snooze_period) is True
+        )
+        reading.measured_timestamp = datetime(2019, 1, 12, 0, 0, 0)
+        assert (
+            counts_alerting.is_reading_in_snooze_period(reading, snooze_period) is False
+        )
+
     def test_reading_could_trigger_alert(self) -> None:
         reading = Reading()
         reading.reading_banding_id = "BG-READING-BANDING-NORMAL"
@@ -140,3 +254,90 @@ class TestCountsAlerting:
         reading.red_alert = RedAlert()
         reading.red_alert.dismissed = True
         assert counts_alerting.reading_could_trigger_red_alert(reading) is False
+
+    @pytest.fixture
+    def patient_with_mixed_readings(self) -> Generator[List[Reading], None, None]:
+        rng = random.Random(12)
+        patient = Patient(uuid=generate_uuid(), current_amber_alert=False)
+        db.session.add(patient)
+        readings: List[Reading] = []
+        for day in [1, 2, 2, 2, 5, 5, 6, 6, 6, 9, 9, 10, 10, 10, 10]:
+            for hour in rng.sample(range(24), 3):
+                red_alert = None
+                if rng.random() < 0.15:
+                    red_alert = RedAlert(
+                        uuid=generate_uuid(), dismissed=rng.random() < 0.5
+                    )
+                readings.append(
+                    Reading(
+                        uuid=generate_uuid(),
+                        patient_id=patient.uuid,
+                        measured_timestamp=datetime(2000, 1, day, hour, len(readings)),
+                        measured_timezone=rng.choice([0, 3600, -18000]),
+                        blood_glucose_value=5,
+                        units="mmol/L",
+                        prandial_tag_id=rng.choice(
+                            [
+                                "PRANDIAL-TAG-BEFORE-BREAKFAST",
+                                "PRANDIAL-TAG-AFTER-BREAKFAST",
+                            ]
+                        ),
+                        reading_banding_id=rng.choice(
+                            [
+                                "BG-READING-BANDING-NORMAL",
+                                "BG-READING-BANDING-HIGH",
+                                "BG-READING-BANDING-LOW",
+                            ]
+                        ),
+                        snoozed=rng.random() < 0.1,
+                        red_alert=red_alert,
+                    )
+                )
+        db.session.add_all(readings)
+        db.session.commit()
+
+        yield readings
+
+        CountsAlertRun.query.delete()
+        for r in readings:
+            db.session.delete(r)
+        RedAlert.query.delete()
+        db.session.delete(patient)
+        db.session.commit()
+
+    def test_evaluate_counts_alerts_matches_per_query_evaluation(
+        self, patient_with_mixed_readings: List[Reading], statement_counter: Callable
+    ) -> None:
+        patient_id: str = patient_with_mixed_readings[0].patient_id
+        readings: List[Reading] = Reading.query.filter_by(patient_id=patient_id).all()
+        # Expected decisions are taken before there are any runs, so red alerts are
+        # decided from each reading's neighbours.
+        expected: Dict[str, Tuple[Set[str], Set[str]]] = {
+            reading.uuid: (
+                {r.uuid for r in counts_alerting.get_amber_alertable_readings(reading)},
+                {
+                    r.uuid
+                    for r in counts_alerting.get_alertable_readings(reading).values()
+                },
+            )
+            for reading in readings
+        }
+        counts_alert_run.rebuild(patient_ids=[patient_id])
+        latest_reading_ids: Set[str] = {
+            run.last_reading_id
+            for run in CountsAlertRun.query.filter_by(patient_id=patient_id)
+        }
+
+        decisions = set()
+        for reading in readings:
+            # The latest reading with each prandial tag is decided from its run, along
+            # with the other readings. Any other reading also needs its neighbours.
+            with statement_counter(
+                limit=2 if reading.uuid in latest_reading_ids else 4
+            ):
+                decision = counts_alerting.evaluate_counts_alerts(reading)
+            expected_amber, expected_red = expected[reading.uuid]
+            assert set(decision.amber_reading_ids) == expected_amber
+            assert set(decision.red_reading_ids) == expected_red
+            decisions.add((bool(expected_amber), bool(expected_red)))
+        assert decisions == {(a, r) for a in (False, True) for r in (False, True)}
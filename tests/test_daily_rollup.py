@@ -0,0 +1,186 @@
+from datetime import date, datetime
+from typing import Callable, Dict, List
+
+import pytest
+from flask import Flask
+from flask_batteries_included.sqldb import db, generate_uuid
+
+from gdm_bg_readings_api.models.patient import Patient
+from gdm_bg_readings_api.models.reading import Reading
+from gdm_bg_readings_api.models.reading_daily_rollup import ReadingDailyRollup
+from gdm_bg_readings_api.query import daily_rollup
+
+
+@pytest.mark.usefixtures("app")
+class TestDailyRollup:
+    @pytest.fixture
+    def patient(self, patient_uuid: str) -> Patient:
+        patient = Patient(uuid=patient_uuid)
+        db.session.add(patient)
+        db.session.commit()
+        return patient
+
+    def _reading(
+        self,
+        patient: Patient,
+        measured_timestamp: datetime,
+        value: float = 5.5,
+        measured_timezone: int = 0,
+        prandial_tag_id: str = "PRANDIAL-TAG-NONE",
+        banding_id: str = "BG-READING-BANDING-NORMAL",
+    ) -> Reading:
+        reading = Reading(
+            uuid=generate_uuid(),
+            patient_id=patient.uuid,
+            blood_glucose_value=value,
+            units="mmol/L",
+            measured_timestamp=measured_timestamp,
+            measured_timezone=measured_timezone,
+            prandial_tag_id=prandial_tag_id,
+            reading_banding_id=banding_id,
+        )
+        db.session.add(reading)
+        return reading
+
+    def _rollups(self, patient: Patient) -> Dict:
+        return {
+            (r.day, r.prandial_tag_id): r.to_dict()
+            for r in ReadingDailyRollup.query.filter_by(patient_id=patient.uuid)
+        }
+
+    def test_local_day(self) -> None:
+        # 23:30 UTC is the next day at UTC+01:00, and 00:30 UTC the previous at UTC-05:00.
+        assert daily_rollup.local_day(datetime(2020, 1, 1, 23, 30), 3600) == date(
+            2020, 1, 2
+        )
+        assert daily_rollup.local_day(datetime(2020, 1, 1, 0, 30), -18000) == date(
+            2019, 12, 31
+        )
+
+    def test_add_readings(self, patient: Patient, statement_counter: Callable) -> None:
+        first = [
+            self._reading(patient, datetime(2020, 1, 1, 8), value=5.0),
+            self._reading(
+                patient,
+                datetime(2020, 1, 1, 9),
+                value=9.0,
+                banding_id="BG-READING-BANDING-HIGH",
+            ),
+            self._reading(patient, datetime(2020, 1, 1, 23, 30), 4.0, 3600),
+        ]
+        with statement_counter(limit=1):
+            daily_rollup.add_readings(first)
+        second = [
+            self._reading(patient, datetime(2020, 1, 1, 10), value=3.0),
+            self._reading(
+                patient,
+                datetime(2020, 1, 1, 11),
+                value=6.0,
+                prandial_tag_id="PRANDIAL-TAG-BEFORE-BREAKFAST",
+            ),
+        ]
+        daily_rollup.add_readings(second)
+        db.session.commit()
+
+        assert self._rollups(patient) == {
+            (date(2020, 1, 1), "PRANDIAL-TAG-NONE"): {
+                "readings_count": 3,
+                "readings_count_banding_normal": 2,
+                "min_blood_glucose_value": 3.0,
+                "max_blood_glucose_value": 9.0,
+            },
+            (date(2020, 1, 1), "PRANDIAL-TAG-BEFORE-BREAKFAST"): {
+                "readings_count": 1,
+                "readings_count_banding_normal": 1,
+                "min_blood_glucose_value": 6.0,
+                "max_blood_glucose_value": 6.0,
+            },
+            (date(2020, 1, 2), "PRANDIAL-TAG-NONE"): {
+                "readings_count": 1,
+                "readings_count_banding_normal": 1,
+                "min_blood_glucose_value": 4.0,
+                "max_blood_glucose_value": 4.0,
+            },
+        }
+
+    def test_refresh(self, patient: Patient) -> None:
+        readings: List[Reading] = [
+            self._reading(patient, datetime(2020, 1, 1, 8), value=5.0),
+            self._reading(patient, datetime(2020, 1, 1, 9), value=9.0),
+        ]
+        daily_rollup.add_readings(readings)
+        db.session.flush()
+
+        # Move the highest reading to another prandial tag.
+        old_key = daily_rollup.rollup_key(readings[1])
+        readings[1].prandial_tag_id = "PRANDIAL-TAG-BEFORE-BREAKFAST"
+        db.session.flush()
+        daily_rollup.refresh({old_key, daily_rollup.rollup_key(readings[1])})
+        db.session.commit()
+        assert self._rollups(patient) == {
+            (date(2020, 1, 1), "PRANDIAL-TAG-NONE"): {
+                "readings_count": 1,
+                "readings_count_banding_normal": 1,
+                "min_blood_glucose_value": 5.0,
+                "max_blood_glucose_value": 5.0,
+            },
+            (date(2020, 1, 1), "PRANDIAL-TAG-BEFORE-BREAKFAST"): {
+                "readings_count": 1,
+                "readings_count_banding_normal": 1,
+                "min_blood_glucose_value": 9.0,
+                "max_blood_glucose_value": 9.0,
+            },
+        }
+
+        # A rollup left with no readings is removed.
+        old_key = daily_rollup.rollup_key(readings[0])
+        readings[0].prandial_tag_id = "PRANDIAL-TAG-BEFORE-BREAKFAST"
+        db.session.flush()
+        daily_rollup.refresh({old_key, daily_rollup.rollup_key(readings[0])})
+        db.session.commit()
+        assert list(self._rollups(patient)) == [
+            (date(2020, 1, 1), "PRANDIAL-TAG-BEFORE-BREAKFAST")
+        ]
+
+    def test_rebuild(self, patient: Patient) -> None:
+        self._reading(patient, datetime(2020, 1, 1, 8), value=5.0)
+        self._reading(patient, datetime(2020, 1, 2, 8), value=7.0)
+        db.session.add(
+            ReadingDailyRollup(
+                uuid=generate_uuid(),
+                patient_id=patient.uuid,
+                day=date(2019, 1, 1),
+                prandial_tag_id="PRANDIAL-TAG-NONE",
+                readings_count=1,
+                readings_count_banding_normal=0,
+                min_blood_glucose_value=1.0,
+                max_blood_glucose_value=1.0,
+            )
+        )
+        db.session.commit()
+
+        assert daily_rollup.rebuild() == 2
+        assert self._rollups(patient) == {
+            (date(2020, 1, 1), "PRANDIAL-TAG-NONE"): {
+                "readings_count": 1,
+                "readings_count_banding_normal": 1,
+                "min_blood_glucose_value": 5.0,
+                "max_blood_glucose_value": 5.0,
+            },
+            (date(2020, 1, 2), "PRANDIAL-TAG-NONE"): {
+                "readings_count": 1,
+                "readings_count_banding_normal": 1,
+                "min_blood_glucose_value": 7.0,
+                "max_blood_glucose_value": 7.0,
+            },
+        }
+
+    def test_backfill_command(self, app: Flask, patient: Patient) -> None:
+        self._reading(patient, datetime(2020, 1, 1, 8))
+        db.session.commit()
+        result = app.test_cli_runner().invoke(
+            args=["backfill-daily-rollups", "--patient-id", patient.uuid]
+        )
+        assert result.exit_code == 0
+        assert "Wrote 1 daily rollups" in result.output
+        assert ReadingDailyRollup.query.filter_by(patient_id=patient.uuid).count() == 1
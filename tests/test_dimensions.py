@@ -0,0 +1,92 @@
+from datetime import datetime
+from typing import Callable, Dict
+
+import pytest
+from flask import Flask
+from flask_batteries_included.sqldb import db
+
+from gdm_bg_readings_api import dimensions
+from gdm_bg_readings_api.blueprint_api import controller
+from gdm_bg_readings_api.models.prandial_tag import PrandialTag
+from gdm_bg_readings_api.models.reading import Reading
+
+
+@pytest.mark.usefixtures("app")
+class TestDimensions:
+    def test_get_prandial_tag(self) -> None:
+        prandial_tag = dimensions.get_prandial_tag("PRANDIAL-TAG-BEFORE-LUNCH")
+        assert prandial_tag is not None
+        assert (
+            prandial_tag == PrandialTag.query.get("PRANDIAL-TAG-BEFORE-LUNCH").to_dict()
+        )
+        assert dimensions.get_prandial_tag("NOT-A-REAL-TAG") is None
+
+    def test_find_prandial_tag_uuid(self) -> None:
+        assert dimensions.find_prandial_tag_uuid(0) == "PRANDIAL-TAG-NONE"
+        assert dimensions.find_prandial_tag_uuid(3) == "PRANDIAL-TAG-BEFORE-LUNCH"
+        assert dimensions.find_prandial_tag_uuid(99) is None
+
+    def test_get_reading_banding(self) -> None:
+        reading_banding = dimensions.get_reading_banding("BG-READING-BANDING-HIGH")
+        assert reading_banding is not None
+        assert reading_banding["value"] == 3
+        assert dimensions.get_reading_banding("NOT-A-REAL-BANDING") is None
+
+    def test_cached(self, statement_counter: Callable) -> None:
+        dimensions.version()
+        with statement_counter() as counter:
+            dimensions.get_prandial_tag("PRANDIAL-TAG-NONE")
+            dimensions.find_prandial_tag_uuid(1)
+            dimensions.get_reading_banding("BG-READING-BANDING-LOW")
+        assert counter.count == 0
+
+    def test_returns_copies(self) -> None:
+        prandial_tag = dimensions.get_prandial_tag("PRANDIAL-TAG-NONE")
+        assert prandial_tag is not None
+        prandial_tag["description"] = "changed"
+        assert dimensions.get_prandial_tag("PRANDIAL-TAG-NONE") != prandial_tag
+
+    def test_reloaded_on_change(self) -> None:
+        version = dimensions.version()
+        PrandialTag.query.get("PRANDIAL-TAG-OTHER").description = "something else"
+        db.session.commit()
+        prandial_tag = dimensions.get_prandial_tag("PRANDIAL-TAG-OTHER")
+        assert prandial_tag is not None
+        assert prandial_tag["description"] == "something else"
+        assert dimensions.version() > version
+
+    def test_reloaded_after_ttl(self, app: Flask) -> None:
+        version = dimensions.version()
+        assert dimensions.version() == version
+        app.config["DIMENSIONS_CACHE_TTL_SEC"] = -1
+        assert dimensions.version() > version
+
+    def test_reading_to_dict_uses_cache(
+        self, patient_uuid: str, reading_dict_in: Dict, statement_counter: Callable
+    ) -> None:
+        reading_uuid: str = controller.create_reading(patient_uuid, reading_dict_in)[
+            "uuid"
+        ]
+        reading: Reading = (
+            controller._reading_query().filter_by(uuid=reading_uuid).one()
+        )
+        with statement_counter() as counter:
+            reading_dict = reading.to_dict()
+        assert counter.count == 0
+        assert reading_dict["prandial_tag"]["uuid"] == reading.prandial_tag_id
+        assert reading_dict["reading_banding"]["uuid"] == reading.reading_banding_id
+
+    def test_read_query_does_not_join_dimensions(self) -> None:
+        sql = str(controller._reading_query().statement)
+        assert "prandial_tag." not in sql
+        assert "reading_banding." not in sql
+
+    def test_create_reading_does_not_query_dimensions(
+        self, patient_uuid: str, reading_dict_in: Dict, statement_counter: Callable
+    ) -> None:
+        dimensions.version()
+        with statement_counter() as counter:
+            controller.create_reading(patient_uuid, reading_dict_in)
+        sql = " ".join(str(clause) for clause in counter.clauses)
+        assert "FROM prandial_tag" not in sql
+        assert "FROM reading_banding" not in sql
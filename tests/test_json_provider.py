@@ -0,0 +1,126 @@
+import json
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List
+
+import pytest
+from flask import Flask
+from flask_batteries_included.helpers import generate_uuid
+from flask_batteries_included.helpers.timestamp import parse_datetime_to_iso8601
+from she_logging import logger
+
+from gdm_bg_readings_api.helpers import json_provider
+from gdm_bg_readings_api.models.dose import Dose
+from gdm_bg_readings_api.models.reading import Reading
+from gdm_bg_readings_api.models.reading_metadata import ReadingMetadata
+
+BENCHMARK_READINGS = 10_000
+
+
+def _default_dumps(app: Flask, value: Any) -> str:
+    # As given by the default provider with flask_batteries_included's encoder.
+    return json.dumps(
+        value, cls=app.json_encoder, sort_keys=True, separators=(",", ":")
+    )
+
+
+def _reading(index: int) -> Reading:
+    timestamp = datetime(2020, 1, 1, 8, 0, 0, 123456)
+    return Reading(
+        uuid=generate_uuid(),
+        created=timestamp,
+        created_by_="clinician",
+        modified=timestamp,
+        modified_by_="clinician",
+        patient_id="patient",
+        blood_glucose_value=5.0 + index / 7,
+        units="mmol/L",
+        measured_timestamp=timestamp,
+        measured_timezone=3600,
+        comment="Felt dizzy",
+        doses=[
+            Dose(
+                uuid=generate_uuid(),
+                created=timestamp,
+                created_by_="clinician",
+                modified=timestamp,
+                modified_by_="clinician",
+                amount=1.5,
+                medication_id="medication",
+            )
+        ],
+        reading_metadata=ReadingMetadata(
+            uuid=generate_uuid(),
+            created=timestamp,
+            created_by_="clinician",
+            modified=timestamp,
+            modified_by_="clinician",
+            manual=False,
+            control=False,
+            meter_model="meter",
+        ),
+    )
+
+
+@pytest.mark.usefixtures("app")
+class TestJsonProvider:
+    def test_app_uses_orjson(self, app: Flask) -> None:
+        assert isinstance(app.json, json_provider.OrjsonProvider)
+
+    def test_dumps_matches_default(self, app: Flask) -> None:
+        value: Dict = {
+            "naive": datetime(2020, 1, 1, 8, 0, 0, 123456),
+            "aware": datetime(2020, 1, 1, 8, 0, tzinfo=timezone.utc),
+            "date": date(2020, 1, 1),
+            "nested": [{"b": 1.25, "a": None, "c": "é"}],
+        }
+        with app.app_context():
+            assert json.loads(app.json.dumps(value)) == json.loads(
+                _default_dumps(app, value)
+            )
+            assert app.json.dumps(value["nested"][0]) == '{"a":null,"b":1.25,"c":"é"}'
+            assert app.json.loads(b'{"a": 1}') == {"a": 1}
+
+    @pytest.mark.parametrize(
+        "value",
+        [
+            datetime(2020, 1, 1, 8, 0, 0, 123456),
+            datetime(2020, 1, 1, 8, 0, 0, 999999, tzinfo=timezone.utc),
+            datetime(2020, 1, 1, 8, tzinfo=timezone(timedelta(hours=-5, minutes=-30))),
+            datetime(2020, 1, 1, 8, tzinfo=timezone(timedelta(seconds=90))),
+            datetime(999, 1, 1, 8),
+        ],
+    )
+    def test_encode_datetime(self, value: datetime) -> None:
+        assert json_provider._encode_datetime(value) == parse_datetime_to_iso8601(value)
+
+    def test_response(self, app: Flask) -> None:
+        value: Dict = {"measured_timestamp": datetime(2020, 1, 1, 8), "value": 5.0}
+        with app.app_context():
+            response = app.json.response(value)
+        assert response.mimetype == "application/json"
+        assert response.get_data(as_text=True) == _default_dumps(app, value) + "\n"
+
+    def test_readings_benchmark(self, app: Flask) -> None:
+        # Not a pass/fail benchmark: the timings are logged for comparison.
+        readings: List[Dict] = [
+            _reading(i).to_dict(compact=False) for i in range(BENCHMARK_READINGS)
+        ]
+        timings: Dict[str, float] = {}
+        outputs: Dict[str, str] = {}
+        dumps: Dict[str, Callable[[Any], str]] = {
+            "default": lambda value: _default_dumps(app, value),
+            "orjson": app.json.dumps,
+        }
+        with app.app_context():
+            for name, dump in dumps.items():
+                start = time.perf_counter()
+                outputs[name] = dump(readings)
+                timings[name] = time.perf_counter() - start
+        logger.info(
+            "Serialised %d readings in %.3fs (default) and %.3fs (orjson)",
+            BENCHMARK_READINGS,
+            timings["default"],
+            timings["orjson"],
+        )
+        assert outputs["orjson"] == outputs["default"]
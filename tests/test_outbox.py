@@ -0,0 +1,236 @@
+import json
+from datetime import datetime, timedelta
+from typing import Generator, List, Optional
+
+import pytest
+from flask import Flask, current_app
+from flask_batteries_included.sqldb import db
+from kombu import Connection, Exchange, Message, Producer, Queue
+from kombu_batteries_included import infra
+from mock import Mock
+from prometheus_client import REGISTRY
+from pytest_mock import MockFixture
+
+from gdm_bg_readings_api import outbox
+from gdm_bg_readings_api.blueprint_api import publish
+from gdm_bg_readings_api.models.outbox_message import OutboxMessage
+
+MEMORY_TRANSPORT = "memory://"
+
+
+@pytest.mark.usefixtures("app")
+class TestOutbox:
+    @pytest.fixture
+    def broker_queue(self) -> Generator[Queue, None, None]:
+        # The in-memory transport is shared by every connection in the process, so
+        # messages published by the relay can be read back from this queue.
+        with Connection(MEMORY_TRANSPORT) as conn:
+            exchange = Exchange(infra.TASK_EXCHANGE_NAME, type="topic")
+            queue = Queue("test-outbox", exchange=exchange, routing_key="#")
+            bound_queue = queue(conn)
+            bound_queue.declare()
+            yield bound_queue
+            bound_queue.purge()
+
+    @pytest.fixture
+    def publisher(self) -> Generator[outbox.Publisher, None, None]:
+        publisher = outbox.get_publisher(MEMORY_TRANSPORT)
+        assert publisher is not None
+        yield publisher
+        publisher.close()
+
+    def _received(self, queue: Queue) -> List[Message]:
+        messages: List[Message] = []
+        while True:
+            message = queue.get(no_ack=True)
+            if message is None:
+                return messages
+            messages.append(message)
+
+    def test_relay_batch_publishes_and_deletes(
+        self, broker_queue: Queue, publisher: outbox.Publisher
+    ) -> None:
+        publish.publish_audit_message(event_type="first", event_data={})
+        publish.publish_audit_message(event_type="second", event_data={})
+        db.session.commit()
+
+        assert outbox.relay_batch(publisher) == 2
+
+        received = self._received(broker_queue)
+        assert [json.loads(m.body)["event_type"] for m in received] == [
+            "first",
+            "second",
+        ]
+        assert received[0].delivery_info["routing_key"] == "dhos.34837004"
+        assert OutboxMessage.query.count() == 0
+
+    def test_relay_batch_respects_batch_size(
+        self, broker_queue: Queue, publisher: outbox.Publisher
+    ) -> None:
+        for i in range(5):
+            publish.publish_audit_message(event_type=str(i), event_data={})
+        db.session.commit()
+
+        assert outbox.relay_batch(publisher, batch_size=3) == 3
+        assert OutboxMessage.query.count() == 2
+        assert len(self._received(broker_queue)) == 3
+
+    def test_relay_batch_skips_messages_not_yet_due(
+        self, broker_queue: Queue, publisher: outbox.Publisher
+    ) -> None:
+        publish.publish_audit_message(event_type="later", event_data={})
+        OutboxMessage.query.one().next_attempt_at = datetime.utcnow() + timedelta(
+            minutes=1
+        )
+        db.session.commit()
+
+        assert outbox.relay_batch(publisher) == 0
+        assert OutboxMessage.query.count() == 1
+        assert self._received(broker_queue) == []
+
+    def test_relay_batch_retries_failed_publish(
+        self, broker_queue: Queue, publisher: outbox.Publisher, mocker: MockFixture
+    ) -> None:
+        publish.publish_audit_message(event_type="flaky", event_data={})
+        db.session.commit()
+        mocker.patch.object(outbox, "_publish", side_effect=ConnectionError("down"))
+
+        assert outbox.relay_batch(publisher) == 0
+
+        message: OutboxMessage = OutboxMessage.query.one()
+        assert message.attempts == 1
+        assert message.last_error == "down"
+        assert message.next_attempt_at > datetime.utcnow()
+
+        # Once due again, the message is published.
+        mocker.stopall()
+        message.next_attempt_at = datetime.utcnow()
+        db.session.commit()
+        assert outbox.relay_batch(publisher) == 1
+        assert len(self._received(broker_queue)) == 1
+
+    def test_relay_batch_gives_up_after_max_attempts(
+        self,
+        app: Flask,
+        broker_queue: Queue,
+        publisher: outbox.Publisher,
+        mocker: MockFixture,
+    ) -> None:
+        app.config["OUTBOX_MAX_ATTEMPTS"] = 2
+        publish.publish_audit_message(event_type="unpublishable", event_data={})
+        db.session.commit()
+        mocker.patch.object(outbox, "_publish", side_effect=ConnectionError("down"))
+        dead_lettered_before = self._sample(
+            "gdm_outbox_publish_count_total", "dead_lettered"
+        )
+
+        for _ in range(2):
+            OutboxMessage.query.one().next_attempt_at = datetime.utcnow()
+            db.session.commit()
+            assert outbox.relay_batch(publisher) == 0
+
+        message: OutboxMessage = OutboxMessage.query.one()
+        assert message.attempts == 2
+        assert message.failed_at is not None
+        assert (
+            self._sample("gdm_outbox_publish_count_total", "dead_lettered")
+            == dead_lettered_before + 1
+        )
+
+        # The failed message is kept, but no longer published.
+        mocker.stopall()
+        message.next_attempt_at = datetime.utcnow()
+        db.session.commit()
+        assert outbox.relay_batch(publisher) == 0
+        assert OutboxMessage.query.count() == 1
+        assert self._received(broker_queue) == []
+
+    def test_get_publisher_when_rabbitmq_disabled(self) -> None:
+        assert outbox.get_publisher() is None
+
+    def test_relay_batch_discards_without_publisher(self) -> None:
+        publish.publish_audit_message(event_type="ignored", event_data={})
+        db.session.commit()
+
+        assert outbox.relay_batch(publisher=None) == 1
+        assert OutboxMessage.query.count() == 0
+
+    def test_backoff_is_capped(self, app: Flask) -> None:
+        app.config["OUTBOX_RELAY_MAX_BACKOFF_SEC"] = 30
+        assert outbox._backoff(1) == timedelta(seconds=1)
+        assert outbox._backoff(3) == timedelta(seconds=4)
+        assert outbox._backoff(20) == timedelta(seconds=30)
+
+    def test_run_relay_once_drains_outbox(
+        self, app: Flask, broker_queue: Queue, mocker: MockFixture
+    ) -> None:
+        app.config["OUTBOX_RELAY_BATCH_SIZE"] = 2
+        mock_sleep: Mock = mocker.patch.object(outbox.time, "sleep")
+        for i in range(5):
+            publish.publish_audit_message(event_type=str(i), event_data={})
+        db.session.commit()
+
+        outbox.run_relay(connection_string=MEMORY_TRANSPORT, once=True)
+
+        assert OutboxMessage.query.count() == 0
+        assert len(self._received(broker_queue)) == 5
+        assert mock_sleep.call_count == 0
+
+    def test_start_relay_thread(self, app: Flask, mocker: MockFixture) -> None:
+        # The relay runs in its own app context, as it outlives any request.
+        app_names: List[str] = []
+        mocker.patch.object(
+            outbox, "run_relay", side_effect=lambda: app_names.append(current_app.name)
+        )
+        thread = outbox.start_relay_thread(app)
+        thread.join(timeout=5)
+        assert thread.daemon
+        assert app_names == [app.name]
+
+    def test_publish_batch_reports_failures_and_metrics(
+        self, broker_queue: Queue, publisher: outbox.Publisher, mocker: MockFixture
+    ) -> None:
+        for event_type in ("good", "bad", "good"):
+            publish.publish_audit_message(event_type=event_type, event_data={})
+        db.session.commit()
+        messages: List[OutboxMessage] = OutboxMessage.query.order_by(
+            OutboxMessage.created
+        ).all()
+        error = ConnectionError("nack")
+        real_publish = outbox._publish
+
+        def _publish(producer: Producer, message: OutboxMessage) -> None:
+            if message.uuid == messages[1].uuid:
+                raise error
+            real_publish(producer, message)
+
+        mocker.patch.object(outbox, "_publish", side_effect=_publish)
+        batches_before = self._sample("gdm_outbox_publish_batch_latency_seconds_count")
+        failed_before = self._sample("gdm_outbox_publish_count_total", "failed")
+
+        assert publisher.publish_batch(messages) == {messages[1].uuid: error}
+
+        assert len(self._received(broker_queue)) == 2
+        assert (
+            self._sample("gdm_outbox_publish_batch_latency_seconds_count")
+            == batches_before + 1
+        )
+        assert (
+            self._sample("gdm_outbox_publish_count_total", "failed")
+            == failed_before + 1
+        )
+
+    def test_publisher_reuses_pooled_connection(
+        self, broker_queue: Queue, publisher: outbox.Publisher, mocker: MockFixture
+    ) -> None:
+        mock_connect: Mock = mocker.spy(Connection, "_connection_factory")
+        for _ in range(3):
+            publish.publish_audit_message(event_type="event", event_data={})
+            db.session.commit()
+            assert outbox.relay_batch(publisher) == 1
+        assert len(self._received(broker_queue)) == 3
+        assert mock_connect.call_count == 1
+
+    def _sample(self, name: str, result: Optional[str] = None) -> float:
+        labels = {"result": result} if result else {}
+        return REGISTRY.get_sample_value(name, labels) or 0.0
@@ -1,16 +1,20 @@
+import time
 from datetime import datetime, timezone
-from typing import Dict, Generator, List, Optional
+from typing import Callable, Dict, Generator, List, Optional
 
 import pytest
 from flask_batteries_included.sqldb import db
 from freezegun.api import FrozenDateTimeFactory
 from mock import Mock
 from pytest_mock import MockFixture
+from she_logging import logger
 
 from gdm_bg_readings_api.blueprint_api import percentages_alerting
 from gdm_bg_readings_api.models.patient import Patient
 from gdm_bg_readings_api.models.patient_alert import PatientAlert
 
+BENCHMARK_PATIENTS = 10_000
+
 
 @pytest.mark.usefixtures("app")
 class TestPercentagesAlerting:
@@ -167,6 +171,54 @@ class TestPercentagesAlerting:
         )
         assert mock_publish.call_count == 0
 
+    def test_reconcile_alerts(
+        self,
+        four_sample_alerts: List[PatientAlert],
+        mocker: MockFixture,
+        statement_counter: Callable,
+    ) -> None:
+        # The patient with existing alerts keeps the active red one and has the active
+        # amber one ended, while another patient has a new red alert started.
+        mock_publish: Mock = mocker.patch.object(
+            percentages_alerting, "publish_patient_alerts"
+        )
+        with statement_counter(limit=3):
+            percentages_alerting.reconcile_alerts(
+                alerts_now={
+                    ("patient_uuid", PatientAlert.AlertType.PERCENTAGES_RED): True,
+                    ("patient_uuid", PatientAlert.AlertType.PERCENTAGES_AMBER): False,
+                    (
+                        "other_patient_uuid",
+                        PatientAlert.AlertType.PERCENTAGES_RED,
+                    ): True,
+                    (
+                        "other_patient_uuid",
+                        PatientAlert.AlertType.PERCENTAGES_AMBER,
+                    ): False,
+                }
+            )
+        db.session.commit()
+        active_alerts: Dict = {
+            (a.patient_id, a.alert_type): a.uuid
+            for a in PatientAlert.query.filter_by(ended_at=None)
+        }
+        assert set(active_alerts) == {
+            ("patient_uuid", PatientAlert.AlertType.PERCENTAGES_RED),
+            ("other_patient_uuid", PatientAlert.AlertType.PERCENTAGES_RED),
+        }
+        assert (
+            active_alerts[("patient_uuid", PatientAlert.AlertType.PERCENTAGES_RED)]
+            == "active_red"
+        )
+        assert PatientAlert.query.get("active_amber").ended_at is not None
+        mock_publish.assert_called_once_with(
+            alerts=[("other_patient_uuid", PatientAlert.AlertType.PERCENTAGES_RED)]
+        )
+
+        # Clean up resulting alert.
+        PatientAlert.query.filter_by(patient_id="other_patient_uuid").delete()
+        db.session.commit()
+
     def test_dismiss_active_alerts_for_patient(
         self, four_sample_alerts: List[PatientAlert]
     ) -> None:
@@ -220,3 +272,78 @@ class TestPercentagesAlerting:
             plans, start_date, end_date
         )
         assert round(value) == 17
+
+    def test_calculate_expected_reading_counts(
+        self, sample_readings_plans: List[Dict]
+    ) -> None:
+        plans_by_patient: Dict[str, List[Dict]] = {
+            "patient_1": sample_readings_plans,
+            "patient_2": [
+                {
+                    "created": "2017-10-18T04:00:00.000Z",
+                    "days_per_week_to_take_readings": 5,
+                    "readings_per_day": 4,
+                },
+                {
+                    "created": "2017-10-16T04:00:00.000Z",
+                    "days_per_week_to_take_readings": 5,
+                    "readings_per_day": 2,
+                },
+            ],
+            "patient_3": [],
+        }
+        start_date = datetime(2017, 10, 16, 0, 0, 0, 0, timezone.utc)
+        end_date = datetime(2017, 10, 24, 0, 0, 0, 0, timezone.utc)
+
+        expected_counts: Dict[
+            str, float
+        ] = percentages_alerting.calculate_expected_reading_counts(
+            plans_by_patient, start_date, end_date
+        )
+        assert expected_counts == {
+            patient_id: percentages_alerting.calculate_expected_reading_count(
+                plans, start_date, end_date
+            )
+            for patient_id, plans in plans_by_patient.items()
+        }
+        assert round(expected_counts["patient_2"]) == 17
+
+    def test_calculate_expected_reading_counts_benchmark(self) -> None:
+        # Not a pass/fail benchmark: the timings are logged for comparison.
+        plans_by_patient: Dict[str, List[Dict]] = {
+            f"patient_{i}": [
+                {
+                    "created": f"2017-10-{day:02d}T04:00:00.000Z",
+                    "days_per_week_to_take_readings": 7,
+                    "readings_per_day": day % 4 + 1,
+                }
+                for day in (20, 18, 16, 10)
+            ]
+            for i in range(BENCHMARK_PATIENTS)
+        }
+        start_date = datetime(2017, 10, 16, 0, 0, 0, 0, timezone.utc)
+        end_date = datetime(2017, 10, 24, 0, 0, 0, 0, timezone.utc)
+
+        start = time.perf_counter()
+        scalar_counts: Dict[str, float] = {
+            patient_id: percentages_alerting.calculate_expected_reading_count(
+                plans, start_date, end_date
+            )
+            for patient_id, plans in plans_by_patient.items()
+        }
+        scalar_time = time.perf_counter() - start
+        start = time.perf_counter()
+        batch_counts: Dict[
+            str, float
+        ] = percentages_alerting.calculate_expected_reading_counts(
+            plans_by_patient, start_date, end_date
+        )
+        batch_time = time.perf_counter() - start
+        logger.info(
+            "Calculated expected reading counts for %d patients in %.3fs (scalar) and "
+            "%.3fs (batch)",
+            BENCHMARK_PATIENTS,
+            scalar_time,
+            batch_time,
+        )
+        assert batch_counts == scalar_counts
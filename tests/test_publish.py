@@ -1,24 +1,82 @@
+import json
 import uuid
-from unittest.mock import Mock
+from datetime import datetime
+from typing import Callable
 
-import kombu_batteries_included
 import pytest
-from pytest_mock import MockFixture
+from flask_batteries_included.sqldb import db
 
 from gdm_bg_readings_api.blueprint_api import publish
+from gdm_bg_readings_api.models.outbox_message import OutboxMessage
+from gdm_bg_readings_api.models.patient_alert import PatientAlert
 
 
-@pytest.fixture
-def mock_publish(mocker: MockFixture) -> Mock:
-    return mocker.patch.object(kombu_batteries_included, "publish_message")
+@pytest.mark.usefixtures("app")
+class TestPublish:
+    def test_publish_audit_message(self) -> None:
+        event_type = "some_reason_to_live"
+        event_data = {
+            "patient_id": str(uuid.uuid4()),
+            "duplicate_reading_id": str(uuid.uuid4()),
+        }
+        expected = {"event_type": event_type, "event_data": event_data}
+        publish.publish_audit_message(event_type=event_type, event_data=event_data)
+        db.session.commit()
+        message: OutboxMessage = OutboxMessage.query.one()
+        assert message.routing_key == "dhos.34837004"
+        assert json.loads(message.body) == expected
+        assert message.attempts == 0
 
+    def test_publish_patient_alert(self) -> None:
+        publish.publish_patient_alert(
+            patient_uuid="patient_uuid",
+            alert_type=PatientAlert.AlertType.PERCENTAGES_RED,
+        )
+        db.session.commit()
+        message: OutboxMessage = OutboxMessage.query.one()
+        assert message.routing_key == "gdm.424167000"
+        assert json.loads(message.body) == {
+            "patient_uuid": "patient_uuid",
+            "alert_type": "PERCENTAGES_RED",
+        }
 
-def test_publish_audit_message(mock_publish: Mock) -> None:
-    event_type = "some_reason_to_live"
-    event_data = {
-        "patient_id": str(uuid.uuid4()),
-        "duplicate_reading_id": str(uuid.uuid4()),
-    }
-    expected = {"event_type": event_type, "event_data": event_data}
-    publish.publish_audit_message(event_type=event_type, event_data=event_data)
-    mock_publish.assert_called_with(routing_key="dhos.34837004", body=expected)
+    def test_publish_patient_alerts(self) -> None:
+        publish.publish_patient_alerts(
+            alerts=[
+                ("patient_uuid_1", PatientAlert.AlertType.PERCENTAGES_RED),
+                ("patient_uuid_2", PatientAlert.AlertType.PERCENTAGES_AMBER),
+            ]
+        )
+        db.session.commit()
+        messages = OutboxMessage.query.all()
+        assert {m.routing_key for m in messages} == {"gdm.424167000"}
+        assert sorted(json.loads(m.body)["patient_uuid"] for m in messages) == [
+            "patient_uuid_1",
+            "patient_uuid_2",
+        ]
+
+    def test_publish_abnormal_readings_encodes_datetimes(self) -> None:
+        publish.publish_abnormal_readings(
+            readings_data=[{"measured_timestamp": datetime(2020, 1, 1, 12, 30)}]
+        )
+        db.session.commit()
+        message: OutboxMessage = OutboxMessage.query.one()
+        assert message.routing_key == "gdm.166922008"
+        assert json.loads(message.body) == {
+            "measured_timestamp": "2020-01-01T12:30:00.000+00:00"
+        }
+
+    def test_publish_is_rolled_back_with_transaction(self) -> None:
+        publish.publish_audit_message(event_type="something", event_data={})
+        db.session.rollback()
+        assert OutboxMessage.query.count() == 0
+
+    def test_publish_many_is_one_insert(self, statement_counter: Callable) -> None:
+        for i in range(50):
+            publish.publish_patient_alert(
+                patient_uuid=f"patient_{i}",
+                alert_type=PatientAlert.AlertType.ACTIVITY_GREY,
+            )
+        with statement_counter(limit=1):
+            db.session.flush()
+        assert OutboxMessage.query.count() == 50
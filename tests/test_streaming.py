@@ -0,0 +1,40 @@
+import json
+from datetime import datetime, timezone
+
+import pytest
+from flask import Flask
+
+from gdm_bg_readings_api.helpers import streaming
+
+
+@pytest.mark.usefixtures("app")
+class TestStreaming:
+    def test_stream_json_object_of_lists(self) -> None:
+        items = [("a", {"value": 1}), ("a", {"value": 2}), ("b", {"value": 3})]
+        chunks = list(streaming.stream_json_object_of_lists(items))
+        assert json.loads("".join(chunks)) == {
+            "a": [{"value": 1}, {"value": 2}],
+            "b": [{"value": 3}],
+        }
+
+    def test_stream_json_object_of_lists_empty(self) -> None:
+        assert list(streaming.stream_json_object_of_lists([])) == ["{}"]
+
+    def test_stream_json_object_of_lists_uses_app_encoder(self, app: Flask) -> None:
+        timestamp = datetime(2020, 1, 1, 12, 0, tzinfo=timezone.utc)
+        with app.app_context():
+            streamed = "".join(
+                streaming.stream_json_object_of_lists([("a", {"t": timestamp})])
+            )
+            assert json.loads(streamed) == json.loads(
+                app.json.dumps({"a": [{"t": timestamp}]})
+            )
+
+    def test_stream_json_object_of_lists_chunks(self) -> None:
+        items = [(str(i // 10), {"value": "x" * 1000}) for i in range(200)]
+        chunks = list(streaming.stream_json_object_of_lists(items))
+        assert len(chunks) > 1
+        assert all(len(c) < streaming.CHUNK_SIZE + 1100 for c in chunks)
+        result = json.loads("".join(chunks))
+        assert len(result) == 20
+        assert all(len(v) == 10 for v in result.values())
@@ -1,9 +1,11 @@
-from typing import Any
+from typing import Any, Dict
 from unittest.mock import Mock
 
 import pytest
 import requests
+from flask import Flask
 from flask_batteries_included.helpers.error_handler import ServiceUnavailableException
+from pytest_mock import MockFixture
 from requests_mock import Mocker
 
 from gdm_bg_readings_api import trustomer
@@ -37,6 +39,70 @@ class TestTrustomer:
             trustomer.get_trustomer_config()
         assert mock_get.call_count == 1
 
+    def test_get_config_cached(self, requests_mock: Mocker) -> None:
+        trustomer._cache.clear()
+        mock_get: Any = requests_mock.get(
+            f"{trustomer.get_trustomer_base_url()}/dhos/v1/trustomer/test",
+            json={"some": "config"},
+        )
+        assert trustomer.get_trustomer_config() == {"some": "config"}
+        assert trustomer.get_trustomer_config() == {"some": "config"}
+        assert mock_get.call_count == 1
+        assert mock_get.last_request.timeout == 5.0
+
+    def test_get_config_stale_while_revalidate(
+        self, app: Flask, requests_mock: Mocker
+    ) -> None:
+        trustomer._cache.clear()
+        mock_get: Any = requests_mock.get(
+            f"{trustomer.get_trustomer_base_url()}/dhos/v1/trustomer/test",
+            [{"json": {"version": 1}}, {"json": {"version": 2}}],
+        )
+        assert trustomer.get_trustomer_config() == {"version": 1}
+
+        # The stale config is served while it is fetched again in the background.
+        app.config["TRUSTOMER_CONFIG_CACHE_TTL_SEC"] = -1
+        assert trustomer.get_trustomer_config() == {"version": 1}
+        trustomer._cache._refresh_thread.join()  # type: ignore
+        assert mock_get.call_count == 2
+        app.config["TRUSTOMER_CONFIG_CACHE_TTL_SEC"] = 60
+        assert trustomer.get_trustomer_config() == {"version": 2}
+
+    def test_get_config_refresh_failure(
+        self, app: Flask, requests_mock: Mocker
+    ) -> None:
+        trustomer._cache.clear()
+        mock_get: Any = requests_mock.get(
+            f"{trustomer.get_trustomer_base_url()}/dhos/v1/trustomer/test",
+            [{"json": {"version": 1}}, {"exc": requests.exceptions.ConnectTimeout}],
+        )
+        assert trustomer.get_trustomer_config() == {"version": 1}
+
+        # A failed refresh keeps the stale config, and backs off before trying again.
+        app.config["TRUSTOMER_CONFIG_CACHE_TTL_SEC"] = -1
+        assert trustomer.get_trustomer_config() == {"version": 1}
+        trustomer._cache._refresh_thread.join()  # type: ignore
+        assert trustomer.get_trustomer_config() == {"version": 1}
+        assert mock_get.call_count == 2
+
+    def test_get_config_refresh_unexpected_failure(
+        self, app: Flask, requests_mock: Mocker
+    ) -> None:
+        trustomer._cache.clear()
+        mock_get: Any = requests_mock.get(
+            f"{trustomer.get_trustomer_base_url()}/dhos/v1/trustomer/test",
+            [{"json": {"version": 1}}, {"text": "not json"}],
+        )
+        assert trustomer.get_trustomer_config() == {"version": 1}
+
+        # Failures other than trustomer being unavailable back off in the same way.
+        app.config["TRUSTOMER_CONFIG_CACHE_TTL_SEC"] = -1
+        assert trustomer.get_trustomer_config() == {"version": 1}
+        trustomer._cache._refresh_thread.join()  # type: ignore
+        assert trustomer._cache._failures == 1
+        assert trustomer.get_trustomer_config() == {"version": 1}
+        assert mock_get.call_count == 2
+
     @pytest.mark.parametrize(
         ["alerts_system", "expected"],
         [("counts", AlertsSystem.COUNTS), ("percentages", AlertsSystem.PERCENTAGES)],
@@ -50,3 +116,35 @@ class TestTrustomer:
     def test_get_alerts_snooze_duration_days(self, mock_trustomer: Mock) -> None:
         duration = trustomer.get_alerts_snooze_duration_days()
         assert duration == 2
+
+    def test_get_blood_glucose_thresholds(
+        self, mocker: MockFixture, gdm_config: Dict
+    ) -> None:
+        thresholds = {"OTHER": {"high": 7.8, "low": 4.0}}
+        mocker.patch.object(
+            trustomer,
+            "get_trustomer_config",
+            return_value={
+                "gdm_config": {
+                    **gdm_config,
+                    "blood_glucose_thresholds_mmoll": thresholds,
+                }
+            },
+        )
+        assert trustomer.get_blood_glucose_thresholds() == thresholds
+
+    def test_get_percentages_alerts_config(
+        self, mocker: MockFixture, gdm_config: Dict
+    ) -> None:
+        mock_get_config: Mock = mocker.patch.object(
+            trustomer, "get_trustomer_config", return_value={"gdm_config": gdm_config}
+        )
+        assert trustomer.get_percentages_alerts_config() == {
+            "window_days": 7,
+            "red_percentage": 30,
+            "amber_percentage": 10,
+        }
+        mock_get_config.return_value = {
+            "gdm_config": {**gdm_config, "alerts_percentages_window_days": 14}
+        }
+        assert trustomer.get_percentages_alerts_config()["window_days"] == 14
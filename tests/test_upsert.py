@@ -0,0 +1,115 @@
+from datetime import datetime
+from typing import Callable
+
+import pytest
+from flask_batteries_included.sqldb import db, generate_uuid
+from sqlalchemy.dialects import postgresql
+
+from gdm_bg_readings_api.models.patient import Patient
+from gdm_bg_readings_api.models.reading import Reading
+from gdm_bg_readings_api.query import upsert
+
+
+@pytest.mark.usefixtures("app")
+class TestUpsert:
+    @pytest.fixture
+    def patient(self, patient_uuid: str) -> Patient:
+        patient = Patient(uuid=patient_uuid)
+        db.session.add(patient)
+        db.session.commit()
+        return patient
+
+    def _reading(self, patient: Patient) -> Reading:
+        return Reading(
+            uuid=generate_uuid(),
+            patient_id=patient.uuid,
+            blood_glucose_value=5.5,
+            units="mmol/L",
+            measured_timestamp=datetime(2020, 1, 1, 12, 0, 0),
+            measured_timezone=0,
+            prandial_tag_id="PRANDIAL-TAG-NONE",
+            reading_banding_id="BG-READING-BANDING-NORMAL",
+        )
+
+    def test_insert_reading_new(self, patient: Patient) -> None:
+        reading = self._reading(patient)
+        reading_uuid, created = upsert.insert_reading(reading)
+        db.session.commit()
+        assert created is True
+        assert reading_uuid == reading.uuid
+        stored: Reading = Reading.query.get(reading_uuid)
+        assert stored.snoozed is False
+        assert stored.created is not None
+        assert stored.modified_by_ == "unknown"
+
+    def test_insert_reading_duplicate(
+        self, patient: Patient, statement_counter: Callable
+    ) -> None:
+        original_uuid, _ = upsert.insert_reading(self._reading(patient))
+        db.session.commit()
+
+        duplicate = self._reading(patient)
+        with statement_counter(limit=2):
+            reading_uuid, created = upsert.insert_reading(duplicate)
+        assert created is False
+        assert reading_uuid == original_uuid
+        assert Reading.query.count() == 1
+
+    def test_postgresql_statement(self, patient: Patient) -> None:
+        reading = self._reading(patient)
+        values = {
+            column.key: getattr(reading, column.key)
+            for column in Reading.__table__.columns
+        }
+        statement = upsert._postgresql_insert_reading(values)
+        sql = str(statement.compile(dialect=postgresql.dialect()))
+        assert "WITH inserted AS" in sql
+        assert (
+            "ON CONFLICT (blood_glucose_value, units, measured_timestamp, "
+            "measured_timezone, patient_id) DO NOTHING RETURNING reading.uuid" in sql
+        )
+        assert "UNION ALL" in sql
+
+    def test_ensure_patient_new(
+        self, patient_uuid: str, statement_counter: Callable
+    ) -> None:
+        with statement_counter(limit=1):
+            snooze_period = upsert.ensure_patient(patient_uuid)
+        db.session.commit()
+        assert snooze_period == upsert.PatientSnoozePeriod(None, None)
+        assert Patient.query.get(patient_uuid) is not None
+
+    def test_ensure_patient_existing(self, patient: Patient) -> None:
+        patient.set_suppress_reading_alerts_from("2020-01-01T00:00:00.000Z")
+        patient.set_suppress_reading_alerts_until("2020-01-03T00:00:00.000Z")
+        db.session.commit()
+
+        snooze_period = upsert.ensure_patient(patient.uuid)
+        assert snooze_period == upsert.PatientSnoozePeriod(
+            datetime(2020, 1, 1), datetime(2020, 1, 3)
+        )
+        assert Patient.query.count() == 1
+
+    def test_postgresql_ensure_patient_statement(self, patient_uuid: str) -> None:
+        statement = upsert._postgresql_ensure_patient({"uuid": patient_uuid})
+        sql = str(statement.compile(dialect=postgresql.dialect()))
+        assert (
+            "ON CONFLICT (uuid) DO NOTHING RETURNING "
+            "patient.suppress_reading_alerts_from, patient.suppress_reading_alerts_until"
+            in sql
+        )
+        assert "UNION ALL" in sql
+
+    def test_advance_latest_reading(self, patient: Patient) -> None:
+        upsert.advance_latest_reading(patient.uuid, "reading-b", datetime(2020, 1, 2))
+        # Earlier readings don't replace it, but later ones do.
+        upsert.advance_latest_reading(patient.uuid, "reading-c", datetime(2020, 1, 1))
+        db.session.commit()
+        assert patient.latest_reading_id == "reading-b"
+        upsert.advance_latest_reading(patient.uuid, "reading-a", datetime(2020, 1, 2))
+        db.session.commit()
+        assert patient.latest_reading_id == "reading-b"
+        upsert.advance_latest_reading(patient.uuid, "reading-d", datetime(2020, 1, 2))
+        db.session.commit()
+        assert patient.latest_reading_id == "reading-d"
+        assert patient.latest_measured_timestamp == datetime(2020, 1, 2)